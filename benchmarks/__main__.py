@@ -0,0 +1,40 @@
+"""
+Runs the micro benchmarks and optionally the load test, writing everything to one JSON file for benchmarks.compare.
+
+    python -m benchmarks --json current.json --load --mode ASYNCIO
+    python -m benchmarks.compare baseline.json current.json
+"""
+import argparse
+import json
+import platform
+
+from benchmarks import load, micro, serialization
+from web_framework_v2 import ServerMode
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the web_framework_v2 benchmarks")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--number", type=int, default=20000, help="calls per micro benchmark repetition")
+    parser.add_argument("--load", action="store_true", help="also run the load test")
+    parser.add_argument("--mode", action="append", choices=[mode.name for mode in ServerMode], help="server modes to load test")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    arguments = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "micro": micro.main(arguments.number),
+        "serialization": {
+            payload: {serializer: seconds * 1e6 for serializer, seconds in timings.items()}
+            for payload, timings in serialization.main().items()
+        },
+    }
+    if arguments.load:
+        results["load"] = {
+            mode: load.main(mode, connections=arguments.connections, duration=arguments.duration)["scenarios"]
+            for mode in arguments.mode or [ServerMode.THREADED.name]
+        }
+
+    if arguments.json is not None:
+        with open(arguments.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,52 @@
+"""
+Compares two JSON result files written by python -m benchmarks (or benchmarks.load --json).
+
+    python -m benchmarks.compare baseline.json current.json
+"""
+import json
+import sys
+
+# Metrics where a larger value is an improvement, every other number is a time where smaller is better
+HIGHER_IS_BETTER = ("rps", "requests")
+
+
+def flatten(results, prefix=""):
+    """
+    :return: {"group/name/metric": number} of every number in the nested results
+    """
+    values = {}
+    for name, value in results.items():
+        path = f"{prefix}/{name}" if prefix else name
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(baseline: dict, current: dict) -> dict:
+    """
+    :return: {path: (baseline, current, improvement in percent)} of the numbers found in both results
+    """
+    baseline_values, current_values = flatten(baseline), flatten(current)
+    changes = {}
+    for path, old in baseline_values.items():
+        new = current_values.get(path, None)
+        if new is None or old == 0 or new == old:  # Settings such as the amount of connections
+            continue
+        change = (new - old) / old * 100
+        changes[path] = (old, new, change if path.rsplit("/", 1)[-1] in HIGHER_IS_BETTER else -change)
+    return changes
+
+
+def main(baseline_path, current_path):
+    with open(baseline_path) as baseline_file, open(current_path) as current_file:
+        changes = compare(json.load(baseline_file), json.load(current_file))
+
+    for path, (old, new, improvement) in changes.items():
+        print(f"{path:<60} {old:12.3f} {new:12.3f} {improvement:+8.1f}%")
+    return changes
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,48 @@
+"""
+Measures the per call cost of dispatching a request to an endpoint through Method.execute.
+
+    python -m benchmarks.dispatch
+"""
+import timeit
+
+from web_framework_v2 import Decorator, HttpRequest, HttpResponse, PathVariable, QueryParameter, ContentType, HttpMethod, HttpStatus
+from web_framework_v2.method import Method
+
+
+class AllowAll(Decorator):
+    def should_execute_endpoint(self, request, request_body):
+        return True, "user", None
+
+
+def plain(request: HttpRequest, response: HttpResponse, flag=False):
+    return flag
+
+
+def annotated(width: QueryParameter("width", int), height: QueryParameter("height", int), name: PathVariable("name"), scale=2):
+    return width
+
+
+@AllowAll()
+def decorated(user: AllowAll, request: HttpRequest, limit=10):
+    return user
+
+
+def bench(function, number):
+    # A no-op serializer bypasses result encoding, only the dispatch is measured
+    method = Method(function, serializer=lambda result: result)
+    request = HttpRequest(HttpMethod.GET, "/area/HeKNon/", "HTTP/1.1", {}, {"width": ["5"], "height": ["3"]}, b"", {"name": "HeKNon"})
+    response = HttpResponse(ContentType.text, "HTTP/1.1", HttpStatus.OK, b"")
+    seconds = min(timeit.repeat(lambda: method.execute(request, response), number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+def main(number=20000):
+    results = {}
+    for function in (plain, annotated, decorated):
+        results[function.__name__] = bench(function, number)
+        print(f"{function.__name__:<10} {results[function.__name__]:8.2f} us/call")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Generates load against a Framework served on localhost and reports requests per second and latency percentiles.
+The server runs in its own process so the load generator's threads do not compete with it for the GIL.
+
+    python -m benchmarks.load --mode THREADED --connections 16 --duration 5 --json results.json
+
+Scenarios:
+    keep_alive   every connection sends one request at a time over a persistent connection
+    close        every request opens a new connection and sends "Connection: close"
+    pipelined    every connection writes --depth requests at once and then reads the responses
+    large_body   keep alive POSTs of --body-size bytes that the endpoint reads completely
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import platform
+import socket
+import tempfile
+import threading
+import time
+
+from web_framework_v2 import Framework, ServerMode, RequestBody
+
+SCENARIOS = ("keep_alive", "close", "pipelined", "large_body")
+
+
+def serve(mode: str, port: int, ready):
+    app = Framework(tempfile.mkdtemp(), "/index.html", port=port, server_mode=ServerMode[mode], log_level=logging.WARNING)
+
+    @app.get("/hello")
+    def hello():
+        return {"hello": "world"}
+
+    @app.post("/upload")
+    def upload(body: RequestBody(raw_format=True)):
+        return len(body)
+
+    threading.Thread(target=app.start, daemon=True).start()
+    _wait_until_listening(port)
+    ready.set()
+    while True:
+        time.sleep(3600)
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+def _wait_until_listening(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("localhost", port)).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class _Connection:
+    def __init__(self, port: int):
+        self.socket = socket.create_connection(("localhost", port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b""
+
+    def read_response(self):
+        """
+        Reads a single response with a Content-Length body.
+        :return: the status code
+        """
+        while b"\r\n\r\n" not in self.buffer:
+            self._receive()
+
+        head, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+        lines = head.split(b"\r\n")
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+
+        while len(self.buffer) < length:
+            self._receive()
+        self.buffer = self.buffer[length:]
+        return int(lines[0].split(b" ", 2)[1])
+
+    def _receive(self):
+        data = self.socket.recv(65536)
+        if len(data) == 0:
+            raise ConnectionError("The server closed the connection")
+        self.buffer += data
+
+    def close(self):
+        self.socket.close()
+
+
+def _request(method: str, path: str, body: bytes = b"", close: bool = False) -> bytes:
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+    if close:
+        head += "Connection: close\r\n"
+    if len(body) > 0:
+        head += f"Content-Length: {len(body)}\r\n"
+    return (head + "\r\n").encode() + body
+
+
+def _worker(scenario: str, port: int, deadline: float, depth: int, body_size: int, latencies: list, errors: list):
+    connection = None
+    try:
+        if scenario == "close":
+            request = _request("GET", "/hello", close=True)
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                connection = _Connection(port)
+                connection.socket.sendall(request)
+                connection.read_response()
+                connection.close()
+                latencies.append(time.perf_counter() - started)
+            return
+
+        connection = _Connection(port)
+        if scenario == "pipelined":
+            batch = _request("GET", "/hello") * depth
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                connection.socket.sendall(batch)
+                for _ in range(depth):
+                    connection.read_response()
+                    latencies.append(time.perf_counter() - started)
+            return
+
+        request = _request("POST", "/upload", b"x" * body_size) if scenario == "large_body" else _request("GET", "/hello")
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            connection.socket.sendall(request)
+            connection.read_response()
+            latencies.append(time.perf_counter() - started)
+    except OSError as e:
+        errors.append(repr(e))
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    :return: the nearest rank percentile of an ascending list
+    """
+    if len(sorted_values) == 0:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(scenario: str, port: int, connections: int, duration: float, depth: int = 16, body_size: int = 1024 * 1024) -> dict:
+    per_thread = [[] for _ in range(connections)]
+    errors = []
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=_worker, args=(scenario, port, deadline, depth, body_size, latencies, errors))
+        for latencies in per_thread
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for thread_latencies in per_thread for latency in thread_latencies)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if len(latencies) > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+    }
+
+
+def main(mode="THREADED", port=None, connections=16, duration=5.0, depth=16, body_size=1024 * 1024, scenarios=SCENARIOS):
+    port = port if port is not None else free_port()  # Avoids clashing with servers a previous or parallel run left listening
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(mode, port, ready), daemon=True)
+    server.start()
+    try:
+        if not ready.wait(30):
+            raise RuntimeError("The server did not start")
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario] = run_scenario(scenario, port, connections, duration, depth, body_size)
+            result = results[scenario]
+            print(
+                f"{mode:<12} {scenario:<11} {result['rps']:10.0f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+                f"p99 {result['p99_ms']:7.2f} ms  p999 {result['p999_ms']:7.2f} ms  errors {result['errors']}"
+            )
+        return {
+            "mode": mode,
+            "connections": connections,
+            "duration": duration,
+            "depth": depth,
+            "body_size": body_size,
+            "python": platform.python_version(),
+            "scenarios": results,
+        }
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test a local Framework instance")
+    parser.add_argument("--mode", default="THREADED", choices=[mode.name for mode in ServerMode])
+    parser.add_argument("--port", type=int, help="defaults to a free port")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each scenario runs for")
+    parser.add_argument("--depth", type=int, default=16, help="requests per pipelined batch")
+    parser.add_argument("--body-size", type=int, default=1024 * 1024, help="bytes per large_body request")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--json", help="write the results to this file")
+    arguments = parser.parse_args()
+
+    report = main(
+        arguments.mode, arguments.port, arguments.connections, arguments.duration, arguments.depth, arguments.body_size,
+        arguments.scenario or SCENARIOS
+    )
+    if arguments.json is not None:
+        with open(arguments.json, "w") as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,114 @@
+"""
+Measures the per call cost of the pieces every request goes through: parsing, the endpoint lookup,
+dispatching to the endpoint, encoding its result and serializing the response.
+
+    python -m benchmarks.micro
+"""
+import timeit
+
+from benchmarks import dispatch
+from web_framework_v2 import HttpRequest, HttpResponse, ContentType, HttpMethod, HttpStatus
+from web_framework_v2.method import Method
+from web_framework_v2.parser import RequestParser, HttptoolsRequestParser, httptools
+from web_framework_v2.route import Endpoint, EndpointMap
+
+REQUESTS = {
+    "minimal": b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n",
+    "browser": (
+        b"GET /players/HeKNon/stats?season=2021&page=2&sort=goals HTTP/1.1\r\n"
+        b"Host: localhost:8080\r\n"
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+        b"Accept-Language: en-US,en;q=0.5\r\n"
+        b"Accept-Encoding: gzip, deflate, br\r\n"
+        b"Connection: keep-alive\r\n"
+        b"Cookie: session=" + b"x" * 128 + b"\r\n\r\n"
+    ),
+    "json_post": (
+        b"POST /players HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: 42\r\n\r\n"
+        b'{"name": "HeKNon", "score": 1234, "x": [1]}'
+    ),
+}
+
+RESULTS = {
+    "none": None,
+    "small_dict": {"token": "x" * 64, "expires": 1800, "admin": False},
+    "list_of_dicts": [{"id": i, "name": f"player{i}", "score": i * 1.5} for i in range(100)],
+}
+
+
+def _per_call(function, number) -> float:
+    """
+    :return: microseconds per call, the best of 5 repetitions
+    """
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def bench_parse(number):
+    parsers = {"python": RequestParser}
+    if httptools is not None:
+        parsers["httptools"] = HttptoolsRequestParser
+
+    results = {}
+    for parser_name, parser in parsers.items():
+        for request_name, data in REQUESTS.items():
+            results[f"{parser_name}/{request_name}"] = _per_call(lambda: parser(data).parse(), number)
+    return results
+
+
+def bench_get_endpoint(number, route_counts=(10, 100, 1000)):
+    results = {}
+    for route_count in route_counts:
+        endpoint_map = EndpointMap()
+        for i in range(route_count):
+            endpoint_map.add_route(Endpoint(f"/static{i}/list", HttpMethod.GET, ContentType.json, lambda: None))
+            endpoint_map.add_route(Endpoint(f"/dynamic{i}/{{name}}", HttpMethod.GET, ContentType.json, lambda: None))
+
+        last = route_count - 1
+        lookups = {
+            "static": HttpRequest(HttpMethod.GET, f"/static{last}/list/", "HTTP/1.1", {}, {}, b""),
+            "dynamic": HttpRequest(HttpMethod.GET, f"/dynamic{last}/HeKNon/", "HTTP/1.1", {}, {}, b""),
+            "missing": HttpRequest(HttpMethod.GET, "/missing/route/", "HTTP/1.1", {}, {}, b""),
+        }
+        for lookup_name, request in lookups.items():
+            results[f"{route_count * 2}_routes/{lookup_name}"] = _per_call(lambda: endpoint_map.get_endpoint(request), number)
+    return results
+
+
+def bench_encode_result(number):
+    results = {}
+    for result_name, result in RESULTS.items():
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        results[result_name] = _per_call(lambda: Method.encode_result(result, response), number)
+    return results
+
+
+def bench_response_data(number):
+    bodies = {"empty": b"", "1kb": b"x" * 1024, "64kb": b"x" * 1024 * 64}
+    results = {}
+    for body_name, body in bodies.items():
+        def serialize():
+            response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, body)
+            response.headers["Cache-Control"] = "no-cache"
+            return response.data()
+
+        results[body_name] = _per_call(serialize, number)
+    return results
+
+
+def main(number=20000):
+    results = {
+        "parse": bench_parse(number),
+        "get_endpoint": bench_get_endpoint(number),
+        "execute": {function.__name__: dispatch.bench(function, number) for function in (dispatch.plain, dispatch.annotated, dispatch.decorated)},
+        "encode_result": bench_encode_result(number // 10),
+        "response_data": bench_response_data(number),
+    }
+    for group, timings in results.items():
+        for name, microseconds in timings.items():
+            print(f"{group:<14} {name:<26} {microseconds:8.2f} us/call")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Compares the encode throughput of the result serializers on payloads typical for endpoints.
+
+    python -m benchmarks.serialization
+"""
+import json
+import timeit
+
+from web_framework_v2.serializers import JsonPickleSerializer, JsonSerializer
+
+
+class Player:
+    def __init__(self, name, score):
+        self.name = name
+        self.score = score
+
+
+PAYLOADS = {
+    "scalar": 1234.5,
+    "small_dict": {"token": "x" * 64, "expires": 1800, "admin": False},
+    "list_of_dicts": [{"id": i, "name": f"player{i}", "score": i * 1.5, "tags": ["a", "b"]} for i in range(1000)],
+    "nested": {"teams": {f"team{t}": {"players": [{"id": p, "stats": {"goals": p, "assists": p * 2}} for p in range(20)]} for t in range(20)}},
+    "objects": [Player(f"player{i}", i) for i in range(100)],
+}
+
+
+def main(number=200):
+    serializers = {
+        "jsonpickle": JsonPickleSerializer(),
+        "json": JsonSerializer(json.dumps),
+        "default": JsonSerializer(),
+    }
+
+    results = {}
+    for payload_name, payload in PAYLOADS.items():
+        results[payload_name] = {}
+        for serializer_name, serializer in serializers.items():
+            seconds = min(timeit.repeat(lambda: serializer(payload), number=number, repeat=3)) / number
+            results[payload_name][serializer_name] = seconds
+            print(f"{payload_name:<14} {serializer_name:<11} {seconds * 1e6:10.1f} us  {1 / seconds:12.0f} encodes/s")
+    return results
+
+
+if __name__ == '__main__':
+    main()
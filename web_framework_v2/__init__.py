@@ -1,14 +1,35 @@
 __all__ = ["ContentType", "HttpStatus", "HttpMethod", "HttpRequest", "HttpResponse",
            "Annotation", "QueryParameter", "RequestBody", "PathVariable", "Decorator", "JwtSecurity",
            "JwtTokenFactory", "JwtTokenAuth", "HttpClient", "HttpServer", "Framework", "ErrorHandler", "Endpoint", "EndpointMap", "KeyPair",
-           "RestartableTimer",]
+           "RestartableTimer", "AsyncHttpServer", "ServerMode",
+           "WorkerPoolHttpServer", "PreforkSupervisor",
+           "TimerWheel", "SerializerRegistry", "JsonSerializer", "JsonPickleSerializer", "StaticFileEngine",
+           "RequestBodyReader", "LazyBody", "Compression", "ResponseCache", "CachePolicy", "TokenCache", "RequestTiming", "TimingHooks",
+           "MetricsRegistry", "Counter", "Gauge", "Histogram", "SlowRequestProfiler", "ProfileReport",
+           "AccessLog", "AccessLogFormatter", "Middleware",]
 
 from .http import *
 from .decorator import Decorator
+from .body_reader import RequestBodyReader
+from .lazy_body import LazyBody
 from .annotations import Annotation, QueryParameter, RequestBody, PathVariable
 from .restartable_timer import RestartableTimer
+from .timer_wheel import TimerWheel
+from .timing import RequestTiming, TimingHooks
+from .metrics import MetricsRegistry, Counter, Gauge, Histogram
+from .profiler import SlowRequestProfiler, ProfileReport
+from .access_log import AccessLog, AccessLogFormatter
+from .middleware import Middleware
 from .security import *
+from .serializers import SerializerRegistry, JsonSerializer, JsonPickleSerializer
+from .compression import Compression
+from .response_cache import ResponseCache, CachePolicy
+from .static_files import StaticFileEngine
 from .http_client import HttpClient
 from .http_server import HttpServer
+from .async_http_server import AsyncHttpServer
+from .server_mode import ServerMode
+from .worker_pool_http_server import WorkerPoolHttpServer
+from .prefork_supervisor import PreforkSupervisor
 from .route import *
 from .framework import Framework
@@ -0,0 +1,93 @@
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class AccessLogFormatter(logging.Formatter):
+    """
+    Writes every access log record as a single line of JSON holding its fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "access", None)
+        if fields is None:
+            return super().format(record)
+        return json.dumps(fields, separators=(",", ":"))
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, records: queue.Queue, access_log: "AccessLog"):
+        super().__init__(records)
+        self._access_log = access_log
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # Formatting is left to the handlers on the listener thread
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._access_log.dropped += 1
+
+
+class AccessLog:
+    def __init__(self, handlers=None, queue_size: int = 10000, logger_name: str = "web_framework_v2.access"):
+        """
+        A structured access log, registered as a timing hook so every response is logged once it was sent.
+        Request threads only put the record on a bounded queue, a listener thread formats and writes it.
+        Records are dropped (and counted in dropped) instead of blocking when the queue is full.
+        :param handlers: the logging handlers records are written with, defaults to a StreamHandler writing to stderr.
+                         Handlers without a formatter get an AccessLogFormatter
+        :param queue_size: the maximum amount of records waiting to be written
+        """
+        self.handlers = list(handlers) if handlers is not None else [logging.StreamHandler()]
+        for handler in self.handlers:
+            if handler.formatter is None:
+                handler.setFormatter(AccessLogFormatter())
+        self.logger = logging.getLogger(logger_name)
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._handler = _NonBlockingQueueHandler(self._queue, self)
+        self._listener = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+
+        self.logger.setLevel(logging.INFO)  # Independent of the level of the framework's debug logs
+        self.logger.propagate = False
+        self.logger.addHandler(self._handler)
+        self._listener = QueueListener(self._queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self):
+        """
+        Writes the queued records and stops the listener thread.
+        """
+        if self._listener is None:
+            return
+
+        self.logger.removeHandler(self._handler)
+        self._listener.stop()
+        self._listener = None
+
+    def __call__(self, request, response, timing):
+        if self._listener is None or not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        method = request.method.name if request.method is not None else "UNKNOWN"
+        status = int(response.status)
+        address = request.client_address
+        self.logger.info("%s %s %s", method, request.url, status, extra={"access": {
+            "time": time.time(),
+            "remote": address[0] if address is not None else None,
+            "method": method,
+            "url": request.url,
+            "version": request.http_version,
+            "status": status,
+            "bytes": response.content_length() if response.stream is None else None,
+            "duration_ms": round(timing.total() * 1000, 3),
+            "user_agent": request.headers.get("user-agent", None)
+        }})
@@ -1,10 +1,11 @@
-import inspect
-import json
+import typing
 from abc import ABC
 
-import jsonpickle
-
 import web_framework_v2.http.http_request as http_request
+from web_framework_v2.body_reader import RequestBodyReader
+from web_framework_v2.decoding import compile_decoder
+from web_framework_v2.http.http_error import HttpError
+from web_framework_v2.http.http_status import HttpStatus
 
 
 class Annotation(ABC):
@@ -14,47 +15,34 @@ class Annotation(ABC):
         method(self, parameter: annotation).
         this class is meant to be a base class for all custom annotations in the web_framework_v2.
 
-        :param parameter_type: the type of the parameter. the data the annotation supplies will try to be converted to this type.
+        :param parameter_type: the type of the parameter. the data the annotation supplies is converted to this type
+        by a decoder compiled once per type, data that does not fit the type is answered with 400 Bad Request.
+        :param use_json_object_hook: kept for compatibility, a json_object_hook of the type is always used when it exists.
         """
 
         self._parameter_type = parameter_type
         self._use_json_object_hook = use_json_object_hook
+        self._decoder = compile_decoder(parameter_type)
 
     def value_generator(self, request: http_request.HttpRequest):
         raise NotImplementedError("Implement value_generator in non abstract class.")
 
+    def describe(self):
+        return type(self).__name__
+
     def adapt(self, data, parameter_type):
+        decoder = self._decoder if parameter_type is self._parameter_type else compile_decoder(parameter_type)
         try:
-            if not self._use_json_object_hook:
-                mapped_data = jsonpickle.decode(data)
-                if type(mapped_data) is dict:
-                    module = self._parameter_type.__module__
-                    mapped_data[
-                        "py/object"] = module + '.' + self._parameter_type.__qualname__ if module != "builtins" else self._parameter_type.__qualname__
-
-                return jsonpickle.decode(json.dumps(mapped_data), classes=parameter_type)
-            else:
-                return json.loads(data, object_hook=lambda json_map: Annotation.json_object_hook(json_map, parameter_type))
-        except Exception:
-            return data
-
-    @staticmethod
-    def json_object_hook(json_map, parameter_type):
-        if hasattr(parameter_type, "json_object_hook"):
-            return parameter_type.json_object_hook(json_map)
-        elif parameter_type is map:
-            return json_map
-
-        argspec = inspect.getfullargspec(parameter_type.__init__)
-        argspec.args.pop(0)
-        new_c = parameter_type(**{arg_name: json_map.get(arg_name, None) for arg_name in argspec.args})
-        new_c.__dict__ = json_map
-        return new_c
+            return decoder(data)
+        except (TypeError, ValueError) as e:
+            raise HttpError(HttpStatus.BAD_REQUEST, f"{self.describe()} is not a valid {getattr(parameter_type, '__name__', parameter_type)}: {e}")
 
 
 class QueryParameter(Annotation):
     def __init__(self, query_name: str, parameter_type=str, use_json_object_hook=False):
         self.query_name = query_name
+        self._is_sequence = parameter_type in (list, tuple, set) or typing.get_origin(parameter_type) in (list, tuple, set)
+        self._is_text = parameter_type is str or parameter_type == typing.Optional[str]
         super().__init__(parameter_type, use_json_object_hook)
 
     def value_generator(self, request: http_request.HttpRequest):
@@ -63,9 +51,12 @@ class QueryParameter(Annotation):
         if value is None:
             return None
 
+        if self._is_text:
+            return ",".join(value)  # The parser splits values on commas, a string keeps them
+
         value = value if len(value) > 1 else value[0]
 
-        if self._parameter_type == list and not isinstance(value, list):
+        if self._is_sequence and not isinstance(value, list):
             value = [value]
 
         return self.adapt(
@@ -73,18 +64,40 @@ class QueryParameter(Annotation):
             self._parameter_type
         )
 
+    def describe(self):
+        return f"Query parameter '{self.query_name}'"
+
 
 class RequestBody(Annotation):
-    def __init__(self, parameter_type=map, raw_format=False, use_json_object_hook=False):
+    def __init__(self, parameter_type=map, raw_format=False, use_json_object_hook=False, stream=False, spool=False):
+        """
+        :param raw_format: supply the body as bytes
+        :param stream: supply a RequestBodyReader reading the body from the connection on demand, the body is not buffered
+        :param spool: supply the body as a file, kept in memory up to the framework's body_spool_size and spilled to disk above it
+        """
         super().__init__(parameter_type, use_json_object_hook)
         self.raw_format = raw_format
+        self.stream = stream
+        self.spool = spool
+
+    def streams(self):
+        return self.stream or self.spool
 
     def value_generator(self, request):
+        if self.streams():
+            body_stream = request.body_stream if request.body_stream is not None else RequestBodyReader.from_bytes(request.body)
+            return body_stream.spool() if self.spool else body_stream
+
         if self.raw_format:
             return request.body
 
-        value = self.adapt(request.body, self._parameter_type) if request.body is not None else None
-        return value if type(value) is not bytes else value.decode()
+        if request.body is None or len(request.body) == 0:
+            return None
+
+        return self.adapt(request.body, self._parameter_type)
+
+    def describe(self):
+        return "Request body"
 
 
 class PathVariable(Annotation):
@@ -96,3 +109,6 @@ class PathVariable(Annotation):
         value = request.path_variables.get(self.variable_name, None)
 
         return self.adapt(value, self._parameter_type) if value is not None else None
+
+    def describe(self):
+        return f"Path variable '{self.variable_name}'"
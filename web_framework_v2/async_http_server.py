@@ -0,0 +1,234 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from web_framework_v2.body_reader import RequestBodyReader
+from web_framework_v2.http import HttpResponse, HttpError
+from web_framework_v2.http_client import HttpClient
+from web_framework_v2.http_server import HttpServer
+from web_framework_v2.request_reader import RequestReader
+from web_framework_v2.timing import RequestTiming
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHttpServer(HttpServer):
+    def __init__(self, framework, host, port, backlog: int = 128, executor_workers: int = 32):
+        """
+        Serves every connection on a single asyncio event loop.
+        Coroutine endpoints are awaited on the loop, regular endpoints and static files are offloaded to a bounded executor.
+        :param executor_workers: the maximum amount of threads used to execute non coroutine endpoints
+        """
+        super().__init__(framework, host, port, backlog)
+        self._executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="web_framework_v2-executor")
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)  # Also runs the synchronous decorators of coroutine endpoints
+        self._server = None
+        self.max_header_size = 1024 * 64
+        self.byte_fetch_amount = 1024 * 8
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        # Started by the loop itself, so a stop requested by shutdown before the loop runs is handled on its first iteration
+        self._loop.create_task(self._start_serving())
+
+        try:
+            self._loop.run_forever()
+        finally:
+            if self._server is not None:
+                self._server.close()
+            else:
+                super().shutdown()  # Stopped before serving, the socket was never handed to the asyncio server
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+            self._executor.shutdown(wait=False)
+            logger.info("The event loop has stopped.")
+
+    async def _start_serving(self):
+        try:
+            self._server = await asyncio.start_server(self._handle_client, sock=self._socket, backlog=self._backlog)
+        except Exception as e:
+            logger.exception(e)
+            self._loop.stop()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        address = writer.get_extra_info("peername")
+        logger.debug("Accepted client connection from %s", address)
+        HttpServer.disable_nagle(writer.get_extra_info("socket"))
+        request_reader = RequestReader(
+            self._framework.request_parser(),
+            max_header_size=self.max_header_size,
+            max_body_size=self._framework.max_body_size,
+            stream_body=self.streams_body
+        )
+        keep_alive_timeout = None
+        timing_hooks = self._framework.timing_hooks()
+        timing = None
+        metrics = self._framework.server_metrics()
+        in_session = False
+        if metrics is not None:
+            metrics.active_connections.inc()
+
+        try:
+            while self._framework.is_active():
+                if timing is None and timing_hooks.enabled():  # Before the first read, or the parsing of a pipelined request
+                    timing = RequestTiming()
+                started = perf_counter() if timing is not None else 0
+                try:
+                    request = request_reader.next_request()
+                except HttpError as e:
+                    logger.debug("Rejecting request from %s: %s", address, e)
+                    writer.write(HttpClient.error_response(e.status))
+                    await writer.drain()
+                    break
+
+                if timing is not None:
+                    timing.since("parse", started)
+
+                if request is None:
+                    if request_reader.is_reading_body():
+                        timeout = self._framework.body_timeout
+                    elif request_reader.has_buffered_data() or keep_alive_timeout is None:
+                        timeout = self._framework.header_timeout
+                    else:
+                        timeout = keep_alive_timeout
+
+                    started = perf_counter() if timing is not None else 0
+                    try:
+                        data = await asyncio.wait_for(reader.read(self.byte_fetch_amount), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if len(data) == 0:  # received FIN
+                        break
+
+                    request_reader.feed(data)
+                    if metrics is not None:
+                        metrics.received_bytes.inc(amount=len(data))
+                    if timing is not None:
+                        timing.since("read", started)
+                    continue
+
+                logger.debug("Finished building request object %s", request)
+                if request_reader.is_streaming():
+                    request.body_stream = self._create_body_reader(reader, request_reader)
+                request.timing = timing
+                request.client_address = address
+                response = await self.response_builder_async(request)
+                logger.debug("Finished building response object %s", response)
+                if timing is not None:
+                    timing_hooks.before_send(response, timing)
+                    started = perf_counter()
+                await response.send_async(writer, self._executor)
+                if timing is not None:
+                    timing.since("send", started)
+                    timing_hooks.report(request, response, timing)
+                    timing = None
+                if request_reader.is_streaming():  # The endpoint did not read the whole body
+                    break
+
+                keep_alive_timeout = HttpClient.requested_keep_alive_timeout(request, self._framework.keep_alive_timeout)
+                if keep_alive_timeout is None or response.requires_close():
+                    break
+                if not in_session:
+                    in_session = True
+                    if metrics is not None:
+                        metrics.keep_alive_sessions.inc()
+        except ConnectionError:
+            logger.debug("Client %s disconnected", address)
+        except ValueError as e:
+            logger.debug("Received a malformed request from %s: %s", address, e)
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            if metrics is not None:
+                metrics.active_connections.dec()
+                if in_session:
+                    metrics.keep_alive_sessions.dec()
+            writer.close()
+
+    def _create_body_reader(self, reader: asyncio.StreamReader, request_reader: RequestReader) -> RequestBodyReader:
+        async def pull_async(size):
+            while True:
+                data = request_reader.read_body(size)
+                if data is not None:
+                    return data
+
+                try:
+                    received = await asyncio.wait_for(reader.read(self.byte_fetch_amount), self._framework.body_timeout)
+                except asyncio.TimeoutError:
+                    raise ConnectionError("Timed out while reading the request body")
+                if len(received) == 0:
+                    raise ConnectionError("The client closed the connection before sending the whole body")
+                request_reader.feed(received)
+
+        def pull(size):
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+            if running_loop is self._loop:
+                raise RuntimeError("Coroutine endpoints have to read the body with aread, aread_chunk, aspool or async for")
+
+            return asyncio.run_coroutine_threadsafe(pull_async(size), self._loop).result()
+
+        return RequestBodyReader(pull, pull_async, self._framework.body_spool_size)
+
+    async def response_builder_async(self, request):
+        logger.debug("Attempting to find a endpoint using %s", request.url)
+        metrics = self._framework.server_metrics()
+        started = perf_counter() if request.timing is not None or metrics is not None else 0
+        route, path_variables = self.find_endpoint(request)
+        if request.timing is not None:
+            request.timing.since("route", started)
+
+        response = await self._build_response_async(request, route, path_variables)
+        if metrics is not None:
+            metrics.record(request, route, response, perf_counter() - started)
+        return response
+
+    async def _build_response_async(self, request, route, path_variables):
+        if request.body_stream is not None and route is not None and route.spools_body():
+            await request.body_stream.aspool()  # Spooling from the executor would block a thread per upload
+
+        if route is not None and route.cache_policy() is not None:
+            # Hits are answered on the loop, misses of regular endpoints are still executed on the executor
+            return await self._framework.response_cache().fetch_async(
+                request, self.cache_key(request, route), route.cache_policy().ttl,
+                lambda build_request: self._build_route_response_async(build_request, route, path_variables)
+            )
+
+        if route is not None:
+            return await self._build_route_response_async(request, route, path_variables)
+        return await self._loop.run_in_executor(self._executor, self.build_response, request, route, path_variables)
+
+    async def _build_route_response_async(self, request, route, path_variables):
+        if route.is_coroutine():
+            logger.debug("Found coroutine route %s", route)
+            profiler = self._framework.profiler()
+            session = profiler.begin(request, route) if profiler is not None else None
+            response = None
+            try:
+                response = await HttpResponse.build_from_route_async(request, route, path_variables, self._framework.error_handler)
+            finally:
+                if session is not None:  # Also when the connection's task is cancelled while the endpoint runs
+                    profiler.end(session, response)
+            return self.compress(request, response)
+
+        return await self._loop.run_in_executor(self._executor, self.build_route_response, request, route, path_variables)
+
+    def shutdown(self):
+        if self._socket is None:
+            if not self._loop.is_closed():  # Never started, release the loop's selector
+                self._loop.close()
+                self._executor.shutdown(wait=False)
+            return
+
+        try:
+            # Also queued when the loop is not running yet, run_forever then stops after its first iteration
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        except RuntimeError:
+            pass  # The loop already stopped and closed
@@ -0,0 +1,126 @@
+import tempfile
+
+
+class RequestBodyReader:
+    def __init__(self, pull, pull_async=None, spool_size: int = 1024 * 1024, chunk_size: int = 1024 * 64):
+        """
+        Reads a request body on demand instead of buffering it, handed to endpoints using RequestBody(stream=True).
+        Data is pulled from the connection only when the endpoint asks for it.
+        Regular endpoints use read, iteration and spool, coroutine endpoints use aread, async iteration and aspool.
+        :param pull: callable(size) returning up to size bytes of the body, b"" once the body was read
+        :param pull_async: coroutine function doing the same as pull without blocking the event loop.
+                           When None pull is called directly, which suits the private loops coroutine endpoints run on
+                           in the threaded server modes
+        :param spool_size: bodies larger than this are spilled to a temporary file by spool
+        :param chunk_size: the size of the chunks returned when iterating
+        """
+        self._pull = pull
+        self._pull_async = pull_async if pull_async is not None else self._blocking_pull_async
+        self.spool_size = spool_size
+        self.chunk_size = chunk_size
+        self._finished = False
+        self._spooled = None
+        self.bytes_read = 0
+
+    @staticmethod
+    def from_bytes(data: bytes, spool_size: int = 1024 * 1024):
+        """
+        :return: a reader over a body that was already received
+        """
+        view = memoryview(data if data is not None else b"")
+        position = 0
+
+        def pull(size):
+            nonlocal position
+            chunk = bytes(view[position:position + size])
+            position += len(chunk)
+            return chunk
+
+        return RequestBodyReader(pull, spool_size=spool_size)
+
+    def is_finished(self):
+        return self._finished
+
+    def read_chunk(self, size: int = None) -> bytes:
+        """
+        :return: the next part of the body, at most size bytes, b"" at the end of the body
+        """
+        if self._finished:
+            return b""
+
+        chunk = self._pull(size if size is not None else self.chunk_size)
+        return self._account(chunk)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads like a file, size bytes or the rest of the body when size is negative.
+        """
+        data = bytearray()
+        while (size < 0 or len(data) < size) and not self._finished:
+            data += self.read_chunk(self.chunk_size if size < 0 else size - len(data))
+        return bytes(data)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read_chunk()
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    async def aread_chunk(self, size: int = None) -> bytes:
+        if self._finished:
+            return b""
+
+        chunk = await self._pull_async(size if size is not None else self.chunk_size)
+        return self._account(chunk)
+
+    async def aread(self, size: int = -1) -> bytes:
+        data = bytearray()
+        while (size < 0 or len(data) < size) and not self._finished:
+            data += await self.aread_chunk(self.chunk_size if size < 0 else size - len(data))
+        return bytes(data)
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self.aread_chunk()
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    def spool(self):
+        """
+        Reads the rest of the body into a file kept in memory up to spool_size bytes and spilled to disk above it.
+        :return: the file, positioned at its start
+        """
+        if self._spooled is None:
+            spooled = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            for chunk in self:
+                spooled.write(chunk)
+            spooled.seek(0)
+            self._spooled = spooled
+        return self._spooled
+
+    async def aspool(self):
+        if self._spooled is None:
+            spooled = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            async for chunk in self:
+                spooled.write(chunk)
+            spooled.seek(0)
+            self._spooled = spooled
+        return self._spooled
+
+    def discard(self):
+        """
+        Reads and drops the rest of the body.
+        """
+        while len(self.read_chunk()) > 0:
+            pass
+
+    async def _blocking_pull_async(self, size: int) -> bytes:
+        return self._pull(size)
+
+    def _account(self, chunk: bytes) -> bytes:
+        if len(chunk) == 0:
+            self._finished = True
+        self.bytes_read += len(chunk)
+        return chunk
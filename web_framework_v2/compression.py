@@ -0,0 +1,203 @@
+import zlib
+from collections.abc import AsyncIterator
+from typing import Optional
+
+from web_framework_v2.http import ContentType, HttpStatus
+from web_framework_v2.http.body_stream import encode_chunk
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses with these statuses are never compressed, they have no body or describe a part of the identity body
+_UNCOMPRESSED_STATUSES = frozenset((HttpStatus.NO_CONTENT, HttpStatus.PARTIAL_CONTENT, HttpStatus.NOT_MODIFIED))
+
+
+class _ZlibStream:
+    def __init__(self, level: int, wbits: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flushes let every chunk reach the client as soon as it is produced
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class Compression:
+    DEFAULT_CONTENT_TYPES = frozenset((ContentType.html, ContentType.js, ContentType.css, ContentType.json, ContentType.xml, ContentType.svg))
+
+    def __init__(
+            self,
+            min_size: int = 1024,
+            content_types=None,
+            encodings=None,
+            level: int = 6,
+            brotli_quality: int = 4,
+            static_level: int = 9,
+            static_brotli_quality: int = 11
+    ):
+        """
+        Negotiates Accept-Encoding and compresses response bodies.
+        :param min_size: bodies smaller than this are sent uncompressed, streamed bodies are always compressed
+        :param content_types: the ContentTypes that are compressed
+        :param encodings: the supported encodings in order of preference, br is only used when brotli is installed
+        :param level: the zlib level of gzip and deflate responses
+        :param brotli_quality: the quality of br responses
+        :param static_level: the zlib level of cached static file variants, they are compressed once
+        :param static_brotli_quality: the quality of cached static file variants
+        """
+        self.min_size = min_size
+        self.content_types = frozenset(content_types) if content_types is not None else Compression.DEFAULT_CONTENT_TYPES
+        self.encodings = tuple(
+            encoding for encoding in (encodings if encodings is not None else ("br", "gzip", "deflate"))
+            if encoding != "br" or brotli is not None
+        )
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.static_level = static_level
+        self.static_brotli_quality = static_brotli_quality
+        self._negotiated = {}  # Accept-Encoding: acceptable encodings, headers repeat a lot between clients
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """
+        :return: the encoding to respond with or None for identity
+        """
+        acceptable = self.acceptable(accept_encoding)
+        return acceptable[0] if len(acceptable) > 0 else None
+
+    def acceptable(self, accept_encoding: Optional[str]) -> tuple:
+        """
+        :return: the supported encodings accept_encoding allows, the preferred one first
+        """
+        if accept_encoding is None:
+            return ()
+
+        try:
+            return self._negotiated[accept_encoding]
+        except KeyError:
+            pass
+
+        qualities = {}
+        for coding in accept_encoding.split(","):
+            name, _, parameters = coding.partition(";")
+            quality = 1.0
+            parameter, _, value = parameters.partition("=")
+            if parameter.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+            qualities[name.strip().lower()] = quality
+
+        wildcard = qualities.get("*", 0.0)
+        candidates = sorted(
+            ((qualities.get(encoding, wildcard), -index, encoding) for index, encoding in enumerate(self.encodings)),
+            reverse=True
+        )
+        acceptable = tuple(encoding for quality, _, encoding in candidates if quality > 0)
+
+        if len(self._negotiated) > 256:
+            self._negotiated.clear()
+        self._negotiated[accept_encoding] = acceptable
+        return acceptable
+
+    def compresses(self, content_type) -> bool:
+        return content_type in self.content_types
+
+    def compress(self, data: bytes, encoding: str, static: bool = False) -> bytes:
+        if encoding == "br":
+            return brotli.compress(data, quality=self.static_brotli_quality if static else self.brotli_quality)
+
+        compressor = zlib.compressobj(self.static_level if static else self.level, zlib.DEFLATED, 31 if encoding == "gzip" else 15)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream_compressor(self, encoding: str):
+        """
+        :return: an object with compress(data) and finish() used to compress a streamed body
+        """
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _ZlibStream(self.level, 31 if encoding == "gzip" else 15)
+
+    def apply(self, request, response):
+        """
+        Compresses the body of response with the encoding the request accepts.
+        Responses that already have a Content-Encoding and file bodies sent with sendfile are left untouched.
+        """
+        if not self.compresses(response.content_type) or response.status in _UNCOMPRESSED_STATUSES:
+            return response
+        if response.file is not None or "Content-Encoding" in response.headers:
+            return response
+        if response.stream is None and len(response.html) < self.min_size:
+            return response
+
+        Compression.add_vary(response)
+        encoding = self.negotiate(request.headers.get("accept-encoding", None))
+        if encoding is None:
+            return response
+
+        if response.stream is not None:
+            compressor = self.stream_compressor(encoding)
+            if isinstance(response.stream, AsyncIterator):
+                response.stream = _compress_async_stream(response.stream, compressor)
+            else:
+                response.stream = _compress_stream(response.stream, compressor)
+        else:
+            response.html = self.compress(response.html, encoding)
+
+        Compression.mark_encoded(response, encoding)
+        return response
+
+    @staticmethod
+    def add_vary(response):
+        vary = response.headers.get("Vary", None)
+        if vary is None:
+            response.headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            response.headers["Vary"] = vary + ", Accept-Encoding"
+
+    @staticmethod
+    def mark_encoded(response, encoding: str):
+        response.headers["Content-Encoding"] = encoding
+        etag = response.headers.get("ETag", None)
+        if etag is not None and etag.endswith('"'):
+            # Every encoding is a different representation and needs its own validator
+            response.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+
+
+def _compress_stream(stream, compressor):
+    try:
+        for chunk in stream:
+            data = compressor.compress(encode_chunk(chunk))
+            if len(data) > 0:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+
+
+async def _compress_async_stream(stream, compressor):
+    try:
+        async for chunk in stream:
+            data = compressor.compress(encode_chunk(chunk))
+            if len(data) > 0:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
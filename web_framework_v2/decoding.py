@@ -0,0 +1,338 @@
+import dataclasses
+import inspect
+import json
+import typing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+_decoders = {}  # parameter type: compiled decoder
+
+_TRUE_STRINGS = frozenset(("true", "1", "yes", "on"))
+_FALSE_STRINGS = frozenset(("false", "0", "no", "off"))
+
+_NO_DEFAULT = object()
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def compile_decoder(parameter_type):
+    """
+    Compiles the plan converting request data into parameter_type once and caches it per type.
+    The returned decoder accepts raw data (bytes or str, parsed as json when the type needs structure)
+    or already parsed values and raises DecodeError when the data does not fit the type.
+    """
+    try:
+        return _decoders[parameter_type]
+    except (KeyError, TypeError):
+        pass
+
+    decoder = _compile_raw(parameter_type)
+    try:
+        _decoders[parameter_type] = decoder
+    except TypeError:  # Unhashable annotation
+        pass
+    return decoder
+
+
+def _compile_raw(parameter_type):
+    if parameter_type is bytes:
+        return _decode_bytes
+
+    if parameter_type in (str, int, float, bool):
+        return _compile(parameter_type)
+
+    value_decoder = _compile(parameter_type)
+    is_class = _is_class(parameter_type)
+
+    def decode_raw(data):
+        if isinstance(data, (bytes, bytearray, str)):
+            if is_class and not _is_json_object_or_string(data):
+                return value_decoder(data)  # Built from the text itself, e.g. a uuid.UUID, Decimal or datetime.date
+            try:
+                data = _json_loads(data)
+            except ValueError as e:
+                raise DecodeError(f"Malformed json: {e}")
+        return value_decoder(data)
+
+    return decode_raw
+
+
+def _compile(parameter_type):
+    """
+    Compiles the conversion of a parsed value into parameter_type.
+    """
+    if parameter_type in (map, dict, object, typing.Any, inspect.Parameter.empty) or parameter_type is None:
+        return _identity
+    elif parameter_type is str:
+        return _decode_str
+    elif parameter_type is bool:
+        return _decode_bool
+    elif parameter_type in (int, float):
+        return _compile_number(parameter_type)
+    elif parameter_type is bytes:
+        return _decode_bytes
+
+    origin = typing.get_origin(parameter_type)
+    if origin is typing.Union:
+        return _compile_union(typing.get_args(parameter_type))
+    elif origin in (list, tuple, set, frozenset):
+        arguments = typing.get_args(parameter_type)
+        return _compile_sequence(origin, _compile(arguments[0]) if len(arguments) > 0 else _identity)
+    elif origin is dict:
+        arguments = typing.get_args(parameter_type)
+        return _compile_mapping(_compile(arguments[1]) if len(arguments) == 2 else _identity)
+    elif parameter_type in (list, tuple, set, frozenset):
+        return _compile_sequence(parameter_type, _identity)
+    elif not isinstance(parameter_type, type):
+        return _identity  # Forward references and other annotations are passed through
+    elif hasattr(parameter_type, "json_object_hook"):
+        return _compile_class(parameter_type, _compile_object_hook(parameter_type))
+    elif dataclasses.is_dataclass(parameter_type):
+        return _compile_class(parameter_type, _compile_dataclass(parameter_type))
+    elif "__slots__" in vars(parameter_type) and parameter_type.__init__ is object.__init__:
+        return _compile_class(parameter_type, _compile_slots(parameter_type))
+
+    return _compile_class(parameter_type, _compile_init(parameter_type))
+
+
+def _is_class(parameter_type) -> bool:
+    """
+    :return: True for the types decoded by _compile_class
+    """
+    return isinstance(parameter_type, type) and typing.get_origin(parameter_type) is None and \
+        parameter_type not in (map, dict, object, list, tuple, set, frozenset, str, bytes, bool, int, float)
+
+
+def _is_json_object_or_string(data) -> bool:
+    text = data.lstrip()
+    return len(text) > 0 and text[:1] in ((b"{", b'"') if isinstance(data, (bytes, bytearray)) else ("{", '"'))
+
+
+def _compile_class(parameter_type, object_decoder):
+    """
+    Classes are built from json objects by object_decoder, or from a single value like the text of a uuid.UUID,
+    Decimal or datetime.date (using fromisoformat when the class has it).
+    Values that already have the type, like the uuid.UUID of a {name:uuid} path variable, are returned as they are.
+    """
+    from_text = getattr(parameter_type, "fromisoformat", parameter_type)
+    type_name = parameter_type.__name__
+
+    def decode_class(value):
+        if isinstance(value, parameter_type):
+            return value
+        elif isinstance(value, dict):
+            return object_decoder(value)
+
+        if isinstance(value, (bytes, bytearray)):
+            value = _decode_str(value)
+        try:
+            return from_text(value) if isinstance(value, str) else parameter_type(value)
+        except (TypeError, ValueError, ArithmeticError):  # decimal.InvalidOperation is an ArithmeticError
+            raise DecodeError(f"Expected {type_name}, got {value!r}") from None
+
+    return decode_class
+
+
+def _identity(value):
+    return value
+
+
+def _decode_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return str(value).encode()
+
+
+def _decode_str(value):
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            raise DecodeError("Data is not valid utf-8")
+    elif isinstance(value, str):
+        return value
+    elif isinstance(value, (dict, list)):
+        raise DecodeError(f"Expected a string, got {type(value).__name__}")
+    return str(value)
+
+
+def _decode_bool(value):
+    if isinstance(value, bool):
+        return value
+    elif isinstance(value, (bytes, bytearray, str)):
+        text = _decode_str(value).strip().lower()
+        if text in _TRUE_STRINGS:
+            return True
+        elif text in _FALSE_STRINGS:
+            return False
+
+    raise DecodeError(f"Expected a boolean, got {value!r}")
+
+
+def _compile_number(number_type):
+    name = number_type.__name__
+
+    def decode_number(value):
+        if isinstance(value, (bytes, bytearray)):
+            value = _decode_str(value)
+        elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise DecodeError(f"Expected {name}, got {type(value).__name__}")
+        elif number_type is int and isinstance(value, float) and not value.is_integer():
+            raise DecodeError(f"Expected int, got {value!r}")
+
+        try:
+            return number_type(value)
+        except (TypeError, ValueError):
+            raise DecodeError(f"Expected {name}, got {value!r}") from None
+
+    return decode_number
+
+
+def _compile_union(arguments):
+    optional = type(None) in arguments
+    decoders = [_compile(argument) for argument in arguments if argument is not type(None)]
+
+    def decode_union(value):
+        if value is None and optional:
+            return None
+
+        for decoder in decoders:
+            try:
+                return decoder(value)
+            except DecodeError:
+                continue
+
+        raise DecodeError(f"{value!r} does not match any of {arguments}")
+
+    return decode_union
+
+
+def _compile_sequence(sequence_type, item_decoder):
+    def decode_sequence(value):
+        if not isinstance(value, list):
+            raise DecodeError(f"Expected a list, got {type(value).__name__}")
+
+        if item_decoder is _identity:
+            return value if sequence_type is list else sequence_type(value)
+        return sequence_type([item_decoder(item) for item in value])
+
+    return decode_sequence
+
+
+def _compile_mapping(value_decoder):
+    def decode_mapping(value):
+        if not isinstance(value, dict):
+            raise DecodeError(f"Expected an object, got {type(value).__name__}")
+        return {key: value_decoder(item) for key, item in value.items()}
+
+    return decode_mapping
+
+
+def _type_hints(parameter_type, function=None):
+    try:
+        return typing.get_type_hints(function if function is not None else parameter_type)
+    except Exception:
+        return {}
+
+
+def _compile_fields(fields):
+    """
+    :param fields: list of (name, type, default) tuples, default is _NO_DEFAULT for required fields
+    :return: list of (name, decoder, required)
+    """
+    return [(name, _compile(field_type), default is _NO_DEFAULT) for name, field_type, default in fields]
+
+
+def _decode_fields(compiled_fields, value, type_name):
+    if not isinstance(value, dict):
+        raise DecodeError(f"Expected an object for {type_name}, got {type(value).__name__}")
+
+    arguments = {}
+    for name, decoder, required in compiled_fields:
+        if name in value:
+            arguments[name] = decoder(value[name])
+        elif required:
+            raise DecodeError(f"Missing field '{name}' for {type_name}")
+
+    return arguments
+
+
+def _compile_dataclass(parameter_type):
+    hints = _type_hints(parameter_type)
+    compiled_fields = _compile_fields([
+        (
+            field.name,
+            hints.get(field.name, field.type),
+            _NO_DEFAULT if field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING else None
+        )
+        for field in dataclasses.fields(parameter_type) if field.init
+    ])
+    type_name = parameter_type.__name__
+
+    def decode_dataclass(value):
+        return parameter_type(**_decode_fields(compiled_fields, value, type_name))
+
+    return decode_dataclass
+
+
+def _compile_slots(parameter_type):
+    hints = _type_hints(parameter_type)
+    slots = [slot for cls in parameter_type.__mro__ for slot in vars(cls).get("__slots__", ())]
+    slots = [slots] if isinstance(slots, str) else slots
+    compiled_fields = _compile_fields([(slot, hints.get(slot, typing.Any), None) for slot in slots])
+    type_name = parameter_type.__name__
+
+    def decode_slots(value):
+        instance = parameter_type.__new__(parameter_type)
+        for name, item in _decode_fields(compiled_fields, value, type_name).items():
+            setattr(instance, name, item)
+        return instance
+
+    return decode_slots
+
+
+def _compile_init(parameter_type):
+    signature = inspect.signature(parameter_type.__init__)
+    hints = _type_hints(parameter_type, parameter_type.__init__)
+    parameters = list(signature.parameters.values())[1:]  # Skip self
+    compiled_fields = _compile_fields([
+        (
+            parameter.name,
+            hints.get(parameter.name, parameter.annotation),
+            _NO_DEFAULT if parameter.default is inspect.Parameter.empty else parameter.default
+        )
+        for parameter in parameters
+        if parameter.kind in (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+    ])
+    field_names = frozenset(name for name, _, _ in compiled_fields)
+    type_name = parameter_type.__name__
+
+    def decode_init(value):
+        instance = parameter_type(**_decode_fields(compiled_fields, value, type_name))
+
+        # Keys that are not constructor arguments are kept as attributes, like the json body described them
+        if hasattr(instance, "__dict__"):
+            for name, item in value.items():
+                if name not in field_names:
+                    instance.__dict__[name] = item
+        return instance
+
+    return decode_init
+
+
+def _compile_object_hook(parameter_type):
+    type_name = parameter_type.__name__
+
+    def decode_object_hook(value):
+        if not isinstance(value, dict):
+            raise DecodeError(f"Expected an object for {type_name}, got {type(value).__name__}")
+        return parameter_type.json_object_hook(value)
+
+    return decode_object_hook
@@ -4,7 +4,9 @@ from typing import Tuple
 
 class Decorator(ABC):
     """
-    Decorate a route to change it's pre-execution functionality
+    Decorate a route to change it's pre-execution functionality.
+    should_execute_endpoint receives the request body as a LazyBody, it is only decoded once accessed
+    (None when the endpoint streams its body)
     """
 
     def __init__(self, fail_on_null_result=True):
@@ -1,11 +1,28 @@
 import logging
+import socket
+from typing import Optional
 
+from web_framework_v2.access_log import AccessLog
+from web_framework_v2.async_http_server import AsyncHttpServer
+from web_framework_v2.compression import Compression
 from web_framework_v2.http import HttpRequest, ContentType
 from web_framework_v2.http.http_method import HttpMethod
 from web_framework_v2.http_server import HttpServer
+from web_framework_v2.metrics import MetricsRegistry, ServerMetrics
+from web_framework_v2.middleware import Middleware
+from web_framework_v2.parser import default_parser
+from web_framework_v2.prefork_supervisor import PreforkSupervisor
+from web_framework_v2.profiler import SlowRequestProfiler
+from web_framework_v2.response_cache import ResponseCache
 from web_framework_v2.route import Endpoint
 from web_framework_v2.route.endpoint import ErrorHandler
 from web_framework_v2.route.endpoint_map import EndpointMap
+from web_framework_v2.serializers import SerializerRegistry
+from web_framework_v2.server_mode import ServerMode
+from web_framework_v2.static_files import StaticFileEngine
+from web_framework_v2.timer_wheel import TimerWheel
+from web_framework_v2.timing import TimingHooks
+from web_framework_v2.worker_pool_http_server import WorkerPoolHttpServer
 
 logger = logging.getLogger(__name__)
 
@@ -19,31 +36,190 @@ class Framework:
             port: int = 80,
             log_level=logging.INFO,
             error_handler: ErrorHandler = lambda exception, traceback, request, response, path_variables: {"error": str(exception),
-                                                                                                           "traceback": traceback}
+                                                                                                           "traceback": traceback},
+            server_mode: ServerMode = ServerMode.THREADED,
+            executor_workers: int = 32,
+            backlog: int = 128,
+            worker_threads: int = 16,
+            worker_queue_size: int = 64,
+            retry_after: int = 1,
+            request_parser=None,
+            keep_alive_timeout: float = 10,
+            header_timeout: float = 10,
+            body_timeout: float = 30,
+            static_cache_size: int = 1024 * 1024 * 32,
+            static_cache_file_size: int = 1024 * 256,
+            static_cache_control: dict = None,
+            max_body_size: int = None,
+            body_spool_size: int = 1024 * 1024,
+            compression=False,
+            response_cache_size: int = 1024 * 1024 * 16,
+            server_timing: bool = False,
+            metrics: bool = True,
+            metrics_route: str = None,
+            profiler: SlowRequestProfiler = None,
+            access_log=None
     ):
+        """
+        :param server_mode: the execution model used to serve connections
+        :param executor_workers: the maximum amount of threads executing non coroutine endpoints when using ServerMode.ASYNCIO
+        :param backlog: the listen backlog of the server socket
+        :param worker_threads: the amount of worker threads when using ServerMode.WORKER_POOL
+        :param worker_queue_size: the amount of connections waiting for a worker before 503 is returned when using ServerMode.WORKER_POOL
+        :param retry_after: the Retry-After seconds sent with 503 responses when using ServerMode.WORKER_POOL
+        :param request_parser: the parser class used for incoming requests, defaults to httptools when installed
+        :param keep_alive_timeout: seconds an idle keep alive connection is kept open when the client did not ask for a timeout
+        :param header_timeout: seconds a client is given to send a complete request head
+        :param body_timeout: seconds a client is given between reads of a request body
+        :param static_cache_size: the maximum amount of bytes of static files kept in memory
+        :param static_cache_file_size: static files larger than this are streamed with sendfile instead of being kept in memory
+        :param static_cache_control: url prefix: Cache-Control header of the static files under it, e.g. {"/assets": "max-age=86400"}
+        :param max_body_size: the maximum size of a request body in bytes, larger bodies are answered with 413 and the connection is closed
+        :param body_spool_size: bodies of RequestBody(spool=True) endpoints larger than this are spilled to a temporary file
+        :param compression: True to compress responses with the default Compression, a Compression to configure it,
+                            False (the default) to send every response uncompressed
+        :param response_cache_size: the maximum amount of bytes of responses kept for endpoints using cache=
+        :param server_timing: send the time spent in each phase of a request as a Server-Timing header
+        :param metrics: record request counts, latencies, bytes and connections in the metrics registry
+        :param metrics_route: when given, the registry is served in the Prometheus text format on this route, e.g. "/metrics"
+        :param profiler: profiles endpoints that are slow or sampled, e.g. SlowRequestProfiler(threshold=2, directory="profiles")
+        :param access_log: True to write a JSON line per response to stderr, an AccessLog to configure the handlers
+        """
         logging.getLogger("web_framework_v2").setLevel(log_level)
 
         self._static_folder = static_folder
         self._static_url_path = static_url_path
+        self._compression = (Compression() if compression is True else compression) or None
+        self._static_files = StaticFileEngine(
+            static_folder, static_url_path, static_cache_size, static_cache_file_size, static_cache_control, self._compression
+        )
+        self._host = host
+        self._port = port
         self._active = False
         self._error_handler = error_handler
-        self._http_server = HttpServer(self, host, port)
+        self._server_mode = server_mode
+        self._executor_workers = executor_workers
+        self._backlog = backlog
+        self._worker_threads = worker_threads
+        self._worker_queue_size = worker_queue_size
+        self._retry_after = retry_after
+        self._request_parser = request_parser if request_parser is not None else default_parser()
+        self._timer_wheel = TimerWheel()
+        self._serializers = SerializerRegistry()
+        self._response_cache = ResponseCache(response_cache_size)
+        self._timing_hooks = TimingHooks(server_timing)
+        self._metrics = MetricsRegistry()
+        self._server_metrics = ServerMetrics(self._metrics) if metrics else None
+        self._profiler = profiler
+        self._middleware = []
+        self._access_log = (AccessLog() if access_log is True else access_log) or None
+        if self._access_log is not None:
+            self._timing_hooks.add(self._access_log)
+        self.keep_alive_timeout = keep_alive_timeout
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.max_body_size = max_body_size
+        self.body_spool_size = body_spool_size
+        self._http_server = self._create_server(server_mode)
+        self._supervisor = None
         self._endpoint_map = EndpointMap()
+        if metrics_route is not None:
+            self.add_metrics_endpoint(metrics_route)
+
+    def start(self, server_mode: ServerMode = None, workers: int = None):
+        """
+        :param server_mode: overrides the server mode given to the constructor
+        :param workers: when given, pre-forks this amount of worker processes that each run the server.
+                        Must be called from the main thread, blocks while supervising the workers until shutdown is called
+                        or the process receives SIGTERM / SIGINT
+        """
+        if server_mode is not None and server_mode is not self._server_mode:
+            self._server_mode = server_mode
+            self._replace_server(self._create_server(server_mode))
 
-    def start(self):
         self._active = True
-        self._http_server.start()
+        if workers is not None:
+            self._supervisor = PreforkSupervisor(self, workers, (self._host, self._port), self._backlog)
+            try:
+                self._supervisor.start()
+            finally:
+                self._active = False
+        else:
+            if self._access_log is not None:
+                self._access_log.start()
+            self._http_server.start()
+
+    def serve_worker(self, listen_socket: socket.socket) -> HttpServer:
+        """
+        Runs the server of a pre-forked worker process on a socket created by the supervisor.
+        """
+        self._supervisor = None
+        self._active = True
+        if self._access_log is not None:
+            self._access_log.start()  # The listener thread of the supervisor is not inherited by the fork
+        self._replace_server(self._create_server(self._server_mode))
+        self._http_server.start(listen_socket)
+        return self._http_server
+
+    def _replace_server(self, server: HttpServer):
+        self._http_server.shutdown()  # Releases the socket of a server that was already started
+        self._http_server = server
+
+    def _create_server(self, server_mode: ServerMode):
+        if server_mode is ServerMode.ASYNCIO:
+            return AsyncHttpServer(self, self._host, self._port, self._backlog, self._executor_workers)
+        elif server_mode is ServerMode.WORKER_POOL:
+            return WorkerPoolHttpServer(
+                self, self._host, self._port, self._backlog, self._worker_threads, self._worker_queue_size, self._retry_after
+            )
+
+        return HttpServer(self, self._host, self._port, self._backlog)
 
     def shutdown(self):
         self._active = False
-        self._http_server.shutdown()
+        if self._supervisor is not None:
+            self._supervisor.shutdown()
+        else:
+            self._http_server.shutdown()
+        if self._access_log is not None:
+            self._access_log.stop()
 
     def get_endpoint(self, request: HttpRequest):
         return self._endpoint_map.get_endpoint(request)
 
-    def add_endpoint(self, route: str, func, methods: {HttpMethod}, match_headers: dict, content_type: ContentType, error_handler: ErrorHandler):
+    def register_serializer(self, content_type: ContentType, serializer):
+        """
+        Encodes the results of endpoints with the given content type using serializer.
+        :param serializer: callable receiving an endpoint result and returning str or bytes
+        """
+        self._serializers.register(content_type, serializer)
+
+    def serializers(self) -> SerializerRegistry:
+        return self._serializers
+
+    def dump_routes(self) -> str:
+        """
+        :return: a printable view of the compiled route trees, one per http method
+        """
+        return self._endpoint_map.dump()
+
+    def add_endpoint(
+            self,
+            route: str,
+            func,
+            methods: {HttpMethod},
+            match_headers: dict,
+            content_type: ContentType,
+            error_handler: ErrorHandler,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
+    ):
         for method in methods:
-            self._endpoint_map.add_route(Endpoint(route, method, content_type, func, match_headers, error_handler))
+            endpoint = Endpoint(route, method, content_type, func, match_headers, error_handler, serializer, self._serializers, etag, cache_control, cache)
+            endpoint.set_middleware(self._middleware)
+            self._endpoint_map.add_route(endpoint)
 
     def endpoint(
             self,
@@ -51,8 +227,20 @@ class Framework:
             methods: {HttpMethod} = None,
             content_type: ContentType = ContentType.json,
             match_headers: dict = None,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
+        """
+        :param serializer: callable encoding the endpoint's results, overrides the serializer registered for the content type
+        :param etag: send an ETag hashed from the response body and answer matching If-None-Match with 304 Not Modified
+        :param cache_control: the Cache-Control header of successful responses, e.g. "public, max-age=60"
+        :param cache: keep responses in memory, True, seconds or a CachePolicy selecting the query parameters and headers
+                      responses vary by. The response is reused for every request with the same url and selected values,
+                      so only GET and HEAD endpoints may be cached
+        """
         assert route is not None and type(route) is str, "Route must be a valid string!"
         if error_handler is None:
             error_handler = self._error_handler
@@ -67,7 +255,7 @@ class Framework:
             content_type = ContentType.json
 
         def decorator(f):
-            self.add_endpoint(route, f, methods, match_headers, content_type, error_handler)
+            self.add_endpoint(route, f, methods, match_headers, content_type, error_handler, serializer, etag, cache_control, cache)
             return f
 
         return decorator
@@ -77,135 +265,240 @@ class Framework:
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.GET}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.GET}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def post(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.POST}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.POST}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def put(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.PUT}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.PUT}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def patch(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.PATCH}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.PATCH}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def delete(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.DELETE}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.DELETE}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def copy(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.COPY}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.COPY}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def head(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.HEAD}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.HEAD}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def options(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.OPTIONS}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.OPTIONS}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def link(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.LINK}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.LINK}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def unlink(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.UNLINK}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.UNLINK}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def purge(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.PURGE}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.PURGE}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def lock(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.LOCK}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.LOCK}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def unlock(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.UNLOCK}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.UNLOCK}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def propfind(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.PROPFIND}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.PROPFIND}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
 
     def view(
             self,
             route: str,
             match_headers: dict = None,
             content_type: ContentType = ContentType.json,
-            error_handler: ErrorHandler = None
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
-        return self.endpoint(route, {HttpMethod.VIEW}, content_type, match_headers, error_handler)
+        return self.endpoint(route, {HttpMethod.VIEW}, content_type, match_headers, error_handler, serializer=serializer, etag=etag, cache_control=cache_control, cache=cache)
+
+    def add_middleware(self, middleware: Middleware):
+        """
+        Middleware run in the order they were added, before the endpoint's decorators.
+        The chain of every endpoint is composed again, so adding middleware while serving is safe but not cheap.
+        """
+        self._middleware = self._middleware + [middleware]
+        for endpoint in self._endpoint_map.endpoints():
+            endpoint.set_middleware(self._middleware)
+
+    def before(self, prefix: str = "/"):
+        """
+        Registers hook(request, response) to run before the endpoints under prefix, see Middleware.
+        """
+
+        def decorator(hook):
+            self.add_middleware(Middleware(Middleware.BEFORE, hook, prefix))
+            return hook
+
+        return decorator
+
+    def after(self, prefix: str = "/"):
+        """
+        Registers hook(request, response, result) to run after the endpoints under prefix, see Middleware.
+        """
+
+        def decorator(hook):
+            self.add_middleware(Middleware(Middleware.AFTER, hook, prefix))
+            return hook
+
+        return decorator
+
+    def around(self, prefix: str = "/"):
+        """
+        Registers hook(request, response, proceed) to wrap the endpoints under prefix, see Middleware.
+        """
+
+        def decorator(hook):
+            self.add_middleware(Middleware(Middleware.AROUND, hook, prefix))
+            return hook
+
+        return decorator
+
+    def middleware(self) -> list:
+        return list(self._middleware)
 
     def static_folder(self):
         return self._static_folder
@@ -213,9 +506,76 @@ class Framework:
     def static_url_path(self):
         return self._static_url_path
 
+    def static_files(self) -> StaticFileEngine:
+        return self._static_files
+
+    def compression(self) -> Optional[Compression]:
+        return self._compression
+
+    def add_timing_hook(self, hook):
+        """
+        Requests are timed while a hook is registered, see RequestTiming for the phases.
+        :param hook: callable(request, response, RequestTiming) called after each response was sent
+        """
+        self._timing_hooks.add(hook)
+
+    def remove_timing_hook(self, hook):
+        self._timing_hooks.remove(hook)
+
+    def timing_hooks(self) -> TimingHooks:
+        return self._timing_hooks
+
+    def metrics(self) -> MetricsRegistry:
+        """
+        :return: the registry of the server metrics, custom metrics registered in it are served with them
+        """
+        return self._metrics
+
+    def server_metrics(self) -> Optional[ServerMetrics]:
+        return self._server_metrics
+
+    def add_metrics_endpoint(self, route: str = "/metrics"):
+        """
+        Serves the metrics registry in the Prometheus text exposition format.
+        """
+        self.add_endpoint(route, self._metrics.render, {HttpMethod.GET}, dict(), ContentType.metrics, self._error_handler)
+
+    def access_log(self) -> Optional[AccessLog]:
+        return self._access_log
+
+    def profiler(self) -> Optional[SlowRequestProfiler]:
+        return self._profiler
+
+    def set_profiler(self, profiler: Optional[SlowRequestProfiler]):
+        self._profiler = profiler
+
+    def response_cache(self) -> ResponseCache:
+        return self._response_cache
+
+    def invalidate_cache(self, route: str = None, url: str = None):
+        """
+        Drops cached responses, of an endpoint route (e.g. "/area/{x}") and / or a url, or all of them.
+        """
+        self._response_cache.invalidate(route, url)
+
+    def request_parser(self):
+        return self._request_parser
+
+    def timer_wheel(self):
+        return self._timer_wheel
+
+    def tracked_connections(self):
+        """
+        :return: the amount of connections currently waiting on a read timeout
+        """
+        return len(self._timer_wheel)
+
     def is_active(self):
         return self._active
 
+    def server_mode(self):
+        return self._server_mode
+
     @property
     def error_handler(self):
         return self._error_handler
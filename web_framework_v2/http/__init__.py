@@ -1,7 +1,9 @@
-__all__ = ["ContentType", "HttpStatus", "HttpMethod", "HttpRequest", "HttpResponse"]
+__all__ = ["ContentType", "HttpStatus", "HttpMethod", "HttpRequest", "HttpResponse", "HttpHeaders", "HttpError"]
 
 from .content_type import ContentType
 from .http_status import HttpStatus
+from .http_error import HttpError
 from .http_method import HttpMethod
+from .http_headers import HttpHeaders
 from .http_request import HttpRequest
 from .http_response import HttpResponse
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import socket
+from collections.abc import AsyncIterator
+from types import AsyncGeneratorType, GeneratorType
+
+logger = logging.getLogger(__name__)
+
+_STREAM_END = object()
+_LAST_CHUNK = b"0\r\n\r\n"
+
+
+def is_stream(result) -> bool:
+    """
+    :return: True when an endpoint result is a generator (or async generator) of body chunks.
+             Other iterators, like file objects or map results, are encoded like any other result
+    """
+    return isinstance(result, (GeneratorType, AsyncGeneratorType))
+
+
+def encode_chunk(chunk) -> bytes:
+    if isinstance(chunk, (bytes, bytearray, memoryview)):
+        return chunk
+    elif isinstance(chunk, str):
+        return chunk.encode()
+    return str(chunk).encode()
+
+
+def frame_chunk(data, chunked: bool):
+    return b"%x\r\n%b\r\n" % (len(data), data) if chunked else data
+
+
+def send_stream(response, client_socket: socket.socket, head: bytes):
+    """
+    Sends the chunks of response.stream as they are produced.
+    The next chunk is only pulled once the previous one was written, so a slow client slows the producer down
+    and at most stream_buffer_size bytes (or a single chunk) are held in memory.
+    The stream is closed when the client disconnects, a failing producer aborts the connection.
+    :param head: the status line and headers of the response
+    """
+    stream = response.stream
+    chunked = response.is_chunked()
+    loop = asyncio.new_event_loop() if isinstance(stream, AsyncIterator) else None
+    buffer = bytearray()
+
+    try:
+        client_socket.sendall(head)
+        while True:
+            try:
+                chunk = next(stream, _STREAM_END) if loop is None else loop.run_until_complete(_anext(stream))
+            except Exception as e:
+                logger.exception(e)
+                raise ConnectionAbortedError("The response stream failed") from e
+            if chunk is _STREAM_END:
+                break
+
+            data = _coalesce(buffer, encode_chunk(chunk), response.stream_buffer_size)
+            if data is not None:
+                client_socket.sendall(frame_chunk(data, chunked))
+
+        if len(buffer) > 0:
+            client_socket.sendall(frame_chunk(buffer, chunked))
+        if chunked:
+            client_socket.sendall(_LAST_CHUNK)
+    finally:
+        _close(stream, loop)
+        if loop is not None:
+            loop.close()
+
+
+async def send_stream_async(response, writer: asyncio.StreamWriter, head: bytes, executor=None):
+    """
+    Same as send_stream for the asyncio server, blocking iterators are advanced on executor.
+    """
+    stream = response.stream
+    chunked = response.is_chunked()
+    loop = asyncio.get_running_loop()
+    is_async = isinstance(stream, AsyncIterator)
+    buffer = bytearray()
+
+    try:
+        writer.write(head)
+        await writer.drain()
+        while True:
+            try:
+                chunk = await _anext(stream) if is_async else await loop.run_in_executor(executor, next, stream, _STREAM_END)
+            except Exception as e:
+                logger.exception(e)
+                raise ConnectionAbortedError("The response stream failed") from e
+            if chunk is _STREAM_END:
+                break
+
+            data = _coalesce(buffer, encode_chunk(chunk), response.stream_buffer_size)
+            if data is not None:
+                writer.write(frame_chunk(data, chunked))
+                await writer.drain()
+
+        if len(buffer) > 0:
+            writer.write(frame_chunk(buffer, chunked))
+        if chunked:
+            writer.write(_LAST_CHUNK)
+        await writer.drain()
+    finally:
+        try:
+            if is_async and hasattr(stream, "aclose"):
+                await stream.aclose()
+            elif hasattr(stream, "close"):
+                stream.close()
+        except Exception as e:
+            logger.exception(e)
+
+
+def _coalesce(buffer: bytearray, chunk, buffer_size: int):
+    """
+    :return: the data to send next or None while the buffer is not full, empty chunks are never sent
+             since they would end a chunked body
+    """
+    if len(buffer) == 0 and len(chunk) >= buffer_size:
+        return chunk if len(chunk) > 0 else None
+
+    buffer += chunk
+    if len(buffer) < buffer_size:
+        return None
+
+    data = bytes(buffer)
+    buffer.clear()
+    return data
+
+
+async def _anext(stream):
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_END
+
+
+def _close(stream, loop):
+    try:
+        if loop is not None and hasattr(stream, "aclose"):
+            loop.run_until_complete(stream.aclose())
+        elif hasattr(stream, "close"):
+            stream.close()
+    except Exception as e:
+        logger.exception(e)
@@ -0,0 +1,85 @@
+from typing import List, Optional, Tuple
+
+from web_framework_v2.http.conditional import http_date
+
+MAX_RANGES = 16  # Requests asking for more ranges are served whole
+
+
+class MultipartByteranges:
+    def __init__(self, boundary: str):
+        """
+        The content type of a multi range response, used in place of a ContentType.
+        """
+        self.boundary = boundary
+        self.value = f"multipart/byteranges; boundary={boundary}"
+
+    def __str__(self):
+        return "content-type: " + self.value
+
+
+def parse_byte_ranges(range_header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses a Range header, e.g. "bytes=0-99,200-" or "bytes=-500".
+    :param size: the size of the resource
+    :return: the sorted and merged (first byte, last byte) ranges, an empty list when no range is satisfiable
+             or None when the header is malformed and should be ignored
+    """
+    unit, _, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if len(dash) == 0:
+            return None
+
+        try:
+            if len(first) == 0:  # Suffix range, the last n bytes
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                if suffix_length > 0 and size > 0:
+                    ranges.append((max(0, size - suffix_length), size - 1))
+                continue
+
+            first = int(first)
+            last = int(last) if len(last) > 0 else None
+        except ValueError:
+            return None
+
+        if first < 0 or (last is not None and last < first):
+            return None
+        if last is None:
+            last = size - 1
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = []
+    for first, last in ranges:
+        if len(merged) > 0 and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+
+    return merged
+
+
+def if_range_matches(request, etag: str = None, last_modified: float = None) -> bool:
+    """
+    :return: False when If-Range names another version of the resource and the whole resource has to be sent
+    """
+    if_range = request.headers.get("if-range", None)
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range uses the strong comparison, weak tags never match
+        return etag is not None and not if_range.startswith("W/") and if_range == etag
+
+    return last_modified is not None and if_range == http_date(last_modified)
@@ -0,0 +1,65 @@
+import hashlib
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+_ENCODING_SUFFIXES = ('-gzip"', '-br"', '-deflate"')
+
+
+def file_etag(size: int, mtime_ns: int) -> str:
+    """
+    :return: a strong validator derived from the size and modification time of a file
+    """
+    return f'"{size:x}-{mtime_ns:x}"'
+
+
+def body_etag(body: bytes) -> str:
+    """
+    :return: a strong validator derived from the content of a response body
+    """
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(request, etag: str = None, last_modified: float = None) -> bool:
+    """
+    Evaluates If-None-Match and If-Modified-Since, If-Modified-Since is ignored when If-None-Match is sent.
+    :param etag: the current validator of the resource
+    :param last_modified: the timestamp the resource was last modified at
+    :return: True when the client's copy is still valid and 304 can be returned
+    """
+    if_none_match = request.headers.get("if-none-match", None)
+    if if_none_match is not None:
+        if etag is None:
+            return False
+
+        if_none_match = if_none_match.strip()
+        if if_none_match == "*":
+            return True
+
+        opaque_tag = _opaque_tag(etag)
+        return any(_opaque_tag(tag.strip()) == opaque_tag for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since", None)
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError, IndexError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    return int(last_modified) <= since.timestamp()
+
+
+def _opaque_tag(tag: str) -> str:
+    # If-None-Match uses the weak comparison, W/"x" matches "x", and compressed variants ("x-gzip") match their source
+    tag = tag[2:] if tag.startswith("W/") else tag
+    for suffix in _ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
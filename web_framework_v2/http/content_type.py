@@ -9,10 +9,16 @@ class ContentType(Enum):
     js = "text/javascript; charset=utf-8"
     css = "text/css"
     jpg = "image/jpeg"
+    jpeg = "image/jpeg"
+    png = "image/png"
+    svg = "image/svg+xml"
     ico = "image/vnd.microsoft.icon"
     gif = "image/gif"
     json = "application/json"
     xml = "application/xml"
+    pdf = "application/pdf"
+    bin = "application/octet-stream"
+    metrics = "text/plain; version=0.0.4; charset=utf-8"
 
     def __str__(self):
         return "content-type: " + self.value
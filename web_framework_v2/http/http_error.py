@@ -0,0 +1,12 @@
+from web_framework_v2.http.http_status import HttpStatus
+
+
+class HttpError(Exception):
+    def __init__(self, status: HttpStatus, message: str = None):
+        """
+        Raised while handling a request to answer it with the given status.
+        :param status: the status of the response
+        :param message: description of the error, defaults to the status phrase
+        """
+        super().__init__(message if message is not None else status.phrase)
+        self.status = status
@@ -0,0 +1,63 @@
+from collections.abc import MutableMapping
+
+
+class HttpHeaders(MutableMapping):
+    """
+    Request headers keyed by lower case name, names are case insensitive in every accessor.
+    The raw header block is only split into fields the first time a header is accessed,
+    and every value is only decoded when it is read.
+    """
+
+    __slots__ = ("_raw", "_fields")
+
+    def __init__(self, raw: bytes = b"", fields: dict = None):
+        """
+        :param raw: the header block of the request, without the request line and the terminating empty line
+        :param fields: already parsed fields, lower case name: value (str or undecoded bytes)
+        """
+        self._raw = raw
+        self._fields = fields
+
+    def _parsed(self) -> dict:
+        fields = self._fields
+        if fields is None:
+            fields = {}
+            if len(self._raw) > 0:
+                for line in self._raw.split(b"\r\n"):
+                    if len(line) == 0:
+                        continue
+                    name, colon, value = line.partition(b":")
+                    if len(colon) == 0:
+                        raise ValueError(f"Malformed header line {bytes(line)}")
+                    fields[name.decode("latin-1").lower()] = value.lstrip(b" ")
+            self._fields = fields
+        return fields
+
+    def __getitem__(self, name: str) -> str:
+        name = name.lower()
+        fields = self._parsed()
+        value = fields[name]
+        if type(value) is not str:
+            value = fields[name] = bytes(value).decode("latin-1")
+        return value
+
+    def __setitem__(self, name: str, value: str):
+        self._parsed()[name.lower()] = value
+
+    def __delitem__(self, name: str):
+        del self._parsed()[name.lower()]
+
+    def __contains__(self, name):
+        return isinstance(name, str) and name.lower() in self._parsed()
+
+    def __iter__(self):
+        return iter(self._parsed())
+
+    def __len__(self):
+        return len(self._parsed())
+
+    def copy(self):
+        return HttpHeaders(self._raw, dict(self._fields) if self._fields is not None else None)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -10,6 +10,11 @@ class HttpRequest:
         self.query_parameters = query_parameters if query_parameters is not None else {}
         self.body = body
         self.path_variables = path_variables
+        self.body_stream = None  # RequestBodyReader of a body that is read on demand instead of being buffered
+        self.timing = None  # RequestTiming of the request while timings are collected
+        self.client_address = None  # (host, port) of the connection the request was received on
+        self.endpoint = None  # (route, path variables) once looked up, so the lookup is done once per request
+        self.lazy_body = None  # LazyBody of the endpoint's decoded body while middleware runs for the request
 
     def get_header(self, name: str):
         return self.headers.get(name, None)
@@ -18,15 +23,21 @@ class HttpRequest:
         return self.query_parameters.get(name, None)
 
     def clone(self):
-        return HttpRequest(
+        request = HttpRequest(
             self.method,
             self.url,
             self.http_version,
-            dict(self.headers) if self.headers is not None else None,
+            self.headers.copy() if self.headers is not None else None,
             dict(self.query_parameters) if self.query_parameters is not None else None,
             self.body,
             self.path_variables
         )
+        request.body_stream = self.body_stream
+        request.timing = self.timing
+        request.client_address = self.client_address
+        request.endpoint = self.endpoint
+        request.lazy_body = self.lazy_body
+        return request
 
     def __str__(self):
         return f"HttpRequest(method: {self.method}, url: {self.url}, http_version: {self.http_version}, headers: {self.headers}, query_parameters: {self.query_parameters}"
@@ -1,12 +1,71 @@
+import asyncio
 import logging
 import os
-import time
+import socket
 import traceback
+from typing import Optional
 
-from web_framework_v2.http import HttpStatus, ContentType
+from web_framework_v2.http import HttpStatus, ContentType, HttpError, HttpMethod
+from web_framework_v2.http.body_stream import is_stream, send_stream, send_stream_async
+from web_framework_v2.http.conditional import body_etag, http_date, is_not_modified
 
 logger = logging.getLogger(__name__)
 
+_STATUS_LINES = {}  # (http version, HttpStatus): encoded status line
+_CONTENT_TYPE_HEADERS = {}  # ContentType: encoded content-type header
+
+
+def status_line(http_version: str, status: HttpStatus) -> bytes:
+    try:
+        return _STATUS_LINES[(http_version, status)]
+    except KeyError:
+        line = f"{http_version.strip()} {status.value} {status.name}\r\n".encode()
+        if len(_STATUS_LINES) < 1024:  # The version comes from the client, do not let it grow the cache
+            _STATUS_LINES[(http_version, status)] = line
+        return line
+
+
+def content_type_header(content_type) -> bytes:
+    try:
+        return _CONTENT_TYPE_HEADERS[content_type]
+    except KeyError:
+        header = f"{content_type}\r\n".encode()
+        if isinstance(content_type, ContentType):  # Other content types such as multipart boundaries are unique
+            _CONTENT_TYPE_HEADERS[content_type] = header
+        return header
+    except TypeError:  # Unhashable content type
+        return f"{content_type}\r\n".encode()
+
+
+def send_buffers(client_socket: socket.socket, buffers):
+    """
+    Sends buffers with a single sendmsg (writev) call instead of joining them, more calls are only made
+    for what the kernel did not accept at once.
+    """
+    buffers = [memoryview(buffer) for buffer in buffers if len(buffer) > 0]
+    if not hasattr(client_socket, "sendmsg"):
+        return client_socket.sendall(b"".join(buffers))
+
+    while len(buffers) > 0:
+        sent = client_socket.sendmsg(buffers)
+        while len(buffers) > 0 and sent >= len(buffers[0]):
+            sent -= len(buffers.pop(0))
+        if sent > 0:
+            buffers[0] = buffers[0][sent:]
+
+
+def _checked_header_value(header: str, value):
+    value = str(value)
+    if any(character in header or character in value for character in "\r\n") or ":" in header:
+        raise ValueError(f"Invalid header {header!r}: {value!r}")
+    if not (header + value).isascii():
+        try:
+            (header + value).encode("latin-1")
+        except UnicodeEncodeError:
+            # Such values have to be encoded by the caller, e.g. Content-Disposition's filename*=UTF-8''... (RFC 8187)
+            raise ValueError(f"Header {header!r} can not be sent as latin-1: {value!r}") from None
+    return value
+
 
 class HttpResponse:
     def __init__(self, content_type, http_version: str, status, html: bytes):
@@ -14,43 +73,235 @@ class HttpResponse:
         self.http_version = http_version
         self.status = status
         self.html = html if html is not None else b""
-        self._data: bytes = bytes()
+        self.file: Optional[str] = None  # Path of a file sent after html with sendfile
+        self.file_parts = []  # (bytes sent before the part, file offset, length)
+        self.file_epilogue = b""  # Bytes sent after the file parts
+        self.stream = None  # Iterator or async iterator of body chunks sent with chunked encoding
+        self.stream_buffer_size = 0  # Small chunks are coalesced up to this amount of bytes before they are sent
+        self.headers = {}  # header name: value, sent after the content type
+        self.last_modified: Optional[float] = None  # Timestamp sent as Last-Modified and compared to If-Modified-Since
+        self.exception: Optional[Exception] = None  # The exception the endpoint raised, its result is the error handler's
+
+    def set_header(self, header: str, value):
+        """
+        Sends header with value, replacing the values it had.
+        """
+        self.headers[header] = _checked_header_value(header, value)
+
+    def add_header(self, header: str, value):
+        """
+        Sends header once more with value, for headers that may be repeated such as Set-Cookie.
+        """
+        value = _checked_header_value(header, value)
+        values = self.headers.get(header, None)
+        if values is None:
+            self.headers[header] = value
+        elif isinstance(values, list):
+            values.append(value)
+        else:
+            self.headers[header] = [values, value]
 
     def data(self):
-        self._data = self._build_response()
-        return self._data
-
-    def _build_response(self, receive_time=None):
-        response = f"{self.http_version.strip()} {self.status.value} {self.status.name}\r\n".encode()
-        response += f"{self.content_type}\r\n".encode()
-        response += self.build_header("Content-Length", len(self.html))
-        if receive_time is not None:
-            response += self.build_header("Server-Timing", str(time.time() - receive_time))
-        response += '\r\n'.encode()
-        response += self.html
-        return response
+        return self.head() + self.html
+
+    def head(self) -> bytes:
+        """
+        :return: the status line and the headers of the response
+        """
+        parts = [status_line(self.http_version, self.status), content_type_header(self.content_type)]
+        for header, value in self.headers.items():
+            if isinstance(value, list):
+                parts.extend(self.build_header(header, item) for item in value)
+            else:
+                parts.append(self.build_header(header, value))
+        if self.stream is not None:
+            if self.is_chunked():
+                parts.append(b"Transfer-Encoding: chunked\r\n")
+        elif self.status != HttpStatus.NOT_MODIFIED:
+            parts.append(b"Content-Length: %d\r\n" % self.content_length())
+        parts.append(b"\r\n")
+        return b"".join(parts)
+
+    def content_length(self):
+        if self.file is None:
+            return len(self.html)
+
+        return len(self.html) + sum(len(preamble) + length for preamble, _, length in self.file_parts) + len(self.file_epilogue)
+
+    def set_stream(self, stream, buffer_size: int = None):
+        """
+        Sends the chunks of an iterator or async iterator as the body, chunks may be bytes or str.
+        HTTP/1.0 clients receive the chunks unframed and the connection is closed after the body.
+        :param buffer_size: coalesce chunks smaller than this before sending them
+        """
+        self.stream = stream
+        if buffer_size is not None:
+            self.stream_buffer_size = buffer_size
+
+    def is_chunked(self):
+        return self.stream is not None and self.http_version.strip() != "HTTP/1.0"
+
+    def requires_close(self):
+        """
+        :return: True when the end of the body is only marked by closing the connection
+        """
+        return self.stream is not None and not self.is_chunked()
+
+    def not_modified(self):
+        """
+        Turns the response into 304 Not Modified, validators and Cache-Control are kept and the body is dropped.
+        """
+        self.status = HttpStatus.NOT_MODIFIED
+        self.html = b""
+        self.file = None
+
+    def apply_validators(self, request, etag: str = None):
+        """
+        Sends etag and last_modified as validators and answers 304 when the client's copy is still valid.
+        """
+        if etag is not None:
+            self.headers["ETag"] = etag
+        if self.last_modified is not None:
+            self.headers["Last-Modified"] = http_date(self.last_modified)
+
+        if request.method in (HttpMethod.GET, HttpMethod.HEAD) and is_not_modified(request, etag, self.last_modified):
+            self.not_modified()
+
+    def set_file(self, path: str, offset: int, length: int):
+        """
+        Sends length bytes of the file at path from offset as the body, straight from the page cache.
+        """
+        self.set_file_parts(path, [(b"", offset, length)])
+
+    def set_file_parts(self, path: str, parts: list, epilogue: bytes = b""):
+        """
+        Sends several parts of the file at path as the body, e.g. the ranges of a multipart/byteranges response.
+        :param parts: list of (bytes sent before the part, file offset, length)
+        :param epilogue: bytes sent after the last part
+        """
+        self.file = path
+        self.file_parts = parts
+        self.file_epilogue = epilogue
+
+    def send(self, client_socket: socket.socket):
+        if self.stream is not None:
+            return send_stream(self, client_socket, self.head())
+
+        if self.file is None:
+            return send_buffers(client_socket, (self.head(), self.html))
+
+        with open(self.file, "rb") as file:
+            buffers = [self.head(), self.html]
+            for preamble, offset, length in self.file_parts:
+                buffers.append(preamble)
+                send_buffers(client_socket, buffers)
+                buffers = []
+                if client_socket.sendfile(file, offset, length) != length:
+                    raise OSError(f"{self.file} changed while it was sent")
+        send_buffers(client_socket, (self.file_epilogue,))
+
+    async def send_async(self, writer: asyncio.StreamWriter, executor=None):
+        """
+        :param executor: the executor blocking stream iterators are advanced on, the loop's default executor when None
+        """
+        if self.stream is not None:
+            return await send_stream_async(self, writer, self.head(), executor)
+
+        # writelines hands the buffers to the transport without joining them
+        writer.writelines((self.head(), self.html))
+        await writer.drain()
+        if self.file is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        with open(self.file, "rb") as file:
+            for preamble, offset, length in self.file_parts:
+                if len(preamble) > 0:
+                    writer.write(preamble)
+                    await writer.drain()
+                if await loop.sendfile(writer.transport, file, offset, length) != length:
+                    raise ConnectionError(f"{self.file} changed while it was sent")
+        if len(self.file_epilogue) > 0:
+            writer.write(self.file_epilogue)
+            await writer.drain()
 
     @staticmethod
     def build_header(header, value):
-        return f"{header}: {value}\r\n".encode()
+        line = f"{header}: {value}\r\n"
+        try:
+            return line.encode("latin-1")
+        except UnicodeEncodeError:  # Only values written to headers directly skip the check of set_header
+            return line.encode()
 
     @staticmethod
     def build_from_route(request, route, path_variables: dict, framework_error_handler):
         try:
             response = HttpResponse.build_empty_status_response(request, route.content_type(), HttpStatus.OK, b"")
-            logger.debug(f"Executing route {route.route()} with url {request.url}")
+            logger.debug("Executing route %s with url %s", route.route(), request.url)
             try:
                 res = route.execute(request.clone(), response, path_variables)
             except Exception as e:
+                response.exception = e
+                if isinstance(e, HttpError):
+                    response.status = e.status
                 res = route.execute_error_handler(e, traceback.format_exc(), request.clone(), response, path_variables)
-            logger.debug(f"Successfully executed route {route.route()} with url {request.url}\nResult: {res}")
-            return HttpResponse(route.content_type(), response.http_version, response.status, str(res).encode() if type(res) is not bytes else res)
+            logger.debug("Successfully executed route %s with url %s\nResult: %s", route.route(), request.url, res)
+            return HttpResponse._apply_cache_policy(request, route, HttpResponse._from_route_result(route, response, res))
         except Exception as e:
-            from web_framework_v2.method import Method
-            logger.exception(e)
-            response = HttpResponse.build_empty_status_response(request, route.content_type(), HttpStatus.INTERNAL_SERVER_ERROR, b"")
-            res = Method.encode_result(framework_error_handler(e, traceback.format_exc(), request.clone(), response, path_variables), response)
-            return HttpResponse(route.content_type(), response.http_version, response.status, str(res).encode() if type(res) is not bytes else res)
+            return HttpResponse._build_framework_error(request, route, path_variables, framework_error_handler, e)
+
+    @staticmethod
+    async def build_from_route_async(request, route, path_variables: dict, framework_error_handler):
+        """
+        Same as build_from_route but awaits the endpoint, used for coroutine endpoints.
+        """
+        try:
+            response = HttpResponse.build_empty_status_response(request, route.content_type(), HttpStatus.OK, b"")
+            logger.debug("Executing async route %s with url %s", route.route(), request.url)
+            try:
+                res = await route.execute_async(request.clone(), response, path_variables)
+            except Exception as e:
+                response.exception = e
+                if isinstance(e, HttpError):
+                    response.status = e.status
+                res = route.execute_error_handler(e, traceback.format_exc(), request.clone(), response, path_variables)
+            logger.debug("Successfully executed async route %s with url %s\nResult: %s", route.route(), request.url, res)
+            return HttpResponse._apply_cache_policy(request, route, HttpResponse._from_route_result(route, response, res))
+        except Exception as e:
+            return HttpResponse._build_framework_error(request, route, path_variables, framework_error_handler, e)
+
+    @staticmethod
+    def _from_route_result(route, response, res):
+        if is_stream(res):
+            route_response = HttpResponse(route.content_type(), response.http_version, response.status, b"")
+            route_response.set_stream(res, response.stream_buffer_size)
+        else:
+            route_response = HttpResponse(
+                route.content_type(), response.http_version, response.status, str(res).encode() if type(res) is not bytes else res
+            )
+        route_response.headers = response.headers
+        route_response.last_modified = response.last_modified
+        route_response.exception = response.exception
+        return route_response
+
+    @staticmethod
+    def _apply_cache_policy(request, route, response):
+        if response.status != HttpStatus.OK:
+            return response
+
+        if route.cache_control() is not None:
+            response.headers.setdefault("Cache-Control", route.cache_control())
+        if (route.etag() or response.last_modified is not None) and response.stream is None:
+            response.apply_validators(request, body_etag(response.html) if route.etag() else None)
+        return response
+
+    @staticmethod
+    def _build_framework_error(request, route, path_variables: dict, framework_error_handler, exception: Exception):
+        logger.exception(exception)
+        response = HttpResponse.build_empty_status_response(request, route.content_type(), HttpStatus.INTERNAL_SERVER_ERROR, b"")
+        response.exception = exception
+        res = route.encode_result(framework_error_handler(exception, traceback.format_exc(), request.clone(), response, path_variables), response)
+        return HttpResponse._from_route_result(route, response, res)
 
     @staticmethod
     def build_empty_status_response(request, content_type: ContentType, status: HttpStatus, additional_info: bytes):
@@ -59,19 +310,23 @@ class HttpResponse:
         return HttpResponse(content_type, request.http_version, status, additional_info)
 
     @staticmethod
-    def build_from_file(request, path: str):
+    def build_from_file(request, path: str, content_type: ContentType = None, size: int = None):
+        """
+        Builds a response streaming the file at path, the file is not read into memory.
+        :param size: the size of the file, taken from os.stat when not given
+        """
         try:
             if not os.path.isfile(path):
-                logger.debug(f"Failed to find static file at {path}")
+                logger.debug("Failed to find static file at %s", path)
                 return HttpResponse(ContentType.text, request.http_version, HttpStatus.NOT_FOUND, bytes())
-            else:
-                extension = os.path.splitext(path)[1][1::]
-                content_type = ContentType[extension]
-                html: bytes
-                logger.debug(f"Building response using static file at {path}")
-                with open(path, 'rb') as file:
-                    html = file.read() + b"\r\n\r\n"
-                return HttpResponse(content_type, request.http_version, HttpStatus.OK, html)
+
+            if content_type is None:
+                extension = os.path.splitext(path)[1][1::].lower()
+                content_type = ContentType[extension] if extension in ContentType.__members__ else ContentType.bin
+
+            response = HttpResponse(content_type, request.http_version, HttpStatus.OK, bytes())
+            response.set_file(path, 0, size if size is not None else os.stat(path).st_size)
+            return response
         except Exception as e:
             logger.exception(e)
             return HttpResponse(ContentType.text, request.http_version, HttpStatus.INTERNAL_SERVER_ERROR, traceback.format_exc().encode())
@@ -1,102 +1,212 @@
 import logging
 import socket
 import threading
+from time import perf_counter
 from typing import Optional
 
+from web_framework_v2.body_reader import RequestBodyReader
+from web_framework_v2.http import ContentType, HttpError, HttpStatus
+from web_framework_v2.metrics import ServerMetrics
 from web_framework_v2.parser import RequestParser
-from web_framework_v2.restartable_timer import RestartableTimer
+from web_framework_v2.request_reader import RequestReader
+from web_framework_v2.timer_wheel import TimerWheel
+from web_framework_v2.timing import RequestTiming, TimingHooks
 
 logger = logging.getLogger(__name__)
 
 
 class HttpClient:
-    def __init__(self, client_socket: socket.socket, address, response_builder):
+    def __init__(self, client_socket: socket.socket, address, response_builder, request_parser=RequestParser, timer_wheel: TimerWheel = None):
+        """
+        :param request_parser: the parser class used to turn received bytes into a HttpRequest
+        :param timer_wheel: the wheel tracking the idle, header and body read timeouts of the connection
+        """
         self.socket = client_socket
         self.address = address
         self.response_builder = response_builder
-        self.response_receive_time = 0
         self.is_closed = False
         self.response_handler_thread = threading.Thread(target=self.request_handler)
         self.byte_fetch_amount = 1024 * 8
+        self.request_reader = RequestReader(request_parser, self.byte_fetch_amount)
+        self.timer_wheel = timer_wheel if timer_wheel is not None else TimerWheel.shared()
         self.default_keep_alive_timeout = 10
-        self.keep_alive_timer: Optional[RestartableTimer] = None
+        self.header_read_timeout = 10
+        self.body_read_timeout = 30
+        self.body_spool_size = 1024 * 1024
+        self.keep_alive_timeout: Optional[float] = None
+        self.timing_hooks: Optional[TimingHooks] = None
+        self.metrics: Optional[ServerMetrics] = None
         self.connection_count = 0
+        self.timing: Optional[RequestTiming] = None  # Timing of a request received by the poller of WorkerPoolHttpServer
         self.in_session = False
 
     def start(self):
         self.response_handler_thread.start()
 
     def close(self):
-        self.socket.shutdown(socket.SHUT_WR)
-        logger.debug(f"Closing client socket and exiting client thread {threading.current_thread()}")
-        exit()
+        if self.is_closed:
+            return
+
+        self.is_closed = True
+        self.timer_wheel.cancel(self)
+        if self.metrics is not None:
+            self.metrics.active_connections.dec()
+            if self.in_session:
+                self.metrics.keep_alive_sessions.dec()
+        logger.debug("Closing client socket from thread %s", threading.current_thread())
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # The peer already closed the connection
+        self.socket.close()
 
     def send(self, data: bytes):
         self.socket.sendall(data)
 
     def request_handler(self):
+        timing = None
         while not self.is_closed:
-            data: bytes = self.socket.recv(self.byte_fetch_amount)
-            if data == '':  # received FIN close socket.
+            timed = self.timing_hooks is not None and self.timing_hooks.enabled()
+            try:
+                # Timing starts before the first read of each request, or before parsing a pipelined one
+                if timed and timing is None:
+                    timing = RequestTiming()
+                started = perf_counter() if timing is not None else 0
+                request = self.request_reader.next_request()
+                if timing is not None:
+                    timing.since("parse", started)
+                if request is None:
+                    self.timer_wheel.reset(self, self.current_timeout(), self.on_timeout)
+                    started = perf_counter() if timing is not None else 0
+                    received = self.request_reader.recv_into(self.socket)
+                    if received == 0:  # received FIN close socket.
+                        return self.close()
+                    if self.metrics is not None:
+                        self.metrics.received_bytes.inc(amount=received)
+                    if timing is not None:
+                        timing.since("read", started)
+                    continue
+            except OSError:  # closed by the timer wheel
+                return self.close()
+            except HttpError as e:
+                logger.debug("Rejecting request from %s: %s", self.address, e)
+                try:
+                    self.send(HttpClient.error_response(e.status))
+                except OSError:
+                    pass
+                return self.close()
+            except ValueError as e:
+                logger.debug("Received a malformed request from %s: %s", self.address, e)
                 return self.close()
 
-            if self.keep_alive_timer is not None:
-                self.keep_alive_timer.reset()
-
-            request_parser: RequestParser
-            split_at_2crlf = data.split(b'\r\n\r\n')
-            self.connection_count += 1
-
-            while len(split_at_2crlf) != 2:
-                fetched = self.socket.recv(self.byte_fetch_amount)
-                if fetched == '':  # received FIN close socket.
-                    return self.close()
-
-                data += fetched
-                split_at_2crlf = fetched.split(b'\r\n\r\n')
-
-            request_parser = RequestParser(data)
-            request = request_parser.parse()
-            body_data = split_at_2crlf[1]
-
-            missingData = int(request.headers.get("content-length", 0)) - len(request.body) - len(body_data)
-            missingCounter = missingData
-            while missingCounter > 0:
-                fetch_amount = max(0, min(self.byte_fetch_amount, missingCounter))
-                fetched_data = self.socket.recv(fetch_amount)
-                if fetched_data == '':  # received FIN close socket.
-                    return self.close()
-
-                body_data += fetched_data
-                missingCounter -= len(fetched_data)
-
-            request.body = body_data
-
-            logger.debug(f"Finished building request object {request}")
-            response = self.response_builder(request)
-            logger.debug(f"Finished building response object {response}")
-            response_data = response.data()
-            self.send(response_data)
-
-            if 'connection' in request.headers:
-                connection = request.headers['connection'].lower().strip()
-                if connection == 'keep-alive' and not self.in_session:
-                    timeout = self.default_keep_alive_timeout
-                    if 'keep-alive' in request.headers:
-                        keep_alive = HttpClient.parse_header_for_parameters(request.headers['keep-alive'])
-                        try:
-                            timeout = int(keep_alive['timeout']) if 'timeout' in keep_alive else self.default_keep_alive_timeout
-                        except:
-                            timeout = self.default_keep_alive_timeout
-
-                    self.keep_alive_timer = RestartableTimer(timeout, self.keep_alive_timeout)
-                    self.keep_alive_timer.run()
-                    self.in_session = True
+            self.timer_wheel.cancel(self)
+            if not self.serve(request, timing):
+                return
+            timing = None
+
+    def serve(self, request, timing: Optional[RequestTiming] = None) -> bool:
+        """
+        Builds and sends the response of a parsed request.
+        :return: True when the connection is kept alive for the next request, it was closed otherwise
+        """
+        self.connection_count += 1
+        if self.request_reader.is_streaming():
+            request.body_stream = RequestBodyReader(self.pull_body, spool_size=self.body_spool_size)
+
+        logger.debug("Finished building request object %s", request)
+        request.timing = timing
+        request.client_address = self.address
+        response = self.response_builder(request)
+        logger.debug("Finished building response object %s", response)
+        if timing is not None:
+            self.timing_hooks.before_send(response, timing)
+            started = perf_counter()
+        try:
+            response.send(self.socket)
+        except OSError:  # The client disconnected before receiving the response
+            self.close()
+            return False
+        if timing is not None:
+            timing.since("send", started)
+            self.timing_hooks.report(request, response, timing)
 
-            if self.in_session:
-                continue
+        if self.request_reader.is_streaming():  # The endpoint did not read the whole body
+            self.close()
+            return False
 
+        timeout = HttpClient.requested_keep_alive_timeout(request, self.default_keep_alive_timeout)
+        if timeout is None or response.requires_close():
             self.close()
+            return False
+
+        if not self.in_session:
+            self.keep_alive_timeout = timeout
+            self.in_session = True
+            if self.metrics is not None:
+                self.metrics.keep_alive_sessions.inc()
+        return True
+
+    def pull_body(self, size: int) -> bytes:
+        """
+        Reads up to size bytes of a streamed request body, receiving from the socket when nothing is buffered.
+        """
+        while True:
+            data = self.request_reader.read_body(size)
+            if data is not None:
+                return data
+
+            self.timer_wheel.reset(self, self.body_read_timeout, self.on_timeout)
+            try:
+                received = self.request_reader.recv_into(self.socket)
+            finally:
+                self.timer_wheel.cancel(self)
+            if received == 0:
+                raise ConnectionError("The client closed the connection before sending the whole body")
+            if self.metrics is not None:
+                self.metrics.received_bytes.inc(amount=received)
+
+    @staticmethod
+    def error_response(status: HttpStatus) -> bytes:
+        """
+        :return: an empty response with the given status that closes the connection
+        """
+        return (
+            f"HTTP/1.1 {status.value} {status.name}\r\n"
+            f"{ContentType.text}\r\n"
+            f"Connection: close\r\n"
+            f"Content-Length: 0\r\n\r\n"
+        ).encode()
+
+    def current_timeout(self):
+        """
+        :return: the timeout of the next read, based on the progress of the current request
+        """
+        if self.request_reader.is_reading_body():
+            return self.body_read_timeout
+        elif self.request_reader.has_buffered_data() or not self.in_session:
+            return self.header_read_timeout
+
+        return self.keep_alive_timeout
+
+    @staticmethod
+    def requested_keep_alive_timeout(request, default_timeout):
+        """
+        :return: the keep alive timeout of the connection or None if it should be closed after the response.
+                 HTTP/1.1 connections are persistent unless the client sent "Connection: close"
+        """
+        connection = request.headers.get('connection', '').lower().strip()
+        if connection == 'close' or (connection != 'keep-alive' and request.http_version.strip() != 'HTTP/1.1'):
+            return None
+
+        timeout = default_timeout
+        if 'keep-alive' in request.headers:
+            keep_alive = HttpClient.parse_header_for_parameters(request.headers['keep-alive'])
+            try:
+                timeout = int(keep_alive['timeout']) if 'timeout' in keep_alive else default_timeout
+            except:
+                timeout = default_timeout
+
+        return timeout
 
     @staticmethod
     def parse_header_for_parameters(header) -> dict:
@@ -124,7 +234,6 @@ class HttpClient:
 
         return parameters
 
-    def keep_alive_timeout(self):
-        self.keep_alive_timer.cancel()
-        self.keep_alive_timer = None
+    def on_timeout(self):
+        logger.debug("Connection with %s timed out", self.address)
         self.close()
@@ -1,6 +1,7 @@
 import logging
 import socket
 import threading
+from time import perf_counter
 
 from web_framework_v2.http import HttpResponse
 from web_framework_v2.http_client import HttpClient
@@ -9,39 +10,161 @@ logger = logging.getLogger(__name__)
 
 
 class HttpServer:
-    def __init__(self, framework, host, port):
+    def __init__(self, framework, host, port, backlog: int = 128):
+        """
+        :param backlog: the amount of unaccepted connections the OS queues before refusing new ones
+        """
         self._framework = framework
         self._ip = (host, port)
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._client_listen_thread = threading.Thread(target=self.__client_listener)
+        self._backlog = backlog
+        self._socket = None  # Bound in start, so servers that are replaced before starting hold no socket
+        self._owns_socket = True
+        self._client_listen_thread = threading.Thread(target=self._serve)
 
-    def start(self):
-        self._socket.bind(self._ip)
-        self._socket.listen(2)
+    def start(self, listen_socket: socket.socket = None):
+        """
+        :param listen_socket: an already bound and listening socket to accept connections from, used by pre-forked workers
+        """
+        if listen_socket is not None:
+            self._socket = listen_socket
+            self._owns_socket = False
+        else:
+            self._socket = HttpServer.create_listen_socket(self._ip, self._backlog)
         self._client_listen_thread.start()
         logger.info("The server is active and listening...")
 
-    def __client_listener(self):
+    def join(self, timeout=None):
+        self._client_listen_thread.join(timeout)
+
+    @staticmethod
+    def create_listen_socket(ip, backlog: int, reuse_port=False) -> socket.socket:
+        """
+        Creates a bound and listening socket.
+        :param reuse_port: allow several processes to bind the same address, the kernel balances connections between them
+        """
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listen_socket.bind(ip)
+        listen_socket.listen(backlog)
+        return listen_socket
+
+    @staticmethod
+    def disable_nagle(client_socket):
+        """
+        Sends every response as soon as it is written. With Nagle's algorithm a response written while the previous one
+        is not acknowledged yet waits for the client's delayed ACK, stalling pipelined and back to back responses by ~40ms.
+        asyncio only does this itself for sockets created with proto IPPROTO_TCP, which accepted sockets are not.
+        """
+        try:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass  # Not a TCP socket
+
+    def _serve(self):
         while self._framework.is_active():
-            client_socket, address = self._socket.accept()
-            logger.debug(f"Accepted client connection from {address}")
-            client = HttpClient(client_socket, address, lambda req: self.response_builder(req))
-            client.start()
+            try:
+                client_socket, address = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                if not self._framework.is_active():
+                    break  # The listening socket was closed by shutdown
+                raise
+
+            logger.debug("Accepted client connection from %s", address)
+            self._dispatch(client_socket, address)
 
         self.shutdown()
 
+    def _dispatch(self, client_socket, address):
+        client = self._create_client(client_socket, address)
+        client.start()
+
+    def _create_client(self, client_socket, address) -> HttpClient:
+        HttpServer.disable_nagle(client_socket)
+        client = HttpClient(client_socket, address, lambda req: self.response_builder(req), self._framework.request_parser(), self._framework.timer_wheel())
+        client.default_keep_alive_timeout = self._framework.keep_alive_timeout
+        client.header_read_timeout = self._framework.header_timeout
+        client.body_read_timeout = self._framework.body_timeout
+        client.body_spool_size = self._framework.body_spool_size
+        client.request_reader.max_body_size = self._framework.max_body_size
+        client.request_reader.stream_body = self.streams_body
+        client.timing_hooks = self._framework.timing_hooks()
+        client.metrics = self._framework.server_metrics()
+        if client.metrics is not None:
+            client.metrics.active_connections.inc()
+        return client
+
+    def streams_body(self, request) -> bool:
+        """
+        :return: True when the endpoint of the request reads its body on demand, the body is then not buffered
+        """
+        route, _ = request.endpoint = self._framework.get_endpoint(request)  # Kept for building the response
+        return route is not None and route.streams_body()
+
+    def find_endpoint(self, request):
+        """
+        :return: (route, path variables) of the request, looked up unless streams_body already did
+        """
+        if request.endpoint is None:
+            request.endpoint = self._framework.get_endpoint(request)
+        return request.endpoint
+
     def response_builder(self, request):
-        logger.debug(f"Attempting to find a endpoint using {request.url}")
-        route, path_variables = self._framework.get_endpoint(request)
+        logger.debug("Attempting to find a endpoint using %s", request.url)
+        metrics = self._framework.server_metrics()
+        started = perf_counter() if request.timing is not None or metrics is not None else 0
+        route, path_variables = self.find_endpoint(request)
+        if request.timing is not None:
+            request.timing.since("route", started)
 
+        response = self.build_response(request, route, path_variables)
+        if metrics is not None:
+            metrics.record(request, route, response, perf_counter() - started)
+        return response
+
+    def build_response(self, request, route, path_variables):
         if route is not None:
-            logger.debug(f"Found route {route}")
-            return HttpResponse.build_from_route(request, route, path_variables, self._framework.error_handler)
+            logger.debug("Found route %s", route)
+            if route.cache_policy() is not None:
+                return self._framework.response_cache().fetch(
+                    request, self.cache_key(request, route), route.cache_policy().ttl,
+                    lambda build_request: self.build_route_response(build_request, route, path_variables)
+                )
+            return self.build_route_response(request, route, path_variables)
         else:
             logger.debug("Failed to find endpoint, building response using static folder.")
-            path = self._framework.static_folder() + (self._framework.static_url_path() if request.url == "/" else request.url)
-            return HttpResponse.build_from_file(request, path)
+            return self._framework.static_files().build_response(request)
+
+    def build_route_response(self, request, route, path_variables):
+        profiler = self._framework.profiler()
+        session = profiler.begin(request, route) if profiler is not None else None
+        response = None
+        try:
+            response = HttpResponse.build_from_route(request, route, path_variables, self._framework.error_handler)
+        finally:
+            if session is not None:  # Ends the session even when building failed, it would otherwise be sampled forever
+                profiler.end(session, response)
+        return self.compress(request, response)
+
+    def cache_key(self, request, route):
+        compression = self._framework.compression()
+        encoding = compression.negotiate(request.headers.get("accept-encoding", None)) if compression is not None else None
+        return route.cache_policy().key(request, route, encoding)
+
+    def compress(self, request, response):
+        compression = self._framework.compression()
+        return compression.apply(request, response) if compression is not None else response
 
     def shutdown(self):
-        self._socket.shutdown(socket.SHUT_WR)
-        exit(0)
+        if self._socket is None:
+            return
+
+        if self._owns_socket:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Not connected or already shut down
+        self._socket.close()
@@ -0,0 +1,51 @@
+_NOT_DECODED = object()
+
+
+class LazyBody:
+    """
+    A request body that is decoded when it is first accessed, later accesses reuse the decoded value.
+    Attribute, item, membership, iteration, length, truth and equality access are forwarded to the decoded value,
+    value() returns the decoded value itself.
+    """
+    __slots__ = ("_decode", "_value")
+
+    def __init__(self, decode):
+        """
+        :param decode: callable() returning the decoded body
+        """
+        self._decode = decode
+        self._value = _NOT_DECODED
+
+    def value(self):
+        if self._value is _NOT_DECODED:
+            self._value = self._decode()
+            self._decode = None
+        return self._value
+
+    def is_decoded(self) -> bool:
+        return self._value is not _NOT_DECODED
+
+    def __getattr__(self, name):
+        return getattr(self.value(), name)
+
+    def __getitem__(self, key):
+        return self.value()[key]
+
+    def __contains__(self, item):
+        return item in self.value()
+
+    def __iter__(self):
+        return iter(self.value())
+
+    def __len__(self):
+        return len(self.value())
+
+    def __bool__(self):
+        return bool(self.value())
+
+    def __eq__(self, other):
+        return self.value() == (other.value() if isinstance(other, LazyBody) else other)
+
+    def __repr__(self):
+        # Logging a LazyBody must not decode it
+        return f"LazyBody({self._value!r})" if self.is_decoded() else "LazyBody(<not decoded>)"
@@ -1,97 +1,241 @@
+import asyncio
 import inspect
 import logging
-
-import jsonpickle
+from time import perf_counter
 
 import web_framework_v2.annotations
 import web_framework_v2.decorator as decorator_module
 import web_framework_v2.http.http_request as http_request
 import web_framework_v2.http.http_response as http_response
-
-from web_framework_v2.http import ContentType
+from web_framework_v2.http.body_stream import is_stream
+from web_framework_v2.http.http_error import HttpError
+from web_framework_v2.lazy_body import LazyBody
+from web_framework_v2.serializers import SerializerRegistry, default_serializers
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()  # Marks an argument that is left out of the call
+_DEFAULT_REQUEST_BODY = web_framework_v2.annotations.RequestBody()
 
-class Method:
-    encodable_content_types = [ContentType.json, ContentType.text]
 
-    def __init__(self, method):
+class Method:
+    def __init__(self, method, serializer=None, serializers: SerializerRegistry = None):
         """
         Wraps a web_framework_v2 function that has a route into a class that handles
         the execution of the function.
+        The way every argument is resolved is compiled once into a call plan, so no reflection happens per request.
         :param method: the function
+        :param serializer: encodes the results of this function regardless of the content type
+        :param serializers: the registry results are encoded with when no serializer is given
         """
         self._method = method
+        self._serializer = serializer
+        self._serializers = serializers if serializers is not None else default_serializers
+        self._is_coroutine = inspect.iscoroutinefunction(method)
+        self._call_plan = Method.compile_call_plan(method) if method is not None else []
+        self._decorator_request_body = Method._find_request_body(method) if method is not None else None
 
-    def execute(self, request: http_request.HttpRequest, response: http_response.HttpResponse):
-        argspec = inspect.getfullargspec(self._method)
-        args_len = len(argspec.args)
-        defaults_len = len(argspec.defaults) if argspec.defaults is not None else 0
-        kwargs = dict()
-        defaults_map = dict()
-        decorator_result_map = dict()
+    def is_coroutine(self):
+        return self._is_coroutine
 
-        # Build defaults map
-        if defaults_len > 0:
-            for i, default_value in enumerate(argspec.defaults):
-                defaults_map[argspec.args[args_len - defaults_len + i]] = default_value
+    def streams_body(self):
+        """
+        :return: True when the body is read on demand by the function instead of being buffered
+        """
+        return self._decorator_request_body is not None and self._decorator_request_body.streams()
 
-        # Execute decorator functionality
-        if hasattr(self._method, "decorators"):
-            decorators = getattr(self._method, "decorators", [])
-            logger.debug(f"Method's decorators: {decorators}")
-            request_body = list(filter(lambda annot: type(annot) is web_framework_v2.annotations.RequestBody, argspec.annotations.values()))
+    def spools_body(self):
+        return self._decorator_request_body is not None and self._decorator_request_body.spool
 
-            if len(request_body) > 0:
-                request_body = request_body[0].value_generator(request)
-            else:
-                request_body = web_framework_v2.annotations.RequestBody().value_generator(request)
+    def execute(self, request: http_request.HttpRequest, response: http_response.HttpResponse):
+        timing = request.timing
+        started = perf_counter() if timing is not None else 0
+        should_execute, value = self._build_kwargs(request, response)
+        if timing is not None:
+            started = timing.since("decorators", started)
+        if not should_execute:
+            return value
+
+        method_result = self._method(**value)
+        if self._is_coroutine:
+            # No event loop drives this thread, run the coroutine to completion on a private one
+            method_result = asyncio.run(method_result)
+        if timing is not None:
+            started = timing.since("handler", started)
+        if is_stream(method_result):
+            return method_result  # The chunks are sent as they are produced
+        return self._timed_encode(method_result, response, timing, started)
+
+    async def execute_async(self, request: http_request.HttpRequest, response: http_response.HttpResponse):
+        timing = request.timing
+        started = perf_counter() if timing is not None else 0
+        if getattr(self._method, "decorators", None) is not None:
+            # Decorators are synchronous and may block (token decoding, lookups), like regular endpoints they run on an executor
+            should_execute, value = await asyncio.get_running_loop().run_in_executor(None, self._build_kwargs, request, response)
+        else:
+            should_execute, value = self._build_kwargs(request, response)
+        if timing is not None:
+            started = timing.since("decorators", started)
+        if not should_execute:
+            return value
+
+        method_result = self._method(**value)
+        if inspect.isawaitable(method_result):
+            method_result = await method_result
+        if timing is not None:
+            started = timing.since("handler", started)
+        if is_stream(method_result):
+            return method_result
+        return self._timed_encode(method_result, response, timing, started)
+
+    def _timed_encode(self, result, response: http_response.HttpResponse, timing, started: float):
+        if timing is None:
+            return self.encode(result, response)
+
+        encoded = self.encode(result, response)
+        timing.since("encode", started)
+        return encoded
+
+    def _build_kwargs(self, request: http_request.HttpRequest, response: http_response.HttpResponse):
+        """
+        Builds the keyword arguments the wrapped function is called with by executing the call plan.
+        :return: (True, kwargs) or (False, on_fail result) when a decorator stopped the execution
+        """
+        decorator_result_map = None
+        lazy_body = request.lazy_body  # Set when the endpoint's middleware may already have decoded the body
+
+        # Execute decorator functionality, decorators are read per call since they are attached after the route is registered
+        decorators = getattr(self._method, "decorators", None)
+        if decorators is not None:
+            logger.debug("Method's decorators: %s", decorators)
+            decorator_result_map = dict()
+            if lazy_body is None:
+                lazy_body = self.lazy_body(request)
+            request_body = None if self.streams_body() else lazy_body
 
             decorator: decorator_module.Decorator
             for decorator in decorators:
                 should_exec, result, data = \
                     decorator.should_execute_endpoint(request, request_body)
                 if not should_exec:
-                    logger.debug(f"Decorator failed. Calling on_fail. {decorator}")
-                    return decorator.on_fail(request, response, data)
+                    logger.debug("Decorator failed. Calling on_fail. %s", decorator)
+                    return False, decorator.on_fail(request, response, data)
 
                 if result is not None:
                     decorator_result_map[type(decorator)] = result  # Used when building kwargs to set result based on annotation
                 elif decorator.fail_on_null_result:
-                    logger.debug(f"Decorator returned null result and is set to fail on null result. Calling on_fail. {decorator}")
-                    return decorator.on_fail(request, response, data)
-
-        # Build kwargs
-        if args_len > 0 and len(argspec.annotations) > 0:
-            for parameter_name, annotation in argspec.annotations.items():
-                if issubclass(type(annotation), web_framework_v2.annotations.Annotation):
-                    kwargs[parameter_name] = annotation.value_generator(request)
-                    if kwargs[parameter_name] is None and parameter_name in defaults_map:
-                        kwargs[parameter_name] = defaults_map[parameter_name]
+                    logger.debug("Decorator returned null result and is set to fail on null result. Calling on_fail. %s", decorator)
+                    return False, decorator.on_fail(request, response, data)
+
+        if lazy_body is not None and self._decorator_request_body is not None:
+            if decorator_result_map is None:
+                decorator_result_map = dict()
+            decorator_result_map[self._decorator_request_body] = lazy_body  # Reused for the endpoint's argument
+
+        kwargs = dict()
+        for parameter_name, resolver in self._call_plan:
+            value = resolver(request, response, decorator_result_map)
+            if value is not _MISSING:
+                kwargs[parameter_name] = value
+
+        logger.debug("Finished building method kwargs. %s", kwargs)
+        return True, kwargs
+
+    def lazy_body(self, request: http_request.HttpRequest) -> LazyBody:
+        """
+        :return: the body handed to middleware and decorators, it is only decoded (see _decorator_body) once accessed
+        """
+        return LazyBody(lambda: self._decorator_body(request))
+
+    def _decorator_body(self, request: http_request.HttpRequest):
+        """
+        :return: the request body handed to decorators, decoded like the endpoint's RequestBody or as a json map.
+        Bodies the endpoint did not declare are passed raw when they are not json.
+        """
+        if self._decorator_request_body is not None:
+            if self._decorator_request_body.streams():
+                return None  # Reading the body here would consume the stream before the endpoint gets it
+            return self._decorator_request_body.value_generator(request)
+
+        try:
+            return _DEFAULT_REQUEST_BODY.value_generator(request)
+        except HttpError:
+            return request.body
+
+    @staticmethod
+    def compile_call_plan(method):
+        """
+        Compiles the ordered list of (parameter name, resolver) used to build the arguments of method.
+        A resolver is called with (request, response, decorator results) and returns the argument or _MISSING to omit it.
+        """
+        call_plan = []
+        for parameter in inspect.signature(method).parameters.values():
+            if parameter.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD):
+                continue
+
+            resolver = Method._compile_resolver(
+                parameter.annotation,
+                parameter.default if parameter.default is not inspect.Parameter.empty else _MISSING
+            )
+            if resolver is not None:
+                call_plan.append((parameter.name, resolver))
+
+        return call_plan
+
+    @staticmethod
+    def _compile_resolver(annotation, default):
+        if type(annotation) is web_framework_v2.annotations.RequestBody and not annotation.streams():
+            value_generator = annotation.value_generator
+
+            def resolve_request_body(request, response, decorator_results):
+                # The body may already have been decoded for the middleware or decorators
+                if decorator_results is not None and annotation in decorator_results:
+                    value = decorator_results[annotation].value()
                 else:
-                    if annotation is http_request.HttpRequest or type(annotation) is http_request.HttpRequest:
-                        kwargs[parameter_name] = request
-                        defaults_map.pop(parameter_name, None)
-                    elif annotation is http_response.HttpResponse or type(annotation) is http_response.HttpResponse:
-                        kwargs[parameter_name] = response
-                        defaults_map.pop(parameter_name, None)
-                    elif annotation in decorator_result_map:
-                        kwargs[parameter_name] = decorator_result_map[annotation]
-                        defaults_map.pop(parameter_name, None)
-
-        # Build defaults
-        if defaults_len > 0:
-            for parameter_name, default_value in defaults_map.items():
-                if parameter_name in kwargs:
-                    continue
-
-                kwargs[parameter_name] = default_value
-
-        logger.debug(f"Finished building method kwargs. {kwargs}")
-        method_result = self._method(**kwargs)
-        return Method.encode_result(method_result, response)
+                    value = value_generator(request)
+                return value if value is not None or default is _MISSING else default
+
+            return resolve_request_body
+        elif isinstance(annotation, web_framework_v2.annotations.Annotation):
+            value_generator = annotation.value_generator
+            if default is _MISSING:
+                return lambda request, response, decorator_results: value_generator(request)
+
+            def resolve_annotation(request, response, decorator_results):
+                value = value_generator(request)
+                return value if value is not None else default
+
+            return resolve_annotation
+        elif annotation is http_request.HttpRequest or type(annotation) is http_request.HttpRequest:
+            return lambda request, response, decorator_results: request
+        elif annotation is http_response.HttpResponse or type(annotation) is http_response.HttpResponse:
+            return lambda request, response, decorator_results: response
+        elif isinstance(annotation, type) and issubclass(annotation, decorator_module.Decorator):
+            def resolve_decorator_result(request, response, decorator_results):
+                if decorator_results is not None and annotation in decorator_results:
+                    return decorator_results[annotation]
+                return default
+
+            return resolve_decorator_result
+        elif default is not _MISSING:
+            return lambda request, response, decorator_results: default
+
+        return None
+
+    @staticmethod
+    def _find_request_body(method):
+        for parameter in inspect.signature(method).parameters.values():
+            if type(parameter.annotation) is web_framework_v2.annotations.RequestBody:
+                return parameter.annotation
+
+        return None
+
+    def encode(self, result: object, response: http_response.HttpResponse):
+        return Method.encode_result(result, response, self._serializers, self._serializer)
 
     @staticmethod
-    def encode_result(result: object, response: http_response.HttpResponse):
-        return jsonpickle.encode(result, unpicklable=False) if response.content_type in Method.encodable_content_types else result
+    def encode_result(result: object, response: http_response.HttpResponse, serializers: SerializerRegistry = None, serializer=None):
+        if serializer is not None:
+            return serializer(result)
+
+        return (serializers if serializers is not None else default_serializers).serialize(result, response.content_type)
@@ -0,0 +1,244 @@
+import itertools
+import math
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+_SHARDS = 16
+_thread_shard = threading.local()
+_next_shard = itertools.count()
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _shard_index() -> int:
+    """
+    :return: the shard of the current thread, threads are spread over the shards round robin so that
+             concurrent updates rarely wait on the same lock
+    """
+    try:
+        return _thread_shard.index
+    except AttributeError:
+        _thread_shard.index = next(_next_shard) % _SHARDS
+        return _thread_shard.index
+
+
+class _Shard:
+    __slots__ = ("lock", "values")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # label values: value
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        """
+        :param labels: the names of the labels, values are passed positionally in the same order
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    @abstractmethod
+    def samples(self):
+        """
+        :return: list of (name suffix, label values, extra labels, value)
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, label_values, extra_labels, value in self.samples():
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values)] + extra_labels
+            lines.append(f"{self.name}{suffix}{'{' + ','.join(pairs) + '}' if len(pairs) > 0 else ''} {_format(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        """
+        A value that only goes up, updates are aggregated per thread shard and summed when read.
+        """
+        super().__init__(name, documentation, labels)
+        self._shards = [_Shard() for _ in range(_SHARDS)]
+
+    def inc(self, *label_values, amount: float = 1):
+        shard = self._shards[_shard_index()]
+        with shard.lock:
+            shard.values[label_values] = shard.values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return sum(shard.values.get(label_values, 0) for shard in self._shards)
+
+    def samples(self):
+        totals = {}
+        for shard in self._shards:
+            with shard.lock:
+                for label_values, value in shard.values.items():
+                    totals[label_values] = totals.get(label_values, 0) + value
+        if len(self.labels) == 0 and len(totals) == 0:
+            totals[()] = 0
+        return [("_total" if not self.name.endswith("_total") else "", label_values, [], value) for label_values, value in sorted(totals.items())]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        """
+        A value that goes up and down, such as the amount of open connections.
+        """
+        super().__init__(name, documentation, labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            return [("", label_values, [], value) for label_values, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        """
+        Counts observations in fixed buckets, e.g. request latencies in seconds.
+        :param buckets: the sorted upper bounds of the buckets, +Inf is added
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = [_Shard() for _ in range(_SHARDS)]
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        shard = self._shards[_shard_index()]
+        with shard.lock:
+            counts = shard.values.get(label_values, None)
+            if counts is None:
+                counts = shard.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]  # bucket counts, +Inf, sum
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self, *label_values):
+        """
+        :return: (bucket counts including +Inf, not cumulative, sum of the observations)
+        """
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard in self._shards:
+            with shard.lock:
+                shard_counts = shard.values.get(label_values, None)
+                if shard_counts is not None:
+                    counts = [count + shard_count for count, shard_count in zip(counts, shard_counts)]
+                    total += shard_counts[-1]
+        return counts, total
+
+    def samples(self):
+        label_sets = set()
+        for shard in self._shards:
+            with shard.lock:
+                label_sets.update(shard.values)
+
+        samples = []
+        for label_values in sorted(label_sets):
+            counts, total = self.snapshot(*label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(("_bucket", label_values, [f'le="{_format(bound)}"'], cumulative))
+            samples.append(("_sum", label_values, [], total))
+            samples.append(("_count", label_values, [], cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Holds metrics and renders them in the Prometheus text exposition format.
+        """
+        self._metrics = {}  # name: Metric
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            registered = self._metrics.get(metric.name, None)
+            if registered is not None:
+                if type(registered) is not type(metric) or registered.labels != metric.labels:
+                    raise ValueError(f"The metric {metric.name} is already registered with another type or labels")
+                return registered
+
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def get(self, name: str):
+        return self._metrics.get(name, None)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in list(self._metrics.values())) + "\n"
+
+
+class ServerMetrics:
+    def __init__(self, registry: MetricsRegistry):
+        """
+        The metrics the servers record about requests and connections.
+        """
+        self.registry = registry
+        self.requests = registry.counter("http_requests_total", "Requests served", ("method", "route", "status"))
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "Time from the endpoint lookup until the response was built", ("method", "route")
+        )
+        self.received_bytes = registry.counter("http_received_bytes_total", "Bytes received from clients")
+        self.response_bytes = registry.counter("http_response_body_bytes_total", "Bytes of response bodies with a known length")
+        self.active_connections = registry.gauge("http_active_connections", "Open client connections")
+        self.keep_alive_sessions = registry.gauge("http_keep_alive_sessions", "Connections that were kept alive after a response")
+        self.rejected_connections = registry.counter("http_rejected_connections_total", "Connections shed because every worker was busy")
+
+    def record(self, request, route, response, seconds: float):
+        """
+        :param route: the endpoint that built the response, None for static files
+        """
+        route_label = route.route() if route is not None else "static"
+        method = request.method.name if request.method is not None else "UNKNOWN"
+        self.requests.inc(method, route_label, str(int(response.status)))
+        self.latency.observe(seconds, method, route_label)
+        if response.stream is None:
+            self.response_bytes.inc(amount=response.content_length())
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
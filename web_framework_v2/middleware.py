@@ -0,0 +1,127 @@
+import asyncio
+import inspect
+
+
+class Middleware:
+    BEFORE = "before"
+    AFTER = "after"
+    AROUND = "around"
+
+    def __init__(self, kind: str, hook, prefix: str = "/"):
+        """
+        A hook executed around every endpoint whose route starts with prefix, outside of the endpoint's decorators.
+        before: hook(request, response), returning None continues the chain, any other value short-circuits it
+                and is encoded like a result of the endpoint
+        after: hook(request, response, result) with the encoded result, returning None keeps it and
+               any other value replaces it as it is
+        around: hook(request, response, proceed), proceed(request, response) runs the rest of the chain
+                and returns the encoded result, which the hook returns or replaces
+        request.lazy_body holds the request body as a LazyBody, decoded like the endpoint's RequestBody once accessed
+        and shared with its decorators and arguments.
+        Hooks may be coroutine functions, they are awaited on the loop for coroutine endpoints and run to completion otherwise.
+        Like decorators, hooks are part of building the response, so cache hits of endpoints using cache= skip them.
+        :param prefix: the route prefix the hook applies to, "/" for every endpoint
+        """
+        assert kind in (Middleware.BEFORE, Middleware.AFTER, Middleware.AROUND), f"Unknown middleware kind {kind}"
+        prefix = prefix if prefix.startswith("/") else "/" + prefix
+        self.kind = kind
+        self.hook = hook
+        self.prefix = prefix if prefix.endswith("/") else prefix + "/"
+
+    def applies_to(self, route: str) -> bool:
+        return route.startswith(self.prefix)
+
+    def wrap(self, next_step, encode):
+        """
+        :param next_step: callable(request, response) running the rest of the chain
+        :param encode: callable(result, response) encoding short-circuit results
+        :return: callable(request, response) running the hook and then next_step
+        """
+        hook = _sync_call(self.hook)
+        if self.kind == Middleware.BEFORE:
+            def before(request, response):
+                result = hook(request, response)
+                return next_step(request, response) if result is None else encode(result, response)
+
+            return before
+        elif self.kind == Middleware.AFTER:
+            def after(request, response):
+                result = next_step(request, response)
+                replacement = hook(request, response, result)
+                return result if replacement is None else replacement
+
+            return after
+
+        def around(request, response):
+            return hook(request, response, next_step)
+
+        return around
+
+    def wrap_async(self, next_step, encode):
+        """
+        Same as wrap for coroutine endpoints, next_step is a coroutine function and so is the returned step.
+        Synchronous around hooks only receive proceed's coroutine, so they can return it but not inspect its result.
+        """
+        hook = _async_call(self.hook)
+        if self.kind == Middleware.BEFORE:
+            async def before(request, response):
+                result = await hook(request, response)
+                return await next_step(request, response) if result is None else encode(result, response)
+
+            return before
+        elif self.kind == Middleware.AFTER:
+            async def after(request, response):
+                result = await next_step(request, response)
+                replacement = await hook(request, response, result)
+                return result if replacement is None else replacement
+
+            return after
+
+        async def around(request, response):
+            return await hook(request, response, next_step)
+
+        return around
+
+
+def compile_chain(middleware, handler, encode):
+    """
+    Composes the hooks once so executing the chain only costs a call per hook.
+    :param middleware: the Middleware applying to an endpoint, the first one is the outermost
+    :param handler: callable(request, response) executing the endpoint and returning its encoded result
+    :return: callable(request, response) running the whole chain
+    """
+    chain = handler
+    for entry in reversed(middleware):
+        chain = entry.wrap(chain, encode)
+    return chain
+
+
+def compile_chain_async(middleware, handler, encode):
+    """
+    Same as compile_chain with a coroutine function handler.
+    """
+    chain = handler
+    for entry in reversed(middleware):
+        chain = entry.wrap_async(chain, encode)
+    return chain
+
+
+def _sync_call(hook):
+    if not inspect.iscoroutinefunction(hook):
+        return hook
+
+    def call(*arguments):
+        # No event loop drives this thread, like coroutine endpoints the hook is run on a private one
+        return asyncio.run(hook(*arguments))
+
+    return call
+
+
+def _async_call(hook):
+    async def call(*arguments):
+        result = hook(*arguments)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    return call
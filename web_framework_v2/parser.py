@@ -1,6 +1,12 @@
 import logging
 
 from web_framework_v2.http import HttpMethod, HttpRequest
+from web_framework_v2.http.http_headers import HttpHeaders
+
+try:
+    import httptools
+except ImportError:
+    httptools = None
 
 logger = logging.getLogger(__name__)
 
@@ -9,22 +15,41 @@ class RequestParser:
     def __init__(self, request: bytes):
         """
         Efficiently parses a request into a HttpRequest object.
+        The request is split using bytes searches and header values are only decoded once they are accessed.
         :param request: the HTTP request received from the browser
         """
 
         self.request = request
         self.length = len(self.request)
-        self.cursor = 0
 
     def parse(self):
         try:
-            method = HttpMethod.__getitem__(self.extract_till_space())
-            url, query_parameters = self.parse_url()
-            url = RequestParser.format_url(url)
-            version = self.extract_till_carriage()
-            headers = self.parse_header_space()
-            self.skip_carriage()
-            body = self.request[self.cursor:]
+            request = self.request
+            line_end = request.find(b"\r\n")
+            if line_end == -1:
+                line_end = self.length
+
+            method_end = request.find(b" ", 0, line_end)
+            target_end = request.rfind(b" ", method_end + 1, line_end)
+            if method_end == -1 or target_end == -1:
+                raise ValueError("Malformed request line")
+
+            method = HttpMethod[request[:method_end].decode("latin-1")]
+            url, query_parameters = RequestParser.parse_target(request[method_end + 1:target_end].decode("latin-1"))
+            version = request[target_end + 1:line_end].decode("latin-1")
+
+            headers_start = min(line_end + 2, self.length)
+            headers_end = request.find(b"\r\n\r\n", line_end)
+            if headers_end == -1:
+                headers_end = body_start = self.length
+            elif headers_end == line_end:
+                headers_end = headers_start
+                body_start = line_end + 4
+            else:
+                body_start = headers_end + 4
+
+            headers = HttpHeaders(request[headers_start:headers_end])
+            body = bytes(request[body_start:])
 
             return HttpRequest(method, url, version, headers, query_parameters, body)
         except Exception as e:
@@ -32,118 +57,86 @@ class RequestParser:
             logger.exception(e)
             raise
 
-    def current(self):
-        if self.cursor >= self.length:
-            return None
-        return chr(self.request[self.cursor])
+    @staticmethod
+    def parse_target(target: str):
+        """
+        Splits a request target into a formatted url and its query parameters.
+        :return: url, {name: [values] or None} or None if the target has no query
+        """
+        path, question_mark, query = target.partition("?")
+        url = RequestParser.format_url(path)
+        if len(question_mark) == 0:
+            return url, None
 
-    def next(self):
-        if self.cursor + 1 >= self.length:
-            return None
-        return chr(self.request[self.cursor + 1])
+        return url, RequestParser.parse_query(query)
 
-    def parse_url(self):
-        url_buffer = ""
+    @staticmethod
+    def parse_query(query: str):
         query_parameters = {}
 
-        while self.current() != "?" and self.current() != " ":
-            url_buffer += self.current()
-            self.cursor += 1
-
-        if self.current() != "?":
-            return url_buffer, None
-
-        self.cursor += 1
-        curr_name = ""
-        searching_name = True
-        while self.current() != " ":
-            curr = self.current()
-            if curr == "&":
-                searching_name = True
-                if curr_name not in query_parameters and curr_name != "":
-                    query_parameters[curr_name] = None
-                curr_name = ""
-                self.cursor += 1
-                continue
-            elif curr == "=":
-                searching_name = False
-                self.cursor += 1
-                continue
-
-            if searching_name:
-                curr_name += curr
-                self.cursor += 1
-            else:
-                values_str = ""
-                while self.current() != "&" and self.current() != " ":
-                    values_str += self.current()
-                    self.cursor += 1
-                curr_value = values_str.split(",")
-                query_parameters[curr_name] = curr_value
-
-        if curr_name not in query_parameters:
-            query_parameters[curr_name] = None
-        self.cursor += 1
-        return url_buffer, query_parameters
-
-    def parse_header_space(self):
-        headers = {}
+        for parameter in query.split("&"):
+            name, _, value = parameter.partition("=")
+            if len(value) > 0:
+                query_parameters[name] = value.split(",")
+            elif len(name) > 0 and name not in query_parameters:
+                query_parameters[name] = None
 
-        while self.skip_carriage() < 2:
-            header = self.extract_till_carriage()
-            name = ""
-            idx = 0
+        return query_parameters
 
-            while header[idx] != ":":
-                name += header[idx]
-                idx += 1
-            idx += 1
-            while header[idx] == " ":
-                idx += 1
-            value = header[idx:]
-            headers[name.lower()] = value
+    @staticmethod
+    def format_url(format_url: str):
+        new_url = ""
+        if len(format_url) == 0 or format_url[0] != '/':
+            new_url += '/'
 
-        return headers
+        new_url += format_url
+        if new_url[-1] != '/':
+            new_url += '/'
 
-    def extract_till_space(self):
-        buffer = ""
-        while self.current() != " ":
-            buffer += self.current()
-            self.cursor += 1
+        return new_url
 
-        self.cursor += 1
-        return buffer
 
-    def extract_till_carriage(self):
-        buffer = ""
+class HttptoolsRequestParser:
+    def __init__(self, request: bytes):
+        """
+        Parses a request using the C accelerated httptools parser.
+        Only usable when httptools is installed.
+        :param request: the HTTP request received from the browser
+        """
+        assert httptools is not None, "httptools must be installed to use HttptoolsRequestParser"
 
-        while self.cursor + 4 <= self.length:
-            if self.current() == '\r' \
-                    and self.next() == '\n':
-                return buffer
+        self.request = request
+        self._url = b""
+        self._headers = {}
+        self._body = []
 
-            buffer += self.current()
-            self.cursor += 1
+    def on_url(self, url: bytes):
+        self._url += url
 
-        return buffer
+    def on_header(self, name: bytes, value: bytes):
+        self._headers[name.decode("latin-1").lower()] = value
 
-    def skip_carriage(self):
-        match_count = 0
+    def on_body(self, body: bytes):
+        self._body.append(body)
 
-        while self.current() == "\r" and self.next() == "\n":
-            self.cursor += 2
-            match_count += 1
+    def parse(self):
+        try:
+            parser = httptools.HttpRequestParser(self)
+            parser.feed_data(bytes(self.request))
 
-        return match_count
+            method = HttpMethod[parser.get_method().decode("latin-1")]
+            url, query_parameters = RequestParser.parse_target(self._url.decode("latin-1"))
+            version = "HTTP/" + parser.get_http_version()
 
-    @staticmethod
-    def format_url(format_url: str):
-        new_url = ""
-        if format_url[0] != '/':
-            new_url += '/'
+            return HttpRequest(method, url, version, HttpHeaders(fields=self._headers), query_parameters, b"".join(self._body))
+        except Exception as e:
+            logger.error(self.request)
+            logger.exception(e)
+            raise
 
-        new_url += format_url
-        if new_url[-1] != '/':
-            new_url += '/'
 
-        return new_url
+def default_parser():
+    """
+    :return: the fastest request parser available
+    """
+    return HttptoolsRequestParser if httptools is not None else RequestParser
@@ -0,0 +1,178 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from web_framework_v2.http_server import HttpServer
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkSupervisor:
+    def __init__(self, framework, workers: int, ip, backlog: int, restart_delay=1.0, shutdown_timeout=15.0):
+        """
+        Forks worker processes that each run the framework's server loop and restarts the ones that crash.
+        When SO_REUSEPORT is available every worker binds its own socket and the kernel balances connections between them,
+        otherwise the workers accept from a single socket inherited from the supervisor.
+        :param workers: the amount of worker processes
+        :param restart_delay: seconds to wait before restarting a crashed worker
+        :param shutdown_timeout: seconds a worker is given to finish in flight requests before it is killed
+        """
+        assert hasattr(os, "fork"), "Pre-fork mode requires os.fork"
+        assert workers > 0, "Pre-fork mode requires at least one worker!"
+
+        self._framework = framework
+        self._worker_count = workers
+        self._ip = ip
+        self._backlog = backlog
+        self._restart_delay = restart_delay
+        self._shutdown_timeout = shutdown_timeout
+        self._reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self._listen_socket = None
+        self._workers = {}  # worker index: pid
+        self._active = False
+        self._poll_interval = 0.5
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._supervising_thread = None
+
+    def start(self):
+        """
+        Forks the workers and supervises them on the calling thread until shutdown is called or SIGTERM / SIGINT is received,
+        then stops the workers and returns.
+        Must be called from the main thread, workers are only forked from it and the signal handlers can only be set there.
+        """
+        assert threading.current_thread() is threading.main_thread(), "Pre-fork workers must be supervised from the main thread"
+
+        self._active = True
+        self._supervising_thread = threading.current_thread()
+        previous_handlers = {
+            signum: signal.signal(signum, lambda signum, frame: self._request_stop()) for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            if not self._reuse_port:
+                self._listen_socket = HttpServer.create_listen_socket(self._ip, self._backlog)
+
+            for index in range(self._worker_count):
+                self._spawn(index)
+
+            logger.info("Supervising %s pre-forked workers", self._worker_count)
+            self._supervise()
+        finally:
+            self._active = False
+            self._stop_workers()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            self._stopped.set()
+
+    def worker_pids(self):
+        return list(self._workers.values())
+
+    def _spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                exit_code = self._run_worker()
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                os._exit(exit_code)
+
+        self._workers[index] = pid
+        logger.debug("Started worker %s with pid %s", index, pid)
+
+    def _run_worker(self) -> int:
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._framework.shutdown())
+        signal.signal(signal.SIGINT, lambda signum, frame: self._framework.shutdown())
+
+        listen_socket = self._listen_socket if self._listen_socket is not None \
+            else HttpServer.create_listen_socket(self._ip, self._backlog, reuse_port=True)
+        listen_socket.settimeout(self._poll_interval)  # Lets the accept loop notice a shutdown without closing a shared socket
+        server = self._framework.serve_worker(listen_socket)
+
+        while self._framework.is_active():
+            time.sleep(self._poll_interval)
+
+        # Graceful shutdown, let in flight requests and keep alive sessions finish
+        deadline = time.monotonic() + self._shutdown_timeout
+        server.join(max(0.0, deadline - time.monotonic()))
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:  # Daemon threads like the timer wheel never exit
+                thread.join(max(0.0, deadline - time.monotonic()))
+
+        return 0
+
+    def _supervise(self):
+        while self._active:
+            for index, pid in list(self._workers.items()):
+                try:
+                    reaped_pid, status = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    reaped_pid, status = pid, 0
+
+                if reaped_pid == 0 or not self._active:
+                    continue
+
+                del self._workers[index]
+                if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                    logger.info("Worker %s (%s) exited", index, pid)
+                    continue
+
+                logger.warning("Worker %s (%s) crashed with status %s, restarting in %ss", index, pid, status, self._restart_delay)
+                self._wakeup.wait(self._restart_delay)
+                if self._active:
+                    self._spawn(index)
+
+            if len(self._workers) == 0:
+                break
+
+            self._wakeup.wait(self._poll_interval)
+
+    def _request_stop(self):
+        self._active = False
+        self._wakeup.set()
+
+    def shutdown(self):
+        """
+        Stops supervising, start then terminates the workers one at a time and gives each shutdown_timeout to finish.
+        When called from another thread, waits until every worker stopped.
+        """
+        self._request_stop()
+        if self._supervising_thread is not None and threading.current_thread() is not self._supervising_thread:
+            self._stopped.wait()
+
+    def _stop_workers(self):
+        for index, pid in list(self._workers.items()):
+            logger.debug("Stopping worker %s (%s)", index, pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+            if not self._wait_for_exit(pid, self._shutdown_timeout + self._poll_interval):
+                logger.warning("Worker %s (%s) did not stop in time, killing it", index, pid)
+                os.kill(pid, signal.SIGKILL)
+                self._wait_for_exit(pid, None)
+
+            del self._workers[index]
+
+        if self._listen_socket is not None:
+            self._listen_socket.close()
+
+    @staticmethod
+    def _wait_for_exit(pid: int, timeout) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                reaped_pid, _ = os.waitpid(pid, os.WNOHANG if deadline is not None else 0)
+            except ChildProcessError:
+                return True
+
+            if reaped_pid != 0:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
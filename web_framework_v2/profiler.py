@@ -0,0 +1,185 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from time import perf_counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileReport:
+    def __init__(self, request, response, route, duration: float, kind: str, profile: str):
+        """
+        The profile of a slow or sampled request.
+        :param kind: "sampled" for stacks collected while the request was over the threshold, "cprofile" for sampled requests
+        :param profile: collapsed stacks ("frame;frame;frame count" lines, usable with flamegraph tools) or pstats output
+        """
+        self.method = request.method.name if request.method is not None else "UNKNOWN"
+        self.url = request.url
+        self.query_parameters = request.query_parameters
+        self.route = route.route() if route is not None else None
+        self.status = int(response.status) if response is not None else None
+        self.duration = duration
+        self.kind = kind
+        self.profile = profile
+        self.time = time.time()
+
+    def summary(self) -> str:
+        return f"{self.method} {self.url} route={self.route} status={self.status} duration={self.duration:.3f}s profile={self.kind}"
+
+    def __str__(self):
+        return f"{self.summary()}\nquery parameters: {self.query_parameters}\n\n{self.profile}"
+
+
+class _Session:
+    __slots__ = ("request", "route", "thread_id", "start", "profile", "samples")
+
+    def __init__(self, request, route, profile: Optional[cProfile.Profile]):
+        self.request = request
+        self.route = route
+        self.thread_id = threading.get_ident()
+        self.start = perf_counter()
+        self.profile = profile
+        self.samples = Counter()  # collapsed stack: times it was seen
+
+
+class SlowRequestProfiler:
+    def __init__(
+            self,
+            threshold: float = 1.0,
+            sample_every: int = 0,
+            directory: str = None,
+            callback=None,
+            max_files: int = 100,
+            interval: float = 0.005,
+            max_depth: int = 64
+    ):
+        """
+        Profiles requests whose endpoint takes longer than threshold.
+        A single sampler thread records the stacks of the threads serving requests that are over the threshold,
+        requests that are still under it only cost a dictionary insert and removal.
+        Every sample_every-th request on average is instead run under cProfile from its start.
+        Coroutine endpoints share the event loop thread, their samples may include other coroutines that ran meanwhile.
+        :param threshold: seconds after which a request is considered slow
+        :param sample_every: profile a random 1 in sample_every requests with cProfile, 0 to never
+        :param directory: reports are written to this directory, keeping the newest max_files of them
+        :param callback: callable(ProfileReport), called with every report
+        :param interval: seconds between two stack samples
+        :param max_depth: the amount of innermost frames kept per sample
+        """
+        self.threshold = threshold
+        self.sample_every = sample_every
+        self.directory = directory
+        self.callback = callback
+        self.max_files = max_files
+        self.interval = interval
+        self.max_depth = max_depth
+        self._active = {}  # id of the session: _Session
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def begin(self, request, route) -> _Session:
+        profile = None
+        if self.sample_every > 0 and random.random() * self.sample_every < 1:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # Another profiler is active on this thread
+                profile = None
+
+        session = _Session(request, route, profile)
+        with self._lock:
+            self._active[id(session)] = session
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="web_framework_v2-profiler", daemon=True)
+                self._sampler.start()
+        self._wakeup.set()
+        return session
+
+    def end(self, session: _Session, response):
+        if session.profile is not None:
+            session.profile.disable()
+        duration = perf_counter() - session.start
+        with self._lock:
+            del self._active[id(session)]
+            samples = dict(session.samples)
+
+        if session.profile is not None:
+            self._report(ProfileReport(session.request, response, session.route, duration, "cprofile", self._format_profile(session.profile)))
+        elif duration >= self.threshold:
+            stacks = "\n".join(f"{stack} {count}" for stack, count in sorted(samples.items(), key=lambda item: -item[1]))
+            self._report(ProfileReport(session.request, response, session.route, duration, "sampled", stacks))
+
+    def _sample(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+
+            now = perf_counter()
+            with self._lock:
+                if len(self._active) == 0:
+                    self._wakeup.clear()
+                    continue
+                slow = [session for session in self._active.values() if now - session.start >= self.threshold and session.profile is None]
+            if len(slow) == 0:
+                continue
+
+            frames = sys._current_frames()
+            for session in slow:
+                frame = frames.get(session.thread_id, None)
+                if frame is not None:
+                    stack = self._collapse(frame)
+                    with self._lock:
+                        session.samples[stack] += 1
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    @staticmethod
+    def _format_profile(profile: cProfile.Profile) -> str:
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(50)
+        return output.getvalue()
+
+    def _report(self, report: ProfileReport):
+        if report.kind == "sampled":
+            logger.warning("Slow request: %s", report.summary())
+        else:
+            logger.info("Profiled request: %s", report.summary())
+        if self.callback is not None:
+            try:
+                self.callback(report)
+            except Exception as e:
+                logger.exception(e)
+
+        if self.directory is not None:
+            try:
+                self._write(report)
+            except OSError as e:
+                logger.exception(e)
+
+    def _write(self, report: ProfileReport):
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", report.url).strip("_")[:64] or "root"
+        path = os.path.join(self.directory, f"{report.time:.6f}-{report.method}-{name}.{report.kind}.txt")
+        with open(path, "w") as file:
+            file.write(str(report))
+
+        files = sorted(entry for entry in os.listdir(self.directory) if entry.endswith(".txt"))
+        for old in files[:max(0, len(files) - self.max_files)]:
+            os.remove(os.path.join(self.directory, old))
@@ -0,0 +1,236 @@
+import re
+import socket
+from typing import Optional
+
+from web_framework_v2.http import HttpRequest, HttpError, HttpStatus
+from web_framework_v2.parser import RequestParser
+
+
+_CONTENT_LENGTH = re.compile(r"[0-9]{1,18}")
+_CHUNK_SIZE_LINE = re.compile(rb"([0-9A-Fa-f]{1,16})[ \t]*(?:;[^\r\n]*)?")  # The size and optional chunk extensions
+
+
+class RequestReader:
+    _CHUNK_SIZE = 0
+    _CHUNK_DATA = 1
+    _CHUNK_DATA_END = 2
+    _CHUNK_TRAILERS = 3
+
+    def __init__(
+            self,
+            request_parser=RequestParser,
+            byte_fetch_amount: int = 1024 * 8,
+            max_header_size: int = 1024 * 64,
+            max_body_size: int = None,
+            stream_body=None
+    ):
+        """
+        Incrementally reads requests from a connection.
+        Received data is kept in a single buffer, the progress of the current request is kept between reads
+        and every complete request in the buffer is returned in order, which allows pipelining.
+        :param request_parser: the parser class used to parse a request head
+        :param byte_fetch_amount: the maximum amount of bytes received per read
+        :param max_header_size: the maximum size of a request head, larger heads raise ValueError
+        :param max_body_size: the maximum size of a request body, larger bodies raise HttpError(413).
+                              A larger content-length is rejected before any of the body is read
+        :param stream_body: callable(request) -> bool, requests it accepts are returned as soon as their head was read
+                            and their body is read on demand with read_body
+        """
+        self.request_parser = request_parser
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.stream_body = stream_body
+        self._buffer = bytearray()
+        self._receive_buffer = bytearray(byte_fetch_amount)
+        self._receive_view = memoryview(self._receive_buffer)
+        self._scan_from = 0
+        self._request: Optional[HttpRequest] = None
+        self._content_length = 0
+        self._chunked = False
+        self._chunk_state = RequestReader._CHUNK_SIZE
+        self._chunk_remaining = 0
+        self._chunked_body = bytearray()
+        self._body_size = 0
+        self._streaming = False
+
+    def recv_into(self, client_socket: socket.socket) -> int:
+        """
+        Receives data from the socket into the buffer.
+        :return: the amount of bytes received, 0 when the peer closed the connection
+        """
+        received = client_socket.recv_into(self._receive_buffer)
+        if received > 0:
+            self._buffer += self._receive_view[:received]
+        return received
+
+    def feed(self, data: bytes):
+        self._buffer += data
+
+    def is_reading_body(self):
+        return self._request is not None or self._streaming
+
+    def is_streaming(self):
+        """
+        :return: True while the body of the last returned request was not completely read with read_body
+        """
+        return self._streaming
+
+    def has_buffered_data(self):
+        return len(self._buffer) > 0 or self._request is not None or self._streaming
+
+    def next_request(self) -> Optional[HttpRequest]:
+        """
+        :return: the next complete request or None if more data has to be received
+        """
+        if self._streaming:
+            raise RuntimeError("The body of the previous request was not read")
+
+        if self._request is None:
+            if not self._read_head():
+                return None
+
+            if self.stream_body is not None and (self._chunked or self._content_length > 0) and self.stream_body(self._request):
+                self._streaming = True
+                request = self._request
+                request.body = None
+                self._request = None
+                return request
+
+        if not (self._read_chunked_body() if self._chunked else self._read_body()):
+            return None
+
+        request = self._request
+        self._request = None
+        return request
+
+    def _read_head(self) -> bool:
+        head_end = self._buffer.find(b"\r\n\r\n", self._scan_from)
+        if head_end == -1:
+            if len(self._buffer) > self.max_header_size:
+                raise ValueError("Request head exceeds the maximum header size")
+            self._scan_from = max(0, len(self._buffer) - 3)  # The terminator may be split between reads
+            return False
+
+        head = bytes(self._buffer[:head_end + 4])
+        del self._buffer[:head_end + 4]
+        self._scan_from = 0
+
+        self._request = self.request_parser(head).parse()
+        headers = self._request.headers
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        if self._chunked:
+            self._chunk_state = RequestReader._CHUNK_SIZE
+            self._chunked_body = bytearray()
+        else:
+            content_length = headers.get("content-length", "0").strip()
+            if _CONTENT_LENGTH.fullmatch(content_length) is None:
+                raise HttpError(HttpStatus.BAD_REQUEST, f"Invalid content-length {content_length!r}")
+            self._content_length = int(content_length)
+            if self.max_body_size is not None and self._content_length > self.max_body_size:
+                raise HttpError(HttpStatus.REQUEST_ENTITY_TOO_LARGE)
+        self._body_size = 0
+        return True
+
+    def read_body(self, limit: int) -> Optional[bytes]:
+        """
+        Reads the buffered part of a streamed body.
+        :return: up to limit bytes of the body, b"" once the body was read or None if more data has to be received
+        """
+        if not self._streaming:
+            return b""
+
+        if self._chunked:
+            data, finished = self._decode_chunks(limit)
+        else:
+            size = min(len(self._buffer), self._content_length, limit)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._content_length -= size
+            finished = self._content_length == 0
+
+        if finished:
+            self._streaming = False
+        elif len(data) == 0:
+            return None
+        return data
+
+    def _read_body(self) -> bool:
+        if len(self._buffer) < self._content_length:
+            return False
+
+        self._request.body = bytes(self._buffer[:self._content_length])
+        del self._buffer[:self._content_length]
+        return True
+
+    def _read_chunked_body(self) -> bool:
+        data, finished = self._decode_chunks(None)
+        self._chunked_body += data
+        if not finished:
+            return False
+
+        self._request.body = bytes(self._chunked_body)
+        self._chunked_body = bytearray()
+        return True
+
+    def _decode_chunks(self, limit: Optional[int]):
+        """
+        Decodes the buffered part of a chunked body.
+        :return: (up to limit decoded bytes, whether the body ended)
+        """
+        buffer = self._buffer
+        data = bytearray()
+        while limit is None or len(data) < limit:
+            if self._chunk_state == RequestReader._CHUNK_SIZE:
+                line_end = self._find_line_end()
+                if line_end == -1:
+                    return data, False
+
+                size_line = _CHUNK_SIZE_LINE.fullmatch(buffer, 0, line_end)
+                if size_line is None:  # int(..., 16) alone also accepts "-5", "+a" and "0x10" and would lose the request boundary
+                    raise HttpError(HttpStatus.BAD_REQUEST, f"Invalid chunk size line {bytes(buffer[:line_end])!r}")
+                size = int(size_line.group(1), 16)
+                del buffer[:line_end + 2]
+                self._body_size += size
+                if self.max_body_size is not None and self._body_size > self.max_body_size:
+                    raise HttpError(HttpStatus.REQUEST_ENTITY_TOO_LARGE)
+                self._chunk_remaining = size
+                self._chunk_state = RequestReader._CHUNK_DATA if size > 0 else RequestReader._CHUNK_TRAILERS
+            elif self._chunk_state == RequestReader._CHUNK_DATA:
+                available = min(len(buffer), self._chunk_remaining)
+                if limit is not None:
+                    available = min(available, limit - len(data))
+                if available == 0:
+                    return data, False
+
+                data += buffer[:available]
+                del buffer[:available]
+                self._chunk_remaining -= available
+                if self._chunk_remaining == 0:
+                    self._chunk_state = RequestReader._CHUNK_DATA_END
+            elif self._chunk_state == RequestReader._CHUNK_DATA_END:
+                if len(buffer) < 2:
+                    return data, False
+                if buffer[:2] != b"\r\n":
+                    raise HttpError(HttpStatus.BAD_REQUEST, "Chunk data is not terminated by CRLF")
+
+                del buffer[:2]
+                self._chunk_state = RequestReader._CHUNK_SIZE
+            else:
+                line_end = self._find_line_end()
+                if line_end == -1:
+                    return data, False
+
+                del buffer[:line_end + 2]
+                if line_end == 0:  # The empty line ending the trailers
+                    return data, True
+
+        return data, False
+
+    def _find_line_end(self) -> int:
+        """
+        :return: the index of the CRLF ending the chunk size or trailer line at the start of the buffer, -1 if it was not received
+        """
+        line_end = self._buffer.find(b"\r\n", 0, self.max_header_size + 2)
+        if line_end == -1 and len(self._buffer) > self.max_header_size:
+            raise HttpError(HttpStatus.BAD_REQUEST, "Chunk size or trailer line exceeds the maximum header size")
+        return line_end
@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+
+from web_framework_v2.http import HttpResponse, HttpStatus, HttpMethod
+from web_framework_v2.http.conditional import is_not_modified
+
+_CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since", "if-range", "range")
+
+
+class CachePolicy:
+    def __init__(self, ttl: float = 60, query_parameters=None, headers=()):
+        """
+        Describes how the responses of an endpoint are cached, given to endpoints with cache=.
+        :param ttl: seconds a response is served from the cache
+        :param query_parameters: the query parameters responses vary by, None for all of them
+        :param headers: the request headers responses vary by, e.g. ("accept-language",)
+        """
+        self.ttl = ttl
+        self.query_parameters = tuple(sorted(query_parameters)) if query_parameters is not None else None
+        self.headers = tuple(header.lower() for header in headers)
+
+    @staticmethod
+    def of(cache) -> Optional["CachePolicy"]:
+        """
+        :param cache: None or False to not cache, True for the default policy, seconds to cache for or a CachePolicy
+        """
+        if cache is None or cache is False:
+            return None
+        if cache is True:
+            return CachePolicy()
+        if isinstance(cache, CachePolicy):
+            return cache
+        return CachePolicy(ttl=cache)
+
+    def key(self, request, route, encoding: Optional[str]) -> tuple:
+        query = request.query_parameters
+        names = sorted(query) if self.query_parameters is None else self.query_parameters
+        return (
+            route.route(),
+            request.method,
+            request.url,
+            tuple((name, tuple(query[name]) if query.get(name, None) is not None else None) for name in names if name in query),
+            tuple(request.headers.get(header, None) for header in self.headers),
+            encoding
+        )
+
+
+class CachedResponse:
+    __slots__ = ("content_type", "status", "headers", "body", "last_modified", "expires")
+
+    def __init__(self, response: HttpResponse, expires: float):
+        self.content_type = response.content_type
+        self.status = response.status
+        self.headers = dict(response.headers)
+        self.body = response.html
+        self.last_modified = response.last_modified
+        self.expires = expires
+
+    def size(self) -> int:
+        return len(self.body) + 256  # Rough overhead of the headers and the entry
+
+    def to_response(self, request) -> HttpResponse:
+        response = HttpResponse(self.content_type, request.http_version, self.status, self.body)
+        response.headers = dict(self.headers)
+        response.last_modified = self.last_modified
+        if request.method in (HttpMethod.GET, HttpMethod.HEAD) and \
+                is_not_modified(request, self.headers.get("ETag", None), self.last_modified):
+            response.not_modified()
+        return response
+
+
+class ResponseCache:
+    def __init__(self, max_size: int = 1024 * 1024 * 16):
+        """
+        Keeps the encoded responses of endpoints using cache= in a size bounded LRU.
+        Concurrent misses of the same key are coalesced, a single request executes the endpoint
+        and the others wait for its response.
+        Only 200 responses of endpoints that did not raise, with an in memory body and without Set-Cookie are stored.
+        :param max_size: the maximum amount of bytes of responses kept in memory
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key: CachedResponse
+        self._size = 0
+        self._in_flight = {}  # key: Future of the CachedResponse (or None when the response is not cacheable)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def fetch(self, request, key, ttl: float, build) -> HttpResponse:
+        """
+        :param key: the key of the response, see CachePolicy.key
+        :param ttl: seconds the built response is kept
+        :param build: called with request without its conditional headers and returning the response to store
+        """
+        cached, future, leader = self._lookup(key)
+        if cached is not None:
+            return cached.to_response(request)
+
+        if not leader:
+            cached = future.result()
+            return cached.to_response(request) if cached is not None else build(request)
+
+        try:
+            response = build(_unconditional(request))
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        return self._complete(request, key, ttl, future, response)
+
+    async def fetch_async(self, request, key, ttl: float, build):
+        """
+        Same as fetch for the event loop, build is a coroutine function.
+        """
+        cached, future, leader = self._lookup(key)
+        if cached is not None:
+            return cached.to_response(request)
+
+        if not leader:
+            cached = await asyncio.wrap_future(future)
+            return cached.to_response(request) if cached is not None else await build(request)
+
+        try:
+            response = await build(_unconditional(request))
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        return self._complete(request, key, ttl, future, response)
+
+    def invalidate(self, route: str = None, url: str = None):
+        """
+        Drops the cached responses of an endpoint route (e.g. "/area/{x}") and / or of a url, everything when both are None.
+        """
+        url = url.rstrip("/") if url is not None else None
+        route = route if route is None or route.endswith("/") else route + "/"
+        route = route if route is None or route.startswith("/") else "/" + route
+        with self._lock:
+            for key in list(self._entries):
+                if (route is None or key[0] == route) and (url is None or key[2].rstrip("/") == url):
+                    self._size -= self._entries.pop(key).size()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "entries": len(self._entries), "size": self._size}
+
+    def _lookup(self, key):
+        """
+        :return: (cached response, None, False) on a hit, otherwise (None, future, True when the caller has to build it)
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key, None)
+            if cached is not None:
+                if cached.expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached, None, False
+                self._size -= self._entries.pop(key).size()
+
+            future = self._in_flight.get(key, None)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+
+            self.misses += 1
+            future = Future()
+            self._in_flight[key] = future
+            return None, future, True
+
+    def _complete(self, request, key, ttl: float, future, response: HttpResponse) -> HttpResponse:
+        cached = CachedResponse(response, time.monotonic() + ttl) if _cacheable(response) else None
+
+        with self._lock:
+            del self._in_flight[key]
+            if cached is not None:
+                self._entries[key] = cached
+                self._size += cached.size()
+                while self._size > self.max_size and len(self._entries) > 0:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= evicted.size()
+        future.set_result(cached)
+
+        return cached.to_response(request) if cached is not None else response
+
+    def _fail(self, key, future, exception):
+        with self._lock:
+            del self._in_flight[key]
+        future.set_exception(exception)
+
+
+def _cacheable(response: HttpResponse) -> bool:
+    return response.status == HttpStatus.OK and response.exception is None and response.stream is None and response.file is None and \
+        "Set-Cookie" not in response.headers
+
+
+def _unconditional(request):
+    if not any(header in request.headers for header in _CONDITIONAL_HEADERS):
+        return request
+
+    request = request.clone()
+    for header in _CONDITIONAL_HEADERS:
+        request.headers.pop(header, None)
+    return request
@@ -1,8 +1,13 @@
+import warnings
 from threading import Timer
 
 
 class RestartableTimer(object):
     def __init__(self, interval, function):
+        """
+        Deprecated, the servers track their timeouts with a TimerWheel which does not need a thread per timeout.
+        """
+        warnings.warn("RestartableTimer is deprecated, use TimerWheel instead", DeprecationWarning, stacklevel=2)
         self.interval = interval
         self.function = function
         self.timer = Timer(self.interval, self.function)
@@ -1,26 +1,61 @@
 import re
-from typing import Callable, Dict
+import uuid
+from typing import Callable, Dict, Optional
 
 import web_framework_v2.http.http_request as http_request
 import web_framework_v2.http.http_response as http_response
 import web_framework_v2.method as method_module
 from web_framework_v2.http import HttpMethod, ContentType
+from web_framework_v2.http.body_stream import is_stream
+from web_framework_v2.middleware import compile_chain, compile_chain_async
+from web_framework_v2.response_cache import CachePolicy
 
 ErrorHandler = Callable[[Exception, str, http_request.HttpRequest, http_response.HttpResponse, Dict], object]
 
+_INT_SEGMENT = re.compile(r"-?[0-9]+", re.ASCII)
+_FLOAT_SEGMENT = re.compile(r"-?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?", re.ASCII)
+
+
+def _int_segment(segment: str) -> int:
+    # int() alone also accepts "1_000", surrounding whitespace and non ASCII digits
+    if _INT_SEGMENT.fullmatch(segment) is None:
+        raise ValueError(f"{segment} is not an integer")
+    return int(segment)
+
+
+def _float_segment(segment: str) -> float:
+    # float() alone also accepts "nan", "inf", "1_0" and non ASCII digits
+    if _FLOAT_SEGMENT.fullmatch(segment) is None:
+        raise ValueError(f"{segment} is not a decimal number")
+    return float(segment)
+
 
 class Endpoint:
     VARIABLE_MATCHER = re.compile(r"({.+?})")
     SLASH_EXTRACTOR = re.compile(r"/?([^/]+)/?")
+    SEGMENT_CONVERTERS = {"str": str, "int": _int_segment, "float": _float_segment, "uuid": uuid.UUID}  # path variable constraint: converter
 
     def __init__(
             self,
             route: str,
             http_method: HttpMethod,
             content_type: ContentType,
-            func, match_headers: dict,
-            error_handler: ErrorHandler
+            func=None, match_headers: dict = None,
+            error_handler: ErrorHandler = None,
+            serializer=None,
+            serializers=None,
+            etag: bool = False,
+            cache_control: str = None,
+            cache=None
     ):
+        """
+        :param serializer: encodes the results of this endpoint regardless of the content type
+        :param serializers: the SerializerRegistry results are encoded with when no serializer is given
+        :param etag: send an ETag hashed from the response body and answer matching If-None-Match with 304
+        :param cache_control: the Cache-Control header of successful responses
+        :param cache: keep the responses in the framework's ResponseCache, see CachePolicy.of. Only GET and HEAD endpoints
+                      may be cached, the cache key does not include the request body
+        """
         if len(route) == 0:
             route = "/"
 
@@ -35,11 +70,34 @@ class Endpoint:
                                                                                                                              "traceback": traceback}
         self._func = func
         self._match_headers = match_headers
-        self._method = method_module.Method(self._func)
+        self._method = method_module.Method(self._func, serializer, serializers)
+        self._etag = etag
+        self._cache_control = cache_control
+        self._cache_policy = CachePolicy.of(cache)
+        assert self._cache_policy is None or http_method in (HttpMethod.GET, HttpMethod.HEAD), \
+            f"Responses of {http_method.name} {route} can not be cached, only GET and HEAD endpoints may use cache="
+        self._chain = self._method.execute
+        self._chain_async = self._method.execute_async
+        self._has_middleware = False
 
         self._variable_table = {i.group(): i.span() for i in self.VARIABLE_MATCHER.finditer(self._route)}
         self._route_contains_variables = len(self._variable_table) > 0
         self._route_slashes = self.SLASH_EXTRACTOR.findall(self._route)
+        self._route_segments = [Endpoint.parse_segment(slash) for slash in self._route_slashes]
+
+    @staticmethod
+    def parse_segment(segment: str):
+        """
+        Parses a route segment. Variables are written as {name} or {name:constraint}, e.g. {id:int}.
+        :return: (segment, None, None) for static segments or (segment, variable name, constraint)
+        """
+        if segment[0] != "{" or segment[-1] != "}":
+            return segment, None, None
+
+        name, _, constraint = segment[1:-1].partition(":")
+        constraint = constraint.strip() if len(constraint.strip()) > 0 else "str"
+        assert constraint in Endpoint.SEGMENT_CONVERTERS, f"Unknown path variable constraint {constraint} in {segment}"
+        return segment, name.strip(), constraint
 
     def execute_error_handler(
             self,
@@ -49,11 +107,43 @@ class Endpoint:
             response: http_response.HttpResponse,
             path_variables: Dict
     ):
-        return method_module.Method.encode_result(self._error_handler(exception, traceback, request, response, path_variables), response)
+        return self.encode_result(self._error_handler(exception, traceback, request, response, path_variables), response)
+
+    def encode_result(self, result, response: http_response.HttpResponse):
+        return self._method.encode(result, response)
 
     def execute(self, request: http_request.HttpRequest, response, path_variables):
         request.path_variables = path_variables
-        return self._method.execute(request, response)
+        if self._has_middleware:
+            request.lazy_body = self._method.lazy_body(request)
+        return self._chain(request, response)
+
+    async def execute_async(self, request: http_request.HttpRequest, response, path_variables):
+        request.path_variables = path_variables
+        if self._has_middleware:
+            request.lazy_body = self._method.lazy_body(request)
+        return await self._chain_async(request, response)
+
+    def set_middleware(self, middleware):
+        """
+        Composes the chains of the middleware applying to this endpoint, they run in the given order.
+        """
+        applying = [entry for entry in middleware if entry.applies_to(self._route)]
+        self._has_middleware = len(applying) > 0
+        self._chain = compile_chain(applying, self._method.execute, self._encode_short_circuit)
+        self._chain_async = compile_chain_async(applying, self._method.execute_async, self._encode_short_circuit)
+
+    def _encode_short_circuit(self, result, response: http_response.HttpResponse):
+        return result if is_stream(result) else self.encode_result(result, response)
+
+    def is_coroutine(self):
+        return self._method.is_coroutine()
+
+    def streams_body(self):
+        return self._method.streams_body()
+
+    def spools_body(self):
+        return self._method.spools_body()
 
     def matches_headers(self, request: http_request.HttpRequest):
         if self._match_headers is None or len(self._match_headers) == 0:
@@ -82,21 +172,36 @@ class Endpoint:
         if len(url_slashes) != len(self._route_slashes):
             return False, None
 
-        for url_slash, route_slash in zip(url_slashes, self._route_slashes):
-            if route_slash[0] != "{" and route_slash[-1] != "}":
+        for url_slash, (route_slash, name, constraint) in zip(url_slashes, self._route_segments):
+            if name is None:
                 if url_slash != route_slash:
                     return False, None
             else:
-                variable_values[route_slash[1:-1]] = url_slash
+                try:
+                    variable_values[name] = self.SEGMENT_CONVERTERS[constraint](url_slash)
+                except ValueError:
+                    return False, None
 
         return True, variable_values
 
+    def route_segments(self):
+        return self._route_segments
+
     def has_route_variables(self):
         return self._route_contains_variables
 
     def route(self):
         return self._route
 
+    def etag(self):
+        return self._etag
+
+    def cache_control(self):
+        return self._cache_control
+
+    def cache_policy(self) -> Optional[CachePolicy]:
+        return self._cache_policy
+
     def method(self):
         return self._http_method
 
@@ -1,31 +1,26 @@
 from __future__ import annotations
 
 from . import Endpoint
+from .route_tree import RouteTree
 import web_framework_v2.http.http_request as http_request
 
 
 class EndpointMap:
     def __init__(self):
         self._method_routes_map = {}  # HttpMethod: {route_str: Route}
+        self._method_route_trees = {}  # HttpMethod: RouteTree
 
-    def get_endpoint(self, request: http_request.HttpRequest) -> tuple[Endpoint | None, str | None] | None:
+    def get_endpoint(self, request: http_request.HttpRequest) -> tuple[Endpoint | None, dict | None]:
         endpoint_obj = self._method_routes_map.get(request.method, {}).get(request.url, None)
 
-        if endpoint_obj is None:
-            method_routes = self._method_routes_map.get(request.method, None)
+        if endpoint_obj is not None and not endpoint_obj.has_route_variables() and endpoint_obj.matches_headers(request):
+            return endpoint_obj, None
 
-            if method_routes is None:
-                return None, None
-
-            for route in method_routes.values():
-                matches, variable_map = route.matches_url(request.url)
-                if matches and route.matches_headers(request):
-                    return route, variable_map
-
-        if endpoint_obj is not None and not endpoint_obj.matches_headers(request):
+        route_tree = self._method_route_trees.get(request.method, None)
+        if route_tree is None:
             return None, None
 
-        return endpoint_obj, None
+        return route_tree.match(request.url, request)
 
     def add_route(self, route: Endpoint):
         assert self._method_routes_map.get(route.method(), {}).get(route.route(), None) is None, \
@@ -33,6 +28,17 @@ class EndpointMap:
 
         self._method_routes_map.setdefault(route.method(), {})
         self._method_routes_map[route.method()][route.route()] = route
+        self._method_route_trees.setdefault(route.method(), RouteTree()).add(route)
+
+    def endpoints(self):
+        for routes in self._method_routes_map.values():
+            yield from routes.values()
+
+    def dump(self) -> str:
+        """
+        :return: a printable view of the compiled route trees
+        """
+        return "\n".join(f"{method.value}\n{route_tree.dump()}" for method, route_tree in self._method_route_trees.items())
 
     def __str__(self):
         return str(self._method_routes_map)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+import web_framework_v2.http.http_request as http_request
+from .endpoint import Endpoint
+
+
+class RouteNode:
+    __slots__ = ("segment", "variable_name", "constraint", "converter", "static_children", "variable_children", "endpoint")
+
+    def __init__(self, segment: str = "", variable_name: str = None, constraint: str = None):
+        """
+        A node of a segment based route tree.
+        :param segment: the route segment the node matches, e.g. "player" or "{id:int}"
+        :param variable_name: the path variable the segment is stored in, None for static segments
+        :param constraint: the name of the converter a variable segment must pass
+        """
+        self.segment = segment
+        self.variable_name = variable_name
+        self.constraint = constraint
+        self.converter = Endpoint.SEGMENT_CONVERTERS[constraint] if constraint is not None else None
+        self.static_children = {}  # segment: RouteNode
+        self.variable_children: List[RouteNode] = []  # constrained variables first, then in registration order
+        self.endpoint: Optional[Endpoint] = None
+
+    def child(self, segment: str, variable_name: str, constraint: str) -> RouteNode:
+        if variable_name is None:
+            node = self.static_children.get(segment, None)
+            if node is None:
+                node = self.static_children[segment] = RouteNode(segment)
+            return node
+
+        for node in self.variable_children:
+            if node.variable_name == variable_name and node.constraint == constraint:
+                return node
+
+        node = RouteNode(segment, variable_name, constraint)
+        # Stable sort keeps registration order between variables of the same kind
+        self.variable_children.append(node)
+        self.variable_children.sort(key=lambda variable: variable.constraint == "str")
+        return node
+
+
+class RouteTree:
+    def __init__(self):
+        """
+        Compiles the routes of a single http method into a tree of path segments.
+        Lookups are O(path depth), static segments take precedence over variables
+        and constrained variables (e.g. {id:int}) take precedence over unconstrained ones.
+        """
+        self._root = RouteNode("/")
+
+    def add(self, endpoint: Endpoint):
+        node = self._root
+        for segment, variable_name, constraint in endpoint.route_segments():
+            node = node.child(segment, variable_name, constraint)
+
+        node.endpoint = endpoint
+
+    def match(self, url: str, request: http_request.HttpRequest = None):
+        """
+        :return: the matching endpoint and its path variables or (None, None)
+        """
+        segments = [segment for segment in url.split("/") if len(segment) > 0]
+        variables = {}
+        endpoint = RouteTree._match(self._root, segments, 0, variables, request)
+        if endpoint is None:
+            return None, None
+
+        return endpoint, variables if endpoint.has_route_variables() else None
+
+    @staticmethod
+    def _match(node: RouteNode, segments: list, index: int, variables: dict, request) -> Optional[Endpoint]:
+        if index == len(segments):
+            endpoint = node.endpoint
+            if endpoint is not None and (request is None or endpoint.matches_headers(request)):
+                return endpoint
+            return None
+
+        segment = segments[index]
+        static_child = node.static_children.get(segment, None)
+        if static_child is not None:
+            endpoint = RouteTree._match(static_child, segments, index + 1, variables, request)
+            if endpoint is not None:
+                return endpoint
+
+        for variable_child in node.variable_children:
+            try:
+                value = variable_child.converter(segment)
+            except ValueError:
+                continue
+
+            endpoint = RouteTree._match(variable_child, segments, index + 1, variables, request)
+            if endpoint is not None:
+                variables[variable_child.variable_name] = value
+                return endpoint
+
+        return None
+
+    def dump(self) -> str:
+        lines = []
+        RouteTree._dump(self._root, 0, lines)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _dump(node: RouteNode, depth: int, lines: list):
+        line = "  " * depth + ("/" if depth == 0 else "/" + node.segment)
+        if node.endpoint is not None:
+            line += f" -> {node.endpoint}"
+        lines.append(line)
+
+        for child in node.static_children.values():
+            RouteTree._dump(child, depth + 1, lines)
+        for child in node.variable_children:
+            RouteTree._dump(child, depth + 1, lines)
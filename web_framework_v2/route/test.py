@@ -1,7 +1,7 @@
 import unittest
 
-from web_framework_v2.http import HttpMethod
-from web_framework_v2.route import Endpoint
+from web_framework_v2.http import HttpMethod, HttpRequest
+from web_framework_v2.route import Endpoint, EndpointMap
 
 
 class RouteMatching(unittest.TestCase):
@@ -89,5 +89,58 @@ class RouteMatching(unittest.TestCase):
                 )
 
 
+class EndpointMapLookup(unittest.TestCase):
+    def setUp(self):
+        self.endpoint_map = EndpointMap()
+        self.routes = {}
+        for route in ["hockey/player/{name}", "hockey/player/top", "hockey/player/{id:int}", "{game}/player/{name}/score",
+                      "hockey/{team}/score", "/"]:
+            self.routes[route] = Endpoint(route, HttpMethod.GET, None)
+            self.endpoint_map.add_route(self.routes[route])
+
+        self.routes["secret"] = Endpoint("hockey/player/secret", HttpMethod.GET, None, match_headers={"host": "admin"})
+        self.endpoint_map.add_route(self.routes["secret"])
+
+    def lookup(self, url, headers=None):
+        return self.endpoint_map.get_endpoint(HttpRequest(HttpMethod.GET, url, "HTTP/1.1", headers, None, b""))
+
+    def test_static_precedence(self):
+        self.assertIs(self.lookup("/hockey/player/top/")[0], self.routes["hockey/player/top"])
+        self.assertIs(self.lookup("/")[0], self.routes["/"])
+
+    def test_typed_constraints(self):
+        self.assertEqual(self.lookup("/hockey/player/17/"), (self.routes["hockey/player/{id:int}"], {"id": 17}))
+        self.assertEqual(self.lookup("/hockey/player/HeKNon/"), (self.routes["hockey/player/{name}"], {"name": "HeKNon"}))
+
+    def test_strict_number_constraints(self):
+        for segment in ["1_000", "\u0661\u0662", "+17", " 17"]:
+            self.assertEqual(self.lookup(f"/hockey/player/{segment}/"), (self.routes["hockey/player/{name}"], {"name": segment}))
+        self.assertEqual(self.lookup("/hockey/player/-17/")[1], {"id": -17})
+
+        converter = Endpoint.SEGMENT_CONVERTERS["float"]
+        self.assertEqual([converter(segment) for segment in ["1.5", "-.5", "2", "1e3"]], [1.5, -0.5, 2.0, 1000.0])
+        for segment in ["nan", "inf", "-Infinity", "1_0.5", "\u0661.5", "1.5 "]:
+            self.assertRaises(ValueError, converter, segment)
+
+    def test_backtracking(self):
+        self.assertEqual(self.lookup("/hockey/player/HeKNon/score/"),
+                         (self.routes["{game}/player/{name}/score"], {"game": "hockey", "name": "HeKNon"}))
+        self.assertEqual(self.lookup("/hockey/rangers/score/"), (self.routes["hockey/{team}/score"], {"team": "rangers"}))
+
+    def test_header_matching(self):
+        self.assertIs(self.lookup("/hockey/player/secret/", {"host": "admin"})[0], self.routes["secret"])
+        self.assertIs(self.lookup("/hockey/player/secret/")[0], self.routes["hockey/player/{name}"])
+
+    def test_no_match(self):
+        self.assertEqual(self.lookup("/hockey/"), (None, None))
+        self.assertEqual(self.endpoint_map.get_endpoint(HttpRequest(HttpMethod.POST, "/", "HTTP/1.1", None, None, b"")), (None, None))
+
+    def test_dump(self):
+        dump = self.endpoint_map.dump()
+        self.assertTrue(dump.startswith("GET\n/ -> Route(url: /)"))
+        self.assertLess(dump.index("/top"), dump.index("/{id:int}"))
+        self.assertLess(dump.index("/{id:int}"), dump.index("/{name}"))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,5 @@
-__all__ = ["KeyPair", "JwtTokenAuth", "JwtTokenFactory", "JwtSecurity"]
+__all__ = ["KeyPair", "JwtTokenAuth", "JwtTokenFactory", "JwtSecurity", "TokenCache"]
 
 from .key_pair import KeyPair
+from .token_cache import TokenCache
 from .jwt import JwtSecurity, JwtTokenFactory, JwtTokenAuth
@@ -5,12 +5,15 @@ from typing import Tuple
 import jwt
 
 from web_framework_v2.decorator import Decorator
-from web_framework_v2.security import KeyPair
+from web_framework_v2.security.key_pair import KeyPair
+from web_framework_v2.security.token_cache import TokenCache
 
 
 class JwtSecurity(Decorator, ABC):
     access_key: KeyPair
     refresh_key: KeyPair
+    access_tokens = TokenCache()  # Verified access tokens, cleared when the access key changes
+    refresh_tokens = TokenCache()
 
     def __init__(self, on_fail=lambda request, response: None, fail_on_null_result=True):
         """
@@ -31,22 +34,32 @@ class JwtSecurity(Decorator, ABC):
     @staticmethod
     def set_access_key(key: KeyPair):
         JwtSecurity.access_key = key
+        JwtSecurity.access_tokens.clear()
 
     @staticmethod
     def set_refresh_key(key: KeyPair):
         JwtSecurity.refresh_key = key
+        JwtSecurity.refresh_tokens.clear()
 
     @staticmethod
-    def _decode_token(token: str, key: KeyPair):
+    def _decode_token(token: str, key: KeyPair, cache: TokenCache = None):
+        payload = cache.get(token) if cache is not None else None
+        if payload is not None:
+            return payload
+
         try:
-            return jwt.decode(token, key.public, algorithms=["RS256"])
-        except:
+            payload = jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+        except Exception:
             return None
 
+        if cache is not None:
+            cache.put(token, payload)
+        return payload
+
     @staticmethod
     def _create_token(data, expiration_seconds: int, key: KeyPair):
         data["exp"] = int(datetime.now(tz=timezone.utc).timestamp() + expiration_seconds)
-        return jwt.encode(data, key.private, algorithm='RS256')
+        return jwt.encode(data, key.private_key, algorithm=key.algorithm)
 
     @staticmethod
     def decode_request(request):
@@ -55,11 +68,11 @@ class JwtSecurity(Decorator, ABC):
 
     @staticmethod
     def decode_refresh_token(token: str):
-        return JwtSecurity._decode_token(token, JwtSecurity.refresh_key)
+        return JwtSecurity._decode_token(token, JwtSecurity.refresh_key, JwtSecurity.refresh_tokens)
 
     @staticmethod
     def decode_access_token(token: str):
-        return JwtSecurity._decode_token(token, JwtSecurity.access_key)
+        return JwtSecurity._decode_token(token, JwtSecurity.access_key, JwtSecurity.access_tokens)
 
     @staticmethod
     def create_refresh_token(data, expiration_seconds: int):
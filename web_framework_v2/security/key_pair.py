@@ -1,5 +1,17 @@
+import jwt
+
+
 class KeyPair:
-    def __init__(self, public: str, private: str):
+    def __init__(self, public, private, algorithm: str = "RS256"):
+        """
+        The keys tokens are signed and verified with, parsed once instead of on every request.
+        :param public: the PEM of the key verifying tokens, the secret for HMAC algorithms
+        :param private: the PEM of the key signing tokens, the secret for HMAC algorithms, None to only verify tokens
+        :param algorithm: the algorithm of the keys, EdDSA and ES256 verify much faster than RS256
+        """
         self.public = public
         self.private = private
-
+        self.algorithm = algorithm
+        algorithm_object = jwt.get_algorithm_by_name(algorithm)
+        self.public_key = algorithm_object.prepare_key(public) if public is not None else None
+        self.private_key = algorithm_object.prepare_key(private) if private is not None else None
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = 4096):
+        """
+        Remembers the payloads of tokens whose signature was verified so repeated requests with the same token
+        skip the verification. Entries are dropped once the exp claim of their token passed.
+        Tokens are kept as hashes, never as they were sent.
+        :param max_entries: the maximum amount of tokens remembered, the least recently used are dropped first
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # token hash: payload
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        """
+        :return: a copy of the payload of a verified token that did not expire, None when it has to be verified
+        """
+        key = TokenCache._hash(token)
+        with self._lock:
+            payload = self._entries.get(key, None)
+            if payload is None:
+                self.misses += 1
+                return None
+
+            if "exp" in payload and payload["exp"] <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(payload)
+
+    def put(self, token: str, payload: dict):
+        if not isinstance(payload, dict) or not isinstance(payload.get("exp", 0), (int, float)):
+            return
+
+        with self._lock:
+            self._entries[TokenCache._hash(token)] = dict(payload)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _hash(token: str) -> bytes:
+        return hashlib.blake2b(token.encode() if isinstance(token, str) else token, digest_size=16).digest()
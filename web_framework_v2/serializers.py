@@ -0,0 +1,76 @@
+import json
+
+import jsonpickle
+
+from web_framework_v2.http import ContentType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _fast_dumps():
+    if orjson is not None:
+        return orjson.dumps
+    elif ujson is not None:
+        return ujson.dumps
+
+    return json.dumps
+
+
+class JsonSerializer:
+    def __init__(self, dumps=None):
+        """
+        Encodes plain containers (dict, list, str, numbers...) with the fastest json library installed (orjson, ujson, json)
+        and falls back to jsonpickle for objects the fast encoder cannot handle.
+        :param dumps: the fast encoder, defaults to the fastest one installed
+        """
+        self._dumps = dumps if dumps is not None else _fast_dumps()
+
+    def __call__(self, result):
+        try:
+            return self._dumps(result)
+        except (TypeError, ValueError, OverflowError):
+            return jsonpickle.encode(result, unpicklable=False)
+
+
+class JsonPickleSerializer:
+    """
+    Encodes any object using jsonpickle.
+    """
+
+    def __call__(self, result):
+        return jsonpickle.encode(result, unpicklable=False)
+
+
+class SerializerRegistry:
+    def __init__(self):
+        """
+        Maps content types to the serializer endpoint results of that content type are encoded with.
+        A serializer is a callable receiving the result and returning str or bytes.
+        Results of content types without a serializer are sent as they are.
+        """
+        json_serializer = JsonSerializer()
+        self._serializers = {ContentType.json: json_serializer, ContentType.text: json_serializer}
+
+    def register(self, content_type: ContentType, serializer):
+        self._serializers[content_type] = serializer
+
+    def unregister(self, content_type: ContentType):
+        self._serializers.pop(content_type, None)
+
+    def get(self, content_type: ContentType):
+        return self._serializers.get(content_type, None)
+
+    def serialize(self, result, content_type: ContentType):
+        serializer = self._serializers.get(content_type, None)
+        return serializer(result) if serializer is not None else result
+
+
+default_serializers = SerializerRegistry()
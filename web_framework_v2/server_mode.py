@@ -0,0 +1,11 @@
+from enum import Enum
+
+
+class ServerMode(Enum):
+    """
+    The execution model used by the framework to serve connections.
+    """
+
+    THREADED = "threaded"  # A thread per connection
+    WORKER_POOL = "worker_pool"  # A fixed pool of worker threads fed from a bounded queue, overload is shed with 503
+    ASYNCIO = "asyncio"  # A single event loop, sync endpoints are offloaded to a bounded executor
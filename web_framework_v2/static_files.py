@@ -0,0 +1,317 @@
+import logging
+import os
+import stat
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import unquote
+
+from web_framework_v2.compression import Compression
+from web_framework_v2.http import ContentType, HttpResponse, HttpStatus, HttpMethod
+from web_framework_v2.http.byte_ranges import MultipartByteranges, if_range_matches, parse_byte_ranges
+from web_framework_v2.http.conditional import file_etag
+
+logger = logging.getLogger(__name__)
+
+_PRECOMPRESSED_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+class StaticFile:
+    __slots__ = ("path", "size", "mtime", "content_type", "data", "variants")
+
+    def __init__(self, path: str, size: int, mtime: int, content_type: ContentType, data: bytes = None):
+        """
+        A file of the static folder.
+        :param data: the content of the file when it is kept in memory, None when it is streamed from the disk
+        """
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.content_type = content_type
+        self.data = data
+        self.variants = {}  # encoding: compressed bytes, precompressed StaticFile or None when there is no variant
+
+    def footprint(self) -> int:
+        """
+        :return: the amount of bytes kept in memory for this file and its compressed variants
+        """
+        size = len(self.data) if self.data is not None else 0
+        for variant in self.variants.values():
+            if isinstance(variant, bytes):
+                size += len(variant)
+            elif variant is not None and variant.data is not None:
+                size += len(variant.data)
+        return size
+
+
+class StaticFileEngine:
+    def __init__(
+            self,
+            static_folder: str,
+            index_path: str,
+            cache_size: int = 1024 * 1024 * 32,
+            max_cached_file_size: int = 1024 * 256,
+            cache_control: dict = None,
+            compression=None
+    ):
+        """
+        Serves the files of the static folder.
+        Content-Length is taken from os.stat, small files are kept in a size bounded LRU cache keyed by path and mtime
+        and larger files are streamed from the page cache with sendfile.
+        Responses carry ETag and Last-Modified validators and conditional requests are answered with 304,
+        Range requests are answered with 206 holding a single range or a multipart/byteranges body.
+        Paths resolving outside of the static folder are not served.
+        With compression, precompressed siblings (file.br, file.gz) are sent when they are up to date,
+        otherwise cached files are compressed once and the compressed variant is kept with them.
+        :param static_folder: the folder files are served from
+        :param index_path: the file served for "/"
+        :param cache_size: the maximum amount of bytes kept in memory
+        :param max_cached_file_size: files larger than this are never kept in memory
+        :param cache_control: url prefix: Cache-Control header of the files under it, the longest matching prefix is used
+        :param compression: the Compression negotiating encodings, None to always send files as they are
+        """
+        self._root = os.path.realpath(static_folder if len(static_folder) > 0 else os.curdir)
+        self._index_path = index_path
+        self.cache_size = cache_size
+        self.max_cached_file_size = max_cached_file_size
+        self._cache = OrderedDict()  # path: StaticFile
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._compression = compression
+        self._cache_control = []  # (url prefix, Cache-Control), longest prefix first
+        for prefix, value in (cache_control or {}).items():
+            self.set_cache_control(prefix, value)
+
+    def build_response(self, request) -> HttpResponse:
+        try:
+            static_file = self.lookup(request.url)
+            if static_file is None:
+                logger.debug("Failed to find static file for %s", request.url)
+                return HttpResponse(ContentType.text, request.http_version, HttpStatus.NOT_FOUND, bytes())
+
+            logger.debug("Building response using static file at %s", static_file.path)
+            range_header = request.headers.get("range", None)
+            compressible = self._compression is not None and self._compression.compresses(static_file.content_type)
+            encoding, variant = self._variant(request, static_file) if compressible and range_header is None else (None, None)
+
+            body = variant if variant is not None else static_file
+            if isinstance(body, bytes):
+                response = HttpResponse(static_file.content_type, request.http_version, HttpStatus.OK, body)
+            elif body.data is not None:
+                response = HttpResponse(static_file.content_type, request.http_version, HttpStatus.OK, body.data)
+            else:
+                response = HttpResponse.build_from_file(request, body.path, static_file.content_type, body.size)
+
+            response.headers["Accept-Ranges"] = "bytes"
+            cache_control = self.cache_control(request.url)
+            if cache_control is not None:
+                response.headers["Cache-Control"] = cache_control
+            if compressible:
+                Compression.add_vary(response)
+            etag = file_etag(static_file.size, static_file.mtime)
+            response.last_modified = static_file.mtime / 1e9
+            response.apply_validators(request, etag)
+            if encoding is not None:
+                Compression.mark_encoded(response, encoding)
+
+            if range_header is not None and response.status == HttpStatus.OK and request.method is HttpMethod.GET and \
+                    if_range_matches(request, etag, response.last_modified):
+                StaticFileEngine._apply_range(response, static_file, range_header)
+            return response
+        except OSError as e:
+            logger.exception(e)
+            return HttpResponse(ContentType.text, request.http_version, HttpStatus.INTERNAL_SERVER_ERROR, bytes())
+
+    def _variant(self, request, static_file: StaticFile):
+        """
+        Ranges always refer to the identity body, so compressed variants are only used for whole files.
+        :return: (encoding, compressed bytes or precompressed StaticFile) or (None, None) to send the file as it is
+        """
+        for encoding in self._compression.acceptable(request.headers.get("accept-encoding", None)):
+            try:
+                variant = static_file.variants[encoding]
+            except KeyError:
+                variant = self._add_variant(static_file, encoding, self._find_variant(static_file, encoding))
+
+            if variant is not None:
+                return encoding, variant
+
+        return None, None
+
+    def _add_variant(self, static_file: StaticFile, encoding: str, variant):
+        with self._lock:
+            if encoding in static_file.variants:  # Another thread found it first
+                return static_file.variants[encoding]
+
+            footprint = static_file.footprint()
+            static_file.variants[encoding] = variant
+            if self._cache.get(static_file.path, None) is static_file:
+                self._cached_bytes += static_file.footprint() - footprint
+                self._evict()
+            return variant
+
+    def _find_variant(self, static_file: StaticFile, encoding: str):
+        extension = _PRECOMPRESSED_EXTENSIONS.get(encoding, None)
+        if extension is not None:
+            path = static_file.path + extension
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                file_stat = None
+            # Siblings older than the file are stale
+            if file_stat is not None and stat.S_ISREG(file_stat.st_mode) and file_stat.st_mtime_ns >= static_file.mtime:
+                variant = StaticFile(path, file_stat.st_size, file_stat.st_mtime_ns, static_file.content_type)
+                if variant.size <= self.max_cached_file_size and static_file.data is not None:
+                    with open(path, "rb") as file:
+                        variant.data = file.read()
+                    variant.size = len(variant.data)
+                return variant
+
+        if static_file.data is None or static_file.size < self._compression.min_size:
+            return None  # Large files are only sent compressed when a precompressed sibling exists
+        return self._compression.compress(static_file.data, encoding, static=True)
+
+    @staticmethod
+    def _apply_range(response: HttpResponse, static_file: StaticFile, range_header: str):
+        """
+        Turns the response into 206 Partial Content holding the requested ranges, or 416 when none is satisfiable.
+        Malformed Range headers are ignored and the whole file is sent.
+        """
+        ranges = parse_byte_ranges(range_header, static_file.size)
+        if ranges is None:
+            return
+
+        if len(ranges) == 0:
+            response.status = HttpStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+            response.headers["Content-Range"] = f"bytes */{static_file.size}"
+            response.html = b""
+            response.file = None
+            return
+
+        response.status = HttpStatus.PARTIAL_CONTENT
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            response.headers["Content-Range"] = f"bytes {first}-{last}/{static_file.size}"
+            if static_file.data is not None:
+                response.html = static_file.data[first:last + 1]
+            else:
+                response.set_file(static_file.path, first, last - first + 1)
+            return
+
+        content_type = MultipartByteranges(uuid.uuid4().hex)
+        parts = [
+            (
+                f"\r\n--{content_type.boundary}\r\n"
+                f"Content-Type: {static_file.content_type.value}\r\n"
+                f"Content-Range: bytes {first}-{last}/{static_file.size}\r\n\r\n".encode(),
+                first,
+                last - first + 1
+            )
+            for first, last in ranges
+        ]
+        epilogue = f"\r\n--{content_type.boundary}--\r\n".encode()
+
+        response.content_type = content_type
+        if static_file.data is not None:
+            response.html = b"".join(preamble + static_file.data[offset:offset + length] for preamble, offset, length in parts) + epilogue
+        else:
+            response.html = b""
+            response.set_file_parts(static_file.path, parts, epilogue)
+
+    def set_cache_control(self, prefix: str, cache_control: str):
+        """
+        Sends cache_control as the Cache-Control header of the files under the url prefix, e.g. ("/assets", "max-age=31536000").
+        """
+        prefix = "/" + prefix.strip("/")
+        self._cache_control = [entry for entry in self._cache_control if entry[0] != prefix]
+        self._cache_control.append((prefix, cache_control))
+        self._cache_control.sort(key=lambda entry: len(entry[0]), reverse=True)
+
+    def cache_control(self, url: str) -> Optional[str]:
+        for prefix, cache_control in self._cache_control:
+            if url.startswith(prefix) and (len(url) == len(prefix) or prefix == "/" or url[len(prefix)] == "/"):
+                return cache_control
+
+        return None
+
+    def resolve(self, url: str) -> Optional[str]:
+        """
+        :return: the path of the file the url points to or None if it is outside of the static folder
+        """
+        relative_path = unquote(url).strip("/")
+        if len(relative_path) == 0:
+            relative_path = self._index_path.strip("/")
+
+        path = os.path.realpath(os.path.join(self._root, relative_path))
+        if path != self._root and not path.startswith(self._root + os.sep):
+            return None
+
+        return path
+
+    def lookup(self, url: str) -> Optional[StaticFile]:
+        """
+        :return: the static file the url points to or None if there is no such file
+        """
+        path = self.resolve(url)
+        if path is None:
+            return None
+
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+
+        with self._lock:
+            cached = self._cache.get(path, None)
+            if cached is not None and cached.mtime == file_stat.st_mtime_ns and cached.size == file_stat.st_size:
+                self._cache.move_to_end(path)
+                return cached
+
+        static_file = StaticFile(path, file_stat.st_size, file_stat.st_mtime_ns, StaticFileEngine.content_type(path))
+        if static_file.size <= self.max_cached_file_size:
+            with open(path, "rb") as file:
+                static_file.data = file.read()
+            static_file.size = len(static_file.data)  # The file may have changed since it was stat'ed
+            self._store(static_file)
+
+        return static_file
+
+    def _store(self, static_file: StaticFile):
+        with self._lock:
+            previous = self._cache.pop(static_file.path, None)
+            if previous is not None:
+                self._cached_bytes -= previous.footprint()
+
+            self._cache[static_file.path] = static_file
+            self._cached_bytes += static_file.footprint()
+            self._evict()
+
+    def _evict(self):
+        while self._cached_bytes > self.cache_size and len(self._cache) > 0:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.footprint()
+
+    def invalidate(self, url: str = None):
+        """
+        Drops a cached file or every cached file when url is None.
+        """
+        with self._lock:
+            if url is None:
+                self._cache.clear()
+                self._cached_bytes = 0
+                return
+
+            static_file = self._cache.pop(self.resolve(url), None)
+            if static_file is not None:
+                self._cached_bytes -= static_file.footprint()
+
+    def cached_bytes(self):
+        return self._cached_bytes
+
+    @staticmethod
+    def content_type(path: str) -> ContentType:
+        extension = os.path.splitext(path)[1][1::].lower()
+        return ContentType[extension] if extension in ContentType.__members__ else ContentType.bin
@@ -0,0 +1,1514 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zlib
+from dataclasses import dataclass
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import List, Optional
+from unittest import mock
+
+from web_framework_v2.access_log import AccessLog
+from web_framework_v2.annotations import PathVariable, RequestBody, QueryParameter
+from web_framework_v2.body_reader import RequestBodyReader
+from web_framework_v2.compression import Compression
+from web_framework_v2.decorator import Decorator
+from web_framework_v2.framework import Framework
+from web_framework_v2.http import HttpMethod, HttpError, HttpRequest, HttpStatus, HttpResponse, ContentType
+from web_framework_v2.http.body_stream import is_stream
+from web_framework_v2.http.byte_ranges import parse_byte_ranges
+from web_framework_v2.http.http_response import content_type_header, send_buffers, status_line
+from web_framework_v2.http_server import HttpServer
+from web_framework_v2.method import Method
+from web_framework_v2.metrics import Metric, MetricsRegistry, ServerMetrics
+from web_framework_v2.middleware import Middleware
+from web_framework_v2.parser import RequestParser
+from web_framework_v2.profiler import SlowRequestProfiler
+from web_framework_v2.request_reader import RequestReader
+from web_framework_v2.response_cache import CachePolicy, ResponseCache
+from web_framework_v2.restartable_timer import RestartableTimer
+from web_framework_v2.route import Endpoint
+from web_framework_v2 import serializers
+from web_framework_v2.serializers import JsonPickleSerializer, JsonSerializer, SerializerRegistry, default_serializers
+from web_framework_v2.server_mode import ServerMode
+from web_framework_v2.security import JwtSecurity, KeyPair
+from web_framework_v2.static_files import StaticFileEngine
+from web_framework_v2.timer_wheel import TimerWheel
+from web_framework_v2.timing import RequestTiming, TimingHooks
+from web_framework_v2.worker_pool_http_server import WorkerPoolHttpServer
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+def _serve(test: unittest.TestCase, server_mode: ServerMode, setup, **options):
+    """
+    Starts a Framework on a free port with the endpoints registered by setup(app), it is shut down after the test.
+    :return: (framework, port)
+    """
+    folder = tempfile.TemporaryDirectory()
+    test.addCleanup(folder.cleanup)
+    port = _free_port()
+    app = Framework(folder.name, "/index.html", port=port, server_mode=server_mode, **options)
+    setup(app)
+    app.start()
+    test.addCleanup(app.shutdown)
+    return app, port
+
+
+def _exchange(port: int, data: bytes, timeout: float = 5) -> bytes:
+    """
+    Sends data and reads until the server closes the connection, the last request has to ask for Connection: close.
+    """
+    with socket.create_connection(("localhost", port), timeout=timeout) as client:
+        client.sendall(data)
+        received = b""
+        while True:
+            chunk = client.recv(65536)
+            if len(chunk) == 0:
+                return received
+            received += chunk
+
+
+class RequestParsing(unittest.TestCase):
+    request = b"GET /hockey/player?name=HeKNon&seasons=2019,2020&active HTTP/1.1\r\n" \
+              b"Host:   localhost\r\n" \
+              b"Authorization: Bearer token\r\n" \
+              b"Content-Length: 4\r\n" \
+              b"\r\n" \
+              b"body"
+
+    def test_request_line(self):
+        request = RequestParser(self.request).parse()
+
+        self.assertEqual(request.method, HttpMethod.GET)
+        self.assertEqual(request.url, "/hockey/player/")
+        self.assertEqual(request.http_version, "HTTP/1.1")
+
+    def test_query_parameters(self):
+        request = RequestParser(self.request).parse()
+
+        self.assertEqual(request.query_parameters, {"name": ["HeKNon"], "seasons": ["2019", "2020"], "active": None})
+        self.assertEqual(RequestParser(b"GET / HTTP/1.1\r\n\r\n").parse().query_parameters, {})
+
+    def test_headers(self):
+        request = RequestParser(self.request).parse()
+
+        self.assertEqual(request.headers["host"], "localhost")
+        self.assertEqual(request.headers.get("authorization"), "Bearer token")
+        self.assertNotIn("cookie", request.headers)
+        self.assertEqual(dict(request.clone().headers), {"host": "localhost", "authorization": "Bearer token", "content-length": "4"})
+
+    def test_header_names_are_case_insensitive(self):
+        headers = RequestParser(self.request).parse().headers
+
+        self.assertEqual(headers["Authorization"], "Bearer token")
+        self.assertEqual(headers.get("CONTENT-LENGTH"), "4")
+        self.assertIn("Host", headers)
+        headers["X-Player"] = "HeKNon"
+        self.assertEqual(headers["x-player"], "HeKNon")
+        del headers["X-PLAYER"]
+        self.assertNotIn("x-player", headers)
+        self.assertNotIn(1, headers)
+
+    def test_body(self):
+        self.assertEqual(RequestParser(self.request).parse().body, b"body")
+        self.assertEqual(RequestParser(b"GET / HTTP/1.1\r\n\r\n").parse().body, b"")
+
+    def test_invalid_method(self):
+        self.assertRaises(KeyError, RequestParser(b"FETCH / HTTP/1.1\r\n\r\n").parse)
+
+
+class IncrementalRequestReading(unittest.TestCase):
+    def test_split_reads(self):
+        reader = RequestReader()
+        request = b"POST /upload HTTP/1.1\r\nContent-Length: 10\r\n\r\n0123456789"
+
+        for i in range(len(request) - 1):
+            reader.feed(request[i:i + 1])
+            self.assertIsNone(reader.next_request())
+
+        reader.feed(request[-1:])
+        self.assertEqual(reader.next_request().body, b"0123456789")
+        self.assertFalse(reader.has_buffered_data())
+
+    def test_pipelined_requests(self):
+        reader = RequestReader()
+        reader.feed(b"GET /first HTTP/1.1\r\n\r\n"
+                    b"POST /second HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc"
+                    b"GET /third HTTP/1.1\r\n\r\nGET /fou")
+
+        self.assertEqual(reader.next_request().url, "/first/")
+        second = reader.next_request()
+        self.assertEqual((second.url, second.body), ("/second/", b"abc"))
+        self.assertEqual(reader.next_request().url, "/third/")
+        self.assertIsNone(reader.next_request())
+
+        reader.feed(b"rth HTTP/1.1\r\n\r\n")
+        self.assertEqual(reader.next_request().url, "/fourth/")
+
+    def test_chunked_body(self):
+        reader = RequestReader()
+        reader.feed(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n4\r\nWiki\r\n5;ext=1\r\npe")
+        self.assertIsNone(reader.next_request())
+
+        reader.feed(b"dia\r\n0\r\nX-Trailer: 1\r\n\r\nGET / HTTP/1.1\r\n\r\n")
+        self.assertEqual(reader.next_request().body, b"Wikipedia")
+        self.assertEqual(reader.next_request().method, HttpMethod.GET)
+
+    def test_malformed_body_framing(self):
+        chunked = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+        for data in (
+                chunked + b"-5\r\nhello\r\n0\r\n\r\n",
+                chunked + b"+a\r\n",
+                chunked + b"0x10\r\n",
+                chunked + b"4\r\nWikiX\r\n",
+                chunked + b"4" + b"0" * 64,  # A size line without an end
+                b"POST / HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+                b"POST / HTTP/1.1\r\nContent-Length: 5 bytes\r\n\r\n",
+                b"POST / HTTP/1.1\r\nContent-Length: +5\r\n\r\n",
+        ):
+            with self.subTest(data=data):
+                reader = RequestReader(max_header_size=32)
+                reader.feed(data)
+                with self.assertRaises(HttpError) as context:
+                    reader.next_request()
+                self.assertEqual(context.exception.status, HttpStatus.BAD_REQUEST)
+
+    def test_malformed_content_length_is_answered(self):
+        _, port = _serve(self, ServerMode.THREADED, lambda app: None)
+
+        self.assertTrue(_exchange(port, b"POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n").startswith(b"HTTP/1.1 400"))
+
+    def test_header_size_limit(self):
+        reader = RequestReader(max_header_size=16)
+        reader.feed(b"GET / HTTP/1.1\r\nHost: localhost")
+        self.assertRaises(ValueError, reader.next_request)
+
+    def test_body_size_limit(self):
+        reader = RequestReader(max_body_size=8)
+        reader.feed(b"POST / HTTP/1.1\r\nContent-Length: 9\r\n\r\n")
+        with self.assertRaises(HttpError) as context:
+            reader.next_request()
+        self.assertEqual(context.exception.status, HttpStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        reader = RequestReader(max_body_size=8)
+        reader.feed(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n5\r\n")
+        self.assertRaises(HttpError, reader.next_request)
+
+    def test_streamed_bodies(self):
+        reader = RequestReader(stream_body=lambda request: request.url == "/upload/")
+        reader.feed(b"POST /upload HTTP/1.1\r\nContent-Length: 10\r\n\r\n0123")
+
+        self.assertIsNone(reader.next_request().body)
+        self.assertTrue(reader.is_streaming())
+        self.assertEqual(reader.read_body(3), b"012")
+        self.assertEqual(reader.read_body(3), b"3")
+        self.assertIsNone(reader.read_body(3))
+
+        reader.feed(b"456789POST /upload HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n4\r\nWiki\r\n0\r\n\r\n")
+        self.assertEqual(reader.read_body(100), b"456789")
+        self.assertFalse(reader.is_streaming())
+
+        reader.next_request()
+        self.assertEqual(reader.read_body(2), b"Wi")
+        self.assertEqual(reader.read_body(100), b"ki")
+        self.assertFalse(reader.is_streaming())
+        self.assertFalse(reader.has_buffered_data())
+
+
+@dataclass
+class Player:
+    name: str
+    number: int
+    seasons: List[int]
+    captain: Optional[bool] = None
+
+
+class Team:
+    def __init__(self, name: str, players: List[Player]):
+        self.name = name
+        self.players = players
+
+
+class TokenVerification(unittest.TestCase):
+    def setUp(self):
+        JwtSecurity.set_access_key(KeyPair("s" * 32, "s" * 32, "HS256"))
+
+    def test_verified_tokens_are_cached(self):
+        token = JwtSecurity.create_access_token({"user": "HeKNon"}, 60)
+        cache = JwtSecurity.access_tokens
+        hits, misses = cache.hits, cache.misses
+
+        self.assertEqual(JwtSecurity.decode_access_token(token)["user"], "HeKNon")
+        JwtSecurity.decode_access_token(token)["user"] = "changed"
+        self.assertEqual(JwtSecurity.decode_access_token(token)["user"], "HeKNon")
+        self.assertEqual((cache.hits - hits, cache.misses - misses), (2, 1))
+
+        self.assertIsNone(JwtSecurity.decode_access_token(token[:-2]))
+        JwtSecurity.set_access_key(KeyPair("o" * 32, "o" * 32, "HS256"))
+        self.assertIsNone(JwtSecurity.decode_access_token(token))
+
+    def test_expired_tokens(self):
+        token = JwtSecurity.create_access_token({"user": "HeKNon"}, 60)
+        JwtSecurity.decode_access_token(token)
+        JwtSecurity.access_tokens._entries[next(iter(JwtSecurity.access_tokens._entries))]["exp"] = 0
+
+        self.assertIsNone(JwtSecurity.access_tokens.get(token))
+
+
+class RequestDecoding(unittest.TestCase):
+    @staticmethod
+    def _request(body: bytes = b"", query: str = ""):
+        request = RequestParser(b"POST /team" + query.encode() + b" HTTP/1.1\r\n\r\n").parse()
+        request.body = body
+        return request
+
+    def test_dataclass_body(self):
+        player = RequestBody(Player).value_generator(
+            self._request(b'{"name": "HeKNon", "number": "7", "seasons": [2019, 2020]}'))
+
+        self.assertEqual(player, Player("HeKNon", 7, [2019, 2020]))
+
+    def test_nested_init_body(self):
+        team = RequestBody(Team).value_generator(
+            self._request(b'{"name": "Hawks", "players": [{"name": "A", "number": 1, "seasons": []}], "city": "Haifa"}'))
+
+        self.assertEqual(team.players, [Player("A", 1, [])])
+        self.assertEqual(team.city, "Haifa")
+
+    def test_scalars(self):
+        self.assertEqual(RequestBody().value_generator(self._request(b'{"a": 1}')), {"a": 1})
+        self.assertEqual(RequestBody(str).value_generator(self._request(b"plain text")), "plain text")
+        self.assertIsNone(RequestBody(Player).value_generator(self._request()))
+        self.assertEqual(QueryParameter("seasons", List[int]).value_generator(self._request(query="?seasons=2019,2020")), [2019, 2020])
+        self.assertEqual(QueryParameter("active", bool).value_generator(self._request(query="?active=true")), True)
+
+    def test_string_query_parameters_keep_commas(self):
+        request = self._request(query="?file-name=a,b.png&seasons=2019,2020")
+
+        self.assertEqual(QueryParameter("file-name").value_generator(request), "a,b.png")
+        self.assertEqual(QueryParameter("file-name", Optional[str]).value_generator(request), "a,b.png")
+        self.assertEqual(QueryParameter("seasons", List[str]).value_generator(request), ["2019", "2020"])
+
+    def test_converted_path_variables(self):
+        player_id = uuid.uuid4()
+        request = HttpRequest(HttpMethod.GET, "/players/", "HTTP/1.1", {}, {}, b"", {"id": player_id, "number": 7})
+
+        self.assertIs(PathVariable("id", uuid.UUID).value_generator(request), player_id)
+        self.assertEqual(PathVariable("number", int).value_generator(request), 7)
+
+    def test_classes_built_from_text(self):
+        player_id = uuid.uuid4()
+        request = self._request(query=f"?id={player_id}&salary=1.5&born=1990-03-04")
+        request.path_variables = {"id": str(player_id), "salary": "1.5", "born": "1990-03-04"}
+
+        for annotation in (QueryParameter, PathVariable):
+            with self.subTest(annotation=annotation.__name__):
+                self.assertEqual(annotation("id", uuid.UUID).value_generator(request), player_id)
+                self.assertEqual(annotation("salary", Decimal).value_generator(request), Decimal("1.5"))
+                self.assertEqual(annotation("born", datetime.date).value_generator(request), datetime.date(1990, 3, 4))
+
+    def test_malformed_input(self):
+        for annotation, request in (
+                (QueryParameter("id", uuid.UUID), self._request(query="?id=not-a-uuid")),
+                (QueryParameter("salary", Decimal), self._request(query="?salary=lots")),
+                (QueryParameter("born", datetime.date), self._request(query="?born=1990-13-04")),
+                (RequestBody(Player), self._request(b"{not json")),
+                (RequestBody(Player), self._request(b'{"name": "HeKNon", "seasons": []}')),
+                (RequestBody(Player), self._request(b'{"name": "HeKNon", "number": "seven", "seasons": []}')),
+                (QueryParameter("number", int), self._request(query="?number=seven"))
+        ):
+            with self.assertRaises(HttpError) as context:
+                annotation.value_generator(request)
+            self.assertEqual(context.exception.status, HttpStatus.BAD_REQUEST)
+
+
+class CallPlans(unittest.TestCase):
+    @staticmethod
+    def _request(query: dict = None, path_variables: dict = None, body: bytes = b""):
+        return HttpRequest(HttpMethod.GET, "/players/", "HTTP/1.1", {}, query or {}, body, path_variables or {})
+
+    @staticmethod
+    def _response():
+        return HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+
+    def test_defaults_and_unannotated_parameters(self):
+        def endpoint(required, limit=10, *args, **kwargs):
+            pass
+
+        plan = Method.compile_call_plan(endpoint)
+        self.assertEqual([name for name, _ in plan], ["limit"])  # Nothing resolves required, it is left out of the call
+        self.assertEqual(Method(endpoint)._build_kwargs(self._request(), self._response()), (True, {"limit": 10}))
+
+    def test_annotated_parameters(self):
+        def endpoint(request: HttpRequest, response: HttpResponse, name: PathVariable("name"),
+                     page: QueryParameter("page", int) = 1, size: QueryParameter("size", int) = 20, body: RequestBody() = None):
+            pass
+
+        request, response = self._request({"page": ["3"]}, {"name": "HeKNon"}), self._response()
+        should_execute, kwargs = Method(endpoint)._build_kwargs(request, response)
+
+        self.assertTrue(should_execute)
+        self.assertEqual(kwargs, {"request": request, "response": response, "name": "HeKNon", "page": 3, "size": 20, "body": None})
+
+    def test_decorator_results_and_short_circuit(self):
+        calls = []
+
+        class Authorized(Decorator):
+            def __init__(self, user):
+                super().__init__()
+                self.user = user
+
+            def should_execute_endpoint(self, request, request_body):
+                calls.append(request_body)
+                return self.user is not None, self.user, "denied"
+
+            def on_fail(self, request, response, data):
+                return {"error": data}
+
+        @Authorized("HeKNon")
+        def allowed(user: Authorized):
+            return user
+
+        @Authorized(None)
+        def denied(user: Authorized):
+            raise AssertionError("The endpoint must not run when a decorator fails")
+
+        self.assertEqual(Method(allowed)._build_kwargs(self._request(body=b'{"a": 1}'), self._response()), (True, {"user": "HeKNon"}))
+        self.assertFalse(calls[0].is_decoded())  # The body is not decoded for decorators that ignore it
+        self.assertEqual(Method(denied).execute(self._request(), self._response()), {"error": "denied"})
+
+    def test_decorators_share_the_decoded_body(self):
+        class ReadsBody(Decorator):
+            def should_execute_endpoint(self, request, request_body):
+                return True, request_body, None
+
+        @ReadsBody()
+        def endpoint(seen: ReadsBody, body: RequestBody(Player)):
+            pass
+
+        request = self._request(body=b'{"name": "HeKNon", "number": 7, "seasons": []}')
+        _, kwargs = Method(endpoint)._build_kwargs(request, self._response())
+
+        self.assertIs(kwargs["seen"].value(), kwargs["body"])  # Decoded once and handed to both
+
+
+class Serializers(unittest.TestCase):
+    def test_registry(self):
+        registry = SerializerRegistry()
+
+        self.assertIsInstance(registry.get(ContentType.json), JsonSerializer)
+        self.assertEqual(json.loads(registry.serialize({"name": "HeKNon"}, ContentType.json)), {"name": "HeKNon"})
+        self.assertEqual(registry.serialize("<player/>", ContentType.xml), "<player/>")  # No serializer, sent as it is
+
+        registry.register(ContentType.xml, lambda result: f"<player>{result}</player>")
+        self.assertEqual(registry.serialize("HeKNon", ContentType.xml), "<player>HeKNon</player>")
+        registry.unregister(ContentType.json)
+        self.assertEqual(registry.serialize({"raw": True}, ContentType.json), {"raw": True})
+        self.assertIsInstance(default_serializers.get(ContentType.json), JsonSerializer)  # Registries do not share state
+
+    def test_endpoint_serializer_overrides_the_registry(self):
+        def setup(app):
+            app.register_serializer(ContentType.json, lambda result: b"registry:" + str(result).encode())
+            app.get("/registry")(lambda: "HeKNon")
+            app.get("/override", serializer=lambda result: b"endpoint:" + str(result).encode())(lambda: "HeKNon")
+
+        _, port = _serve(self, ServerMode.THREADED, setup)
+        received = _exchange(port, b"GET /registry HTTP/1.1\r\n\r\nGET /override HTTP/1.1\r\nConnection: close\r\n\r\n")
+
+        self.assertIn(b"\r\n\r\nregistry:HeKNon", received)
+        self.assertIn(b"\r\n\r\nendpoint:HeKNon", received)
+
+    def test_fast_encoder_fallback(self):
+        fake_orjson, fake_ujson = SimpleNamespace(dumps=lambda result: b"orjson"), SimpleNamespace(dumps=lambda result: "ujson")
+
+        with mock.patch.object(serializers, "orjson", fake_orjson), mock.patch.object(serializers, "ujson", fake_ujson):
+            self.assertEqual(JsonSerializer()(1), b"orjson")
+        with mock.patch.object(serializers, "orjson", None), mock.patch.object(serializers, "ujson", fake_ujson):
+            self.assertEqual(JsonSerializer()(1), "ujson")
+        with mock.patch.object(serializers, "orjson", None), mock.patch.object(serializers, "ujson", None):
+            self.assertEqual(JsonSerializer()({"a": 1}), '{"a": 1}')
+
+    def test_jsonpickle_fallback(self):
+        team = Team("Hawks", [])
+
+        for dumps in (None, json.dumps):  # The fastest installed encoder and the standard library one
+            self.assertEqual(json.loads(JsonSerializer(dumps)(team)), {"name": "Hawks", "players": []})
+        self.assertEqual(json.loads(JsonPickleSerializer()(team)), {"name": "Hawks", "players": []})
+
+
+class StaticFiles(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.engine = StaticFileEngine(self.folder.name, "/index.html", cache_size=100, max_cached_file_size=60)
+        for name, size in (("index.html", 50), ("a.css", 40), ("big.js", 1000)):
+            with open(os.path.join(self.folder.name, name), "wb") as file:
+                file.write(b"x" * size)
+
+    def test_small_files_are_cached(self):
+        index = self.engine.lookup("/")
+        self.assertEqual(index.data, b"x" * 50)
+        self.assertIs(self.engine.lookup("/index.html/"), index)
+
+        self.engine.lookup("/a.css/")
+        self.assertEqual(self.engine.cached_bytes(), 90)
+
+    def test_large_files_are_streamed(self):
+        response = self.engine.build_response(RequestParser(b"GET /big.js HTTP/1.1\r\n\r\n").parse())
+
+        self.assertEqual(response.file, os.path.join(os.path.realpath(self.folder.name), "big.js"))
+        self.assertEqual(response.content_length(), 1000)
+        self.assertEqual(self.engine.cached_bytes(), 0)
+        self.assertTrue(response.data().endswith(b"Content-Length: 1000\r\n\r\n"))
+
+    def test_modified_files_are_reloaded(self):
+        self.engine.lookup("/a.css")
+        path = os.path.join(self.folder.name, "a.css")
+        with open(path, "wb") as file:
+            file.write(b"y" * 10)
+        os.utime(path, ns=(0, 0))
+
+        self.assertEqual(self.engine.lookup("/a.css").data, b"y" * 10)
+        self.assertEqual(self.engine.cached_bytes(), 10)
+
+    def test_paths_outside_the_folder(self):
+        self.assertIsNone(self.engine.lookup("/../" + os.path.basename(self.folder.name) + "/a.css/../../etc/passwd"))
+        self.assertIsNone(self.engine.lookup("/%2e%2e/etc/passwd"))
+
+
+class ConditionalRequests(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        with open(os.path.join(folder.name, "app.js"), "wb") as file:
+            file.write(b"x" * 100)
+        self.engine = StaticFileEngine(folder.name, "/index.html", cache_control={"/": "no-cache", "/app.js": "max-age=60"})
+
+    @staticmethod
+    def _request(url: str, headers: bytes = b""):
+        return RequestParser(b"GET " + url.encode() + b" HTTP/1.1\r\n" + headers + b"\r\n").parse()
+
+    def test_static_validators(self):
+        response = self.engine.build_response(self._request("/app.js"))
+        etag = response.headers["ETag"]
+
+        self.assertEqual(response.headers["Cache-Control"], "max-age=60")
+        self.assertIn("Last-Modified", response.headers)
+
+        not_modified = self.engine.build_response(self._request("/app.js", b"If-None-Match: W/" + etag.encode() + b"\r\n"))
+        self.assertEqual(not_modified.status, HttpStatus.NOT_MODIFIED)
+        self.assertEqual(not_modified.data(), b"HTTP/1.1 304 NOT_MODIFIED\r\ncontent-type: text/javascript; charset=utf-8\r\n"
+                                              b"Accept-Ranges: bytes\r\nCache-Control: max-age=60\r\nETag: " + etag.encode() +
+                                              b"\r\nLast-Modified: " + response.headers["Last-Modified"].encode() + b"\r\n\r\n")
+
+        since = b"If-Modified-Since: " + response.headers["Last-Modified"].encode() + b"\r\n"
+        self.assertEqual(self.engine.build_response(self._request("/app.js", since)).status, HttpStatus.NOT_MODIFIED)
+        self.assertEqual(self.engine.build_response(self._request("/app.js", b'If-None-Match: "other"\r\n' + since)).status, HttpStatus.OK)
+
+    def test_endpoint_validators(self):
+        endpoint = Endpoint("/players", HttpMethod.GET, ContentType.json, lambda: ["HeKNon"], etag=True, cache_control="max-age=5")
+        response = HttpResponse.build_from_route(self._request("/players"), endpoint, None, None)
+
+        self.assertEqual(response.headers["Cache-Control"], "max-age=5")
+        etag = response.headers["ETag"]
+        not_modified = HttpResponse.build_from_route(self._request("/players", b"If-None-Match: " + etag.encode() + b"\r\n"), endpoint, None, None)
+        self.assertEqual(not_modified.status, HttpStatus.NOT_MODIFIED)
+        self.assertEqual(not_modified.content_length(), 0)
+
+
+class RangeRequests(unittest.TestCase):
+    content = bytes(range(256)) * 8
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        with open(os.path.join(folder.name, "video.bin"), "wb") as file:
+            file.write(self.content)
+        self.engines = (StaticFileEngine(folder.name, "/"), StaticFileEngine(folder.name, "/", max_cached_file_size=0))
+
+    @staticmethod
+    def _body(response):
+        if response.file is None:
+            return response.html
+
+        with open(response.file, "rb") as file:
+            data = file.read()
+        return b"".join(preamble + data[offset:offset + length] for preamble, offset, length in response.file_parts) + response.file_epilogue
+
+    def _get(self, engine, headers: bytes):
+        return engine.build_response(RequestParser(b"GET /video.bin HTTP/1.1\r\n" + headers + b"\r\n").parse())
+
+    def test_parse_byte_ranges(self):
+        self.assertEqual(parse_byte_ranges("bytes=0-99", 1000), [(0, 99)])
+        self.assertEqual(parse_byte_ranges("bytes=900-", 1000), [(900, 999)])
+        self.assertEqual(parse_byte_ranges("bytes=-100", 1000), [(900, 999)])
+        self.assertEqual(parse_byte_ranges("bytes=500-2000, 0-9,5-20", 1000), [(0, 20), (500, 999)])
+        self.assertEqual(parse_byte_ranges("bytes=1000-", 1000), [])
+        self.assertIsNone(parse_byte_ranges("bytes=9-1", 1000))
+        self.assertIsNone(parse_byte_ranges("items=0-1", 1000))
+
+    def test_single_range(self):
+        for engine in self.engines:
+            response = self._get(engine, b"Range: bytes=100-199\r\n")
+
+            self.assertEqual(response.status, HttpStatus.PARTIAL_CONTENT)
+            self.assertEqual(response.headers["Content-Range"], f"bytes 100-199/{len(self.content)}")
+            self.assertEqual(self._body(response), self.content[100:200])
+            self.assertEqual(response.content_length(), 100)
+
+    def test_multiple_ranges(self):
+        for engine in self.engines:
+            response = self._get(engine, b"Range: bytes=0-9,-10\r\n")
+            body = self._body(response)
+
+            self.assertEqual(response.status, HttpStatus.PARTIAL_CONTENT)
+            self.assertTrue(response.content_type.value.startswith("multipart/byteranges; boundary="))
+            self.assertEqual(response.content_length(), len(body))
+            self.assertIn(b"Content-Range: bytes 0-9/2048\r\n\r\n" + self.content[:10], body)
+            self.assertIn(b"Content-Range: bytes 2038-2047/2048\r\n\r\n" + self.content[-10:], body)
+            self.assertTrue(body.endswith(b"--" + response.content_type.boundary.encode() + b"--\r\n"))
+
+    def test_unsatisfiable_and_if_range(self):
+        engine = self.engines[0]
+        response = self._get(engine, b"Range: bytes=5000-\r\n")
+        self.assertEqual(response.status, HttpStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response.headers["Content-Range"], "bytes */2048")
+
+        etag = self._get(engine, b"").headers["ETag"].encode()
+        self.assertEqual(self._get(engine, b"Range: bytes=0-1\r\nIf-Range: " + etag + b"\r\n").status, HttpStatus.PARTIAL_CONTENT)
+        self.assertEqual(self._get(engine, b'Range: bytes=0-1\r\nIf-Range: "old"\r\n').status, HttpStatus.OK)
+        self.assertEqual(self._get(engine, b"").headers["Accept-Ranges"], "bytes")
+
+
+class ResponseWriting(unittest.TestCase):
+    def test_user_headers(self):
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.CREATED, b"{}")
+        response.set_header("X-Request-Id", 7)
+        response.add_header("Set-Cookie", "a=1")
+        response.add_header("Set-Cookie", "b=2")
+
+        self.assertEqual(response.data(), b"HTTP/1.1 201 CREATED\r\ncontent-type: application/json\r\nX-Request-Id: 7\r\n"
+                                          b"Set-Cookie: a=1\r\nSet-Cookie: b=2\r\nContent-Length: 2\r\n\r\n{}")
+        with self.assertRaises(ValueError):
+            response.set_header("X-Name", "a\r\nSet-Cookie: admin=1")
+
+    def test_non_latin_1_header_values(self):
+        response = HttpResponse(ContentType.bin, "HTTP/1.1", HttpStatus.OK, b"")
+        response.set_header("Content-Disposition", "attachment; filename=\"caf\u00e9.txt\"")  # Latin-1 is sent as it is
+        with self.assertRaises(ValueError):
+            response.add_header("Content-Disposition", "attachment; filename=\"\u20ac.txt\"")
+
+        response.headers["X-Price"] = "5\u20ac"  # Written without the check, sent as UTF-8 instead of failing the send
+        head = response.head()
+        self.assertIn("filename=\"caf\u00e9.txt\"".encode("latin-1"), head)
+        self.assertIn("X-Price: 5\u20ac".encode(), head)
+
+    def test_cached_status_lines(self):
+        self.assertIs(status_line("HTTP/1.1", HttpStatus.OK), status_line("HTTP/1.1", HttpStatus.OK))
+        self.assertIs(content_type_header(ContentType.css), content_type_header(ContentType.css))
+
+    def test_send_buffers(self):
+        class PartialSocket:
+            def __init__(self):
+                self.data = b""
+
+            def sendmsg(self, buffers):
+                sent = bytes(buffers[0][:3])
+                self.data += sent
+                return len(sent)
+
+        client_socket = PartialSocket()
+        send_buffers(client_socket, (b"head\r\n", b"", b"body"))
+        self.assertEqual(client_socket.data, b"head\r\nbody")
+
+    def test_accepted_sockets_disable_nagle(self):
+        app, _ = _serve(self, ServerMode.THREADED, lambda app: None)
+        with HttpServer.create_listen_socket(("localhost", 0), 1) as listen_socket, \
+                socket.create_connection(listen_socket.getsockname()):
+            accepted, address = listen_socket.accept()
+            client = app._http_server._create_client(accepted, address)
+            self.addCleanup(client.close)
+
+            self.assertNotEqual(accepted.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+
+
+class ResponseCaching(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.endpoint = Endpoint("/area/{x}", HttpMethod.GET, ContentType.json, self._area, etag=True, cache=CachePolicy(ttl=60, query_parameters=("y",)))
+        self.cache = ResponseCache()
+
+    def _area(self, request: HttpRequest):
+        self.calls.append(request.url)
+        return request.path_variables["x"] * int(request.query_parameters["y"][0])
+
+    def _get(self, target: str, headers: bytes = b"", ttl: float = 60):
+        request = RequestParser(b"GET " + target.encode() + b" HTTP/1.1\r\n" + headers + b"\r\n").parse()
+        return self.cache.fetch(
+            request, self.endpoint.cache_policy().key(request, self.endpoint, None), ttl,
+            lambda build_request: HttpResponse.build_from_route(build_request, self.endpoint, {"x": 3}, None)
+        )
+
+    def test_hits_and_keys(self):
+        first = self._get("/area/3?y=2&ignored=1")
+        self.assertEqual(first.html, b"6")
+        self.assertEqual(self._get("/area/3?ignored=2&y=2").html, b"6")
+        self._get("/area/3?y=4")
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+        not_modified = self._get("/area/3?y=2", b"If-None-Match: " + first.headers["ETag"].encode() + b"\r\n")
+        self.assertEqual(not_modified.status, HttpStatus.NOT_MODIFIED)
+
+    def test_expiry_and_invalidation(self):
+        self._get("/area/3?y=2", ttl=0)
+        self._get("/area/3?y=2")
+        self._get("/area/3?y=2")
+        self.assertEqual(len(self.calls), 2)
+
+        self.cache.invalidate(url="/area/3")
+        self._get("/area/3?y=2")
+        self.cache.invalidate(route="/area/{x}")
+        self._get("/area/3?y=2")
+        self.assertEqual(len(self.calls), 4)
+
+    def test_only_safe_methods_are_cached(self):
+        Endpoint("/area", HttpMethod.HEAD, ContentType.json, self._area, cache=True)
+        Endpoint("/area", HttpMethod.POST, ContentType.json, self._area, cache=False)
+        for method in (HttpMethod.POST, HttpMethod.PUT, HttpMethod.PATCH, HttpMethod.DELETE):
+            with self.assertRaises(AssertionError):  # The body is not part of the key, every caller would get the first response
+                Endpoint("/area", method, ContentType.json, self._area, cache=60)
+
+    def test_concurrent_misses_are_coalesced(self):
+        started, release = threading.Event(), threading.Event()
+        key = ("/slow/", HttpMethod.GET, "/slow/", (), (), None)
+        request = RequestParser(b"GET /slow HTTP/1.1\r\n\r\n").parse()
+
+        def build(build_request):
+            started.set()
+            release.wait(5)
+            return HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"[]")
+
+        leader = threading.Thread(target=self.cache.fetch, args=(request, key, 60, build))
+        leader.start()
+        started.wait(5)
+        waiters = [threading.Thread(target=self.cache.fetch, args=(request, key, 60, build)) for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        release.set()
+        for thread in [leader] + waiters:
+            thread.join(5)
+
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["hits"] + self.cache.stats()["coalesced"], 3)
+
+
+class StreamingResponses(unittest.TestCase):
+    @staticmethod
+    def _send(response):
+        server, client = socket.socketpair()
+        with server, client:
+            response.send(server)
+            server.shutdown(socket.SHUT_WR)
+            data = b""
+            while True:
+                received = client.recv(65536)
+                if len(received) == 0:
+                    return data
+                data += received
+
+    def test_chunked_generator(self):
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        response.set_stream(iter(["ab", b"", b"cde"]))
+
+        self.assertEqual(self._send(response), b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                                               b"Transfer-Encoding: chunked\r\n\r\n2\r\nab\r\n3\r\ncde\r\n0\r\n\r\n")
+
+    def test_coalesced_async_generator(self):
+        async def rows():
+            for row in range(5):
+                yield f"{row},"
+
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        response.set_stream(rows(), buffer_size=4)
+
+        self.assertTrue(self._send(response).endswith(b"\r\n\r\n4\r\n0,1,\r\n4\r\n2,3,\r\n2\r\n4,\r\n0\r\n\r\n"))
+
+    def test_disconnect_closes_the_stream(self):
+        closed = []
+
+        class Rows:
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                return b"x" * 1024
+
+            def close(self):
+                closed.append(True)
+
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        response.set_stream(Rows())
+        server, client = socket.socketpair()
+        client.close()
+        with server, self.assertRaises(OSError):
+            response.send(server)
+        self.assertEqual(closed, [True])
+
+    def test_only_generators_are_streamed(self):
+        def rows():
+            yield b"a"
+
+        def mapped():
+            return map(str, [1, 2])
+
+        request = HttpRequest(HttpMethod.GET, "/rows", "HTTP/1.1", {}, {}, b"", {})
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        generator = rows()
+
+        self.assertIs(Method(lambda: generator).execute(request, response), generator)
+        # Other iterators keep being encoded by the serializers instead of being sent as body chunks
+        self.assertEqual(json.loads(Method(mapped).execute(request, response)), {"py/iterator": ["1", "2"]})
+        with tempfile.TemporaryFile() as file:
+            self.assertFalse(is_stream(file))
+            self.assertFalse(is_stream(iter([b"a"])))
+
+    def test_http_1_0_stream(self):
+        response = HttpResponse(ContentType.json, "HTTP/1.0", HttpStatus.OK, b"")
+        response.set_stream(iter([b"a", b"b"]))
+
+        self.assertTrue(response.requires_close())
+        self.assertTrue(self._send(response).endswith(b"application/json\r\n\r\nab"))
+
+
+class ResponseCompression(unittest.TestCase):
+    @staticmethod
+    def _request(url: str = "/", accept_encoding: bytes = b"gzip, deflate"):
+        return RequestParser(b"GET " + url.encode() + b" HTTP/1.1\r\nAccept-Encoding: " + accept_encoding + b"\r\n\r\n").parse()
+
+    def test_negotiate(self):
+        compression = Compression(encodings=("gzip", "deflate"))
+
+        self.assertEqual(compression.negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(compression.negotiate("deflate, gzip;q=0.5"), "deflate")
+        self.assertEqual(compression.negotiate("*;q=0.1, gzip;q=0"), "deflate")
+        self.assertIsNone(compression.negotiate("identity"))
+        self.assertIsNone(compression.negotiate(None))
+
+    def test_apply(self):
+        compression = Compression(min_size=100)
+        body = b'{"players": []}' * 20
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, body)
+        response.headers["ETag"] = '"abc"'
+        compression.apply(self._request(), response)
+
+        self.assertEqual(zlib.decompress(response.html, 31), body)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["ETag"], '"abc-gzip"')
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+
+        small = compression.apply(self._request(), HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"{}"))
+        self.assertNotIn("Content-Encoding", small.headers)
+        image = compression.apply(self._request(), HttpResponse(ContentType.png, "HTTP/1.1", HttpStatus.OK, body))
+        self.assertEqual(image.html, body)
+
+    def test_stream(self):
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        response.set_stream(iter(["[1,", "2]"]))
+        Compression().apply(self._request(accept_encoding=b"deflate"), response)
+
+        self.assertEqual(zlib.decompress(b"".join(response.stream)), b"[1,2]")
+
+    def test_opt_in(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+
+        self.assertIsNone(Framework(folder.name, "/index.html").compression())
+        self.assertIsInstance(Framework(folder.name, "/index.html", compression=True).compression(), Compression)
+
+    def test_static_variants(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        for name, data in (("app.js", b"let x = 1;" * 200), ("app.css", b"a {}" * 500), ("app.css.gz", b"precompressed")):
+            with open(os.path.join(folder.name, name), "wb") as file:
+                file.write(data)
+        engine = StaticFileEngine(folder.name, "/", compression=Compression(encodings=("gzip", "deflate")))
+
+        response = engine.build_response(self._request("/app.js"))
+        self.assertEqual(zlib.decompress(response.html, 31), b"let x = 1;" * 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertTrue(response.headers["ETag"].endswith('-gzip"'))
+        self.assertIs(engine.build_response(self._request("/app.js")).html, response.html)
+        self.assertEqual(engine.cached_bytes(), 2000 + len(response.html))
+
+        self.assertEqual(engine.build_response(self._request("/app.css")).html, b"precompressed")
+        deflated = engine.build_response(self._request("/app.css", b"deflate"))
+        self.assertEqual(zlib.decompress(deflated.html), b"a {}" * 500)
+
+        not_modified = engine.build_response(self._request("/app.js", b"gzip\r\nIf-None-Match: " + response.headers["ETag"].encode()))
+        self.assertEqual(not_modified.status, HttpStatus.NOT_MODIFIED)
+        ranged = engine.build_response(self._request("/app.js", b"gzip\r\nRange: bytes=0-9"))
+        self.assertEqual(ranged.html, b"let x = 1;")
+        self.assertNotIn("Content-Encoding", ranged.headers)
+
+
+class BodyReading(unittest.TestCase):
+    def test_reader(self):
+        body = RequestBodyReader.from_bytes(b"0123456789")
+        body.chunk_size = 4
+
+        self.assertEqual(body.read(3), b"012")
+        self.assertEqual(list(body), [b"3456", b"789"])
+        self.assertEqual(body.read(), b"")
+        self.assertTrue(body.is_finished())
+
+    def test_spool(self):
+        request = RequestParser(b"POST / HTTP/1.1\r\n\r\n").parse()
+        request.body = b"x" * 100
+        request.body_stream = RequestBodyReader.from_bytes(request.body, spool_size=10)
+
+        spooled = RequestBody(spool=True).value_generator(request)
+        self.assertEqual(spooled.read(), b"x" * 100)
+        self.assertTrue(spooled._rolled)
+
+    def test_async_reader(self):
+        async def read_all(body):
+            return [chunk async for chunk in body]
+
+        body = RequestBodyReader.from_bytes(b"abcdef")
+        body.chunk_size = 4
+        self.assertEqual(asyncio.run(read_all(body)), [b"abcd", b"ef"])
+
+    def test_endpoint_is_looked_up_once_per_request_with_a_body(self):
+        for server_mode in (ServerMode.THREADED, ServerMode.ASYNCIO):
+            with self.subTest(server_mode=server_mode):
+                def setup(app):
+                    @app.post("/upload")
+                    def upload(body: RequestBody(raw_format=True)):
+                        return len(body)
+
+                app, port = _serve(self, server_mode, setup)
+                with mock.patch.object(app, "get_endpoint", wraps=app.get_endpoint) as get_endpoint:
+                    received = _exchange(port, b"POST /upload HTTP/1.1\r\nContent-Length: 4\r\nConnection: close\r\n\r\nbody")
+
+                self.assertTrue(received.endswith(b"\r\n\r\n4"))
+                self.assertEqual(get_endpoint.call_count, 1)
+
+
+class RequestTimings(unittest.TestCase):
+    def test_endpoint_phases(self):
+        request = RequestParser(b"GET /players HTTP/1.1\r\n\r\n").parse()
+        request.timing = RequestTiming()
+        endpoint = Endpoint("/players", HttpMethod.GET, ContentType.json, lambda: ["HeKNon"])
+        HttpResponse.build_from_route(request, endpoint, None, None)
+
+        self.assertEqual(list(request.timing.phases), ["decorators", "handler", "encode"])
+
+    def test_server_timing_and_hooks(self):
+        timing = RequestTiming()
+        timing.add("parse", 0.0015)
+        hooks = TimingHooks(server_timing=True)
+        reported = []
+        hooks.add(lambda request, response, request_timing: 1 / 0)
+        hooks.add(lambda request, response, request_timing: reported.append(request_timing))
+
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        hooks.before_send(response, timing)
+        with self.assertLogs("web_framework_v2.timing", "ERROR"):
+            hooks.report(None, response, timing)
+
+        self.assertTrue(response.headers["Server-Timing"].startswith("parse;dur=1.500, total;dur="))
+        self.assertEqual(reported, [timing])
+
+    def test_every_request_is_timed(self):
+        def setup(app):
+            @app.get("/players")
+            def players():
+                return ["HeKNon"]
+
+        for server_mode in (ServerMode.THREADED, ServerMode.ASYNCIO, ServerMode.WORKER_POOL):
+            with self.subTest(server_mode=server_mode):
+                _, port = _serve(self, server_mode, setup, server_timing=True)
+                received = _exchange(port, b"GET /players HTTP/1.1\r\n\r\nGET /players HTTP/1.1\r\nConnection: close\r\n\r\n")
+                timings = [line for line in received.split(b"\r\n") if line.startswith(b"Server-Timing: ")]
+
+                self.assertEqual(len(timings), 2)  # The pipelined request is timed as well
+                self.assertIn(b"read;dur=", timings[0])
+                self.assertIn(b"parse;dur=", timings[1])
+
+
+class Metrics(unittest.TestCase):
+    def test_metrics_implement_samples(self):
+        class Incomplete(Metric):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete("incomplete", "Does not implement samples")
+
+    def test_counter_shards(self):
+        counter = MetricsRegistry().counter("jobs_total", "Jobs", ("kind",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc("a")
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc("b", amount=2)
+
+        self.assertEqual(counter.value("a"), 8000)
+        self.assertEqual(counter.render(), '# HELP jobs_total Jobs\n# TYPE jobs_total counter\njobs_total{kind="a"} 8000\njobs_total{kind="b"} 2')
+
+    def test_histogram(self):
+        histogram = MetricsRegistry().histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.render().split("\n")[2:], [
+            'latency_seconds_bucket{le="0.1"} 1', 'latency_seconds_bucket{le="1"} 3', 'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 4.05", "latency_seconds_count 4"
+        ])
+
+    def test_registry(self):
+        registry = MetricsRegistry()
+        self.assertIs(registry.gauge("open", "Open"), registry.gauge("open", "Open"))
+        with self.assertRaises(ValueError):
+            registry.counter("open", "Open")
+
+    def test_server_metrics(self):
+        metrics = ServerMetrics(MetricsRegistry())
+        request = RequestParser(b"GET /players HTTP/1.1\r\n\r\n").parse()
+        endpoint = Endpoint("/players", HttpMethod.GET, ContentType.json, lambda: [])
+        metrics.record(request, endpoint, HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"[]"), 0.002)
+
+        self.assertEqual(metrics.requests.value("GET", "/players/", "200"), 1)
+        self.assertEqual(metrics.response_bytes.value(), 2)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/players/"} 1', metrics.registry.render())
+
+
+class SlowRequestProfiling(unittest.TestCase):
+    @staticmethod
+    def _profile(profiler, endpoint_function):
+        request = RequestParser(b"GET /report?year=2021 HTTP/1.1\r\n\r\n").parse()
+        endpoint = Endpoint("/report", HttpMethod.GET, ContentType.json, endpoint_function)
+        session = profiler.begin(request, endpoint)
+        response = HttpResponse.build_from_route(request, endpoint, None, None)
+        profiler.end(session, response)
+
+    def test_slow_requests_are_sampled(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        reports = []
+        profiler = SlowRequestProfiler(threshold=0.02, directory=folder.name, callback=reports.append, max_files=1, interval=0.002)
+
+        def slow_report():
+            time.sleep(0.1)
+            return []
+
+        with self.assertLogs("web_framework_v2.profiler", "WARNING"):
+            self._profile(profiler, slow_report)
+            self._profile(profiler, slow_report)
+        self._profile(profiler, lambda: [])
+
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(reports[0].route, "/report/")
+        self.assertIn("slow_report", reports[0].profile)
+        self.assertEqual(len(os.listdir(folder.name)), 1)
+
+    def test_sampled_requests_use_cprofile(self):
+        reports = []
+        self._profile(SlowRequestProfiler(threshold=10, sample_every=1, callback=reports.append), lambda: [])
+
+        self.assertEqual(reports[0].kind, "cprofile")
+        self.assertIn("cumulative", reports[0].profile)
+
+    def test_session_ends_when_building_the_response_fails(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        profiler = SlowRequestProfiler(threshold=10, callback=lambda report: None)
+        request = RequestParser(b"GET /report HTTP/1.1\r\n\r\n").parse()
+
+        async def report():
+            return []
+
+        endpoint = Endpoint("/report", HttpMethod.GET, ContentType.json, report)
+        for server_mode in (ServerMode.THREADED, ServerMode.ASYNCIO):
+            server = Framework(folder.name, "/index.html", server_mode=server_mode, profiler=profiler)._http_server
+            build = server.build_route_response if server_mode is ServerMode.THREADED else \
+                lambda *arguments: asyncio.run(server._build_route_response_async(*arguments))
+            with mock.patch.object(HttpResponse, "build_from_route", side_effect=RuntimeError("failed")), \
+                    mock.patch.object(HttpResponse, "build_from_route_async", side_effect=RuntimeError("failed")):
+                self.assertRaisesRegex(RuntimeError, "failed", build, request, endpoint, None)
+            server.shutdown()
+            self.assertEqual(profiler._active, {})
+
+
+class RequestLogging(unittest.TestCase):
+    class _Collector(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.lines = []
+
+        def emit(self, record):
+            self.lines.append(self.format(record))
+
+    def test_debug_arguments_are_formatted_lazily(self):
+        formatted = []
+
+        class Audit(Decorator):
+            def __init__(self):
+                super().__init__(fail_on_null_result=False)
+
+            def should_execute_endpoint(self, request, request_body):
+                return True, None, None
+
+            def __repr__(self):
+                formatted.append(self)
+                return "Audit()"
+
+        @Audit()
+        def players():
+            return ["HeKNon"]
+
+        request = RequestParser(b"GET /players HTTP/1.1\r\n\r\n").parse()
+        endpoint = Endpoint("/players", HttpMethod.GET, ContentType.json, players)
+        package_logger = logging.getLogger("web_framework_v2")
+        level = package_logger.level
+        self.addCleanup(package_logger.setLevel, level)
+
+        package_logger.setLevel(logging.INFO)
+        HttpResponse.build_from_route(request, endpoint, None, None)
+        self.assertEqual(formatted, [])
+
+        package_logger.setLevel(logging.DEBUG)
+        with self.assertLogs("web_framework_v2.method", "DEBUG"):
+            HttpResponse.build_from_route(request, endpoint, None, None)
+        self.assertEqual(len(formatted), 1)
+
+    def test_access_log(self):
+        collector = RequestLogging._Collector()
+        access_log = AccessLog([collector], logger_name="web_framework_v2.access.test")
+        request = RequestParser(b"GET /players?page=2 HTTP/1.1\r\nUser-Agent: tests\r\n\r\n").parse()
+        request.client_address = ("127.0.0.1", 50000)
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"[]")
+
+        access_log(request, response, RequestTiming())  # Not started, nothing is queued
+        access_log.start()
+        access_log(request, response, RequestTiming())
+        access_log.stop()
+
+        self.assertEqual(len(collector.lines), 1)
+        fields = json.loads(collector.lines[0])
+        self.assertEqual(
+            {name: fields[name] for name in ("remote", "method", "url", "status", "bytes", "user_agent")},
+            {"remote": "127.0.0.1", "method": "GET", "url": "/players/", "status": 200, "bytes": 2, "user_agent": "tests"}
+        )
+
+    def test_full_queue_drops_records(self):
+        access_log = AccessLog([RequestLogging._Collector()], queue_size=1, logger_name="web_framework_v2.access.full")
+        access_log.start()
+        access_log._listener.stop()  # Nothing drains the queue anymore
+        request = RequestParser(b"GET / HTTP/1.1\r\n\r\n").parse()
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        for _ in range(3):
+            access_log(request, response, RequestTiming())
+
+        self.assertEqual(access_log.dropped, 2)
+        access_log.logger.removeHandler(access_log._handler)
+
+
+class MiddlewareChains(unittest.TestCase):
+    @staticmethod
+    def _endpoint(route, function, *middleware):
+        endpoint = Endpoint(route, HttpMethod.GET, ContentType.json, function)
+        endpoint.set_middleware(list(middleware))
+        return endpoint
+
+    @staticmethod
+    def _request(url):
+        return RequestParser(f"GET {url} HTTP/1.1\r\n\r\n".encode()).parse()
+
+    def test_order_and_prefixes(self):
+        calls = []
+
+        def around(request, response, proceed):
+            calls.append("around")
+            return proceed(request, response) + b"!"
+
+        def after(request, response, result):
+            calls.append("after")
+            response.headers["X-Result-Size"] = str(len(result))
+
+        middleware = [
+            Middleware(Middleware.BEFORE, lambda request, response: calls.append("before")),
+            Middleware(Middleware.AROUND, around),
+            Middleware(Middleware.AFTER, after),
+            Middleware(Middleware.BEFORE, lambda request, response: calls.append("admin"), "/admin"),
+        ]
+        endpoint = self._endpoint("/players", lambda: calls.append("endpoint") or ["HeKNon"], *middleware)
+        response = HttpResponse.build_from_route(self._request("/players"), endpoint, None, None)
+
+        self.assertEqual(calls, ["before", "around", "endpoint", "after"])
+        self.assertEqual(response.html, b'["HeKNon"]!')
+        self.assertEqual(response.headers["X-Result-Size"], "10")
+
+    def test_short_circuit(self):
+        def require_token(request, response):
+            if "authorization" not in request.headers:
+                response.status = HttpStatus.UNAUTHORIZED
+                return {"error": "missing token"}
+
+        executed = []
+        endpoint = self._endpoint("/admin/stats", lambda: executed.append(True), Middleware(Middleware.BEFORE, require_token, "admin"))
+        response = HttpResponse.build_from_route(self._request("/admin/stats"), endpoint, None, None)
+
+        self.assertEqual(response.status, HttpStatus.UNAUTHORIZED)
+        self.assertEqual(response.html, b'{"error":"missing token"}')
+        self.assertEqual(executed, [])
+
+    def test_coroutine_hooks(self):
+        async def before(request, response):
+            await asyncio.sleep(0)
+            response.headers["X-Checked"] = "1"
+
+        async def players():
+            return ["HeKNon"]
+
+        sync_around = Middleware(Middleware.AROUND, lambda request, response, proceed: proceed(request, response))
+        coroutine_endpoint = self._endpoint("/players", players, Middleware(Middleware.BEFORE, before), sync_around)
+        response = asyncio.run(HttpResponse.build_from_route_async(self._request("/players"), coroutine_endpoint, None, None))
+        self.assertEqual((response.html, response.headers["X-Checked"]), (b'["HeKNon"]', "1"))
+
+        endpoint = self._endpoint("/players", lambda: ["HeKNon"], Middleware(Middleware.BEFORE, before))
+        response = HttpResponse.build_from_route(self._request("/players"), endpoint, None, None)
+        self.assertEqual(response.headers["X-Checked"], "1")
+
+    def test_lazy_body(self):
+        bodies = []
+
+        def remember(request, response):
+            bodies.append(request.lazy_body)
+
+        def owner_only(request, response):
+            if request.lazy_body.name != "HeKNon":
+                return {"error": "not the owner"}
+
+        def rename(player: RequestBody(Player)):
+            bodies.append(player)
+            return player.name
+
+        request = RequestParser(b'GET /players HTTP/1.1\r\nContent-Length: 47\r\n\r\n{"name": "HeKNon", "number": 7, "seasons": []}').parse()
+        endpoint = self._endpoint("/players", lambda: "listed", Middleware(Middleware.BEFORE, remember))
+        HttpResponse.build_from_route(request, endpoint, None, None)
+        self.assertFalse(bodies[0].is_decoded())  # Neither the hook nor the endpoint asked for it
+
+        endpoint = self._endpoint("/players", rename, Middleware(Middleware.BEFORE, remember), Middleware(Middleware.BEFORE, owner_only))
+        response = HttpResponse.build_from_route(request, endpoint, None, None)
+        self.assertEqual(response.html, b'"HeKNon"')
+        self.assertIs(bodies[1].value(), bodies[2])  # Decoded once, like the endpoint's RequestBody
+
+    def test_request_body_is_decoded_once_when_needed(self):
+        seen = []
+
+        class Audit(Decorator):
+            def should_execute_endpoint(self, request, request_body):
+                seen.append(request_body)
+                return True, "audited", None
+
+        class Owner(Decorator):
+            def should_execute_endpoint(self, request, request_body):
+                seen.append(request_body)
+                return True, request_body["name"], None
+
+        @Audit()
+        def audited(audit: Audit):
+            return audit
+
+        @Owner()
+        def owned(player: RequestBody(), owner: Owner):
+            seen.append(player)
+            return owner
+
+        request = RequestParser(b'POST /players HTTP/1.1\r\nContent-Length: 18\r\n\r\n{"name": "HeKNon"}').parse()
+        response = HttpResponse(ContentType.json, "HTTP/1.1", HttpStatus.OK, b"")
+        self.assertEqual(Method(audited).execute(request, response), b'"audited"')
+        self.assertFalse(seen[0].is_decoded())
+
+        self.assertEqual(Method(owned).execute(request, response), b'"HeKNon"')
+        self.assertIs(seen[1].value(), seen[2])
+
+
+class AsyncServing(unittest.TestCase):
+    @staticmethod
+    def _endpoints(app):
+        @app.get("/coroutine")
+        async def coroutine():
+            await asyncio.sleep(0)
+            return ["HeKNon"]
+
+        @app.get("/blocking")
+        def blocking():
+            return threading.current_thread().name
+
+    def test_keep_alive_and_pipelining(self):
+        _, port = _serve(self, ServerMode.ASYNCIO, self._endpoints)
+        received = _exchange(
+            port,
+            b"GET /coroutine HTTP/1.1\r\n\r\nGET /blocking HTTP/1.1\r\n\r\nGET /missing HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+
+        self.assertEqual(received.count(b"HTTP/1.1 200 OK"), 2)
+        self.assertIn(b"HTTP/1.1 404", received)
+        self.assertIn(b'["HeKNon"]', received)
+        self.assertIn(b"web_framework_v2-executor", received)  # Regular endpoints do not block the loop
+
+    def test_replaced_server_releases_its_socket(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        port = _free_port()
+        app = Framework(folder.name, "/index.html", port=port)
+        self._endpoints(app)
+        threaded = app._http_server
+
+        app.start(ServerMode.ASYNCIO)
+        self.addCleanup(app.shutdown)
+
+        self.assertIsNone(threaded._socket)
+        self.assertIn(b'["HeKNon"]', _exchange(port, b"GET /coroutine HTTP/1.1\r\nConnection: close\r\n\r\n"))
+
+
+    def test_shutdown_before_the_loop_runs(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        server = Framework(folder.name, "/index.html", server_mode=ServerMode.ASYNCIO)._http_server
+        server._socket = HttpServer.create_listen_socket(("localhost", 0), 1)  # Where start leaves it before _serve runs
+
+        server.shutdown()
+        serving = threading.Thread(target=server._serve, daemon=True)
+        serving.start()
+        serving.join(5)
+
+        self.assertFalse(serving.is_alive())
+        self.assertTrue(server._loop.is_closed())
+        self.assertEqual(server._socket.fileno(), -1)
+
+    def test_decorators_of_coroutine_endpoints_run_on_the_executor(self):
+        threads = []
+
+        class Blocking(Decorator):
+            def should_execute_endpoint(self, request, request_body):
+                threads.append(threading.current_thread().name)
+                return True, "HeKNon", None
+
+        def setup(app):
+            @app.get("/player")
+            @Blocking()
+            async def player(name: Blocking):
+                return name
+
+        _, port = _serve(self, ServerMode.ASYNCIO, setup)
+        received = _exchange(port, b"GET /player HTTP/1.1\r\nConnection: close\r\n\r\n")
+
+        self.assertIn(b"HeKNon", received)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("web_framework_v2-executor"), threads[0])
+
+
+class WorkerPoolServing(unittest.TestCase):
+    def test_idle_connections_do_not_hold_workers(self):
+        def setup(app):
+            app.get("/players")(lambda: ["HeKNon"])
+
+        _, port = _serve(self, ServerMode.WORKER_POOL, setup, worker_threads=2)
+        idle = []
+        for _ in range(4):
+            client = socket.create_connection(("localhost", port), timeout=5)
+            self.addCleanup(client.close)
+            client.sendall(b"GET /players HTTP/1.1\r\n\r\n")
+            self.assertIn(b"200 OK", client.recv(65536))
+            idle.append(client)
+
+        received = _exchange(port, b"GET /players HTTP/1.1\r\n\r\nGET /players HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.assertEqual(received.count(b"HTTP/1.1 200 OK"), 2)
+
+        idle[0].sendall(b"GET /players HTTP/1.1\r\n\r\n")  # Parked connections are served again
+        self.assertIn(b'["HeKNon"]', idle[0].recv(65536))
+
+    def test_overload_is_shed(self):
+        entered, release = threading.Event(), threading.Event()
+
+        def setup(app):
+            @app.get("/slow")
+            def slow():
+                entered.set()
+                release.wait(5)
+                return "done"
+
+        app, port = _serve(self, ServerMode.WORKER_POOL, setup, worker_threads=1, worker_queue_size=1)
+        self.addCleanup(release.set)
+        request = b"GET /slow HTTP/1.1\r\nConnection: close\r\n\r\n"
+        responses = []
+        first = threading.Thread(target=lambda: responses.append(_exchange(port, request)))
+        first.start()
+        self.assertTrue(entered.wait(5))
+        second = threading.Thread(target=lambda: responses.append(_exchange(port, request)))
+        second.start()
+        while app._http_server._queue.qsize() == 0:
+            time.sleep(0.01)
+
+        self.assertTrue(_exchange(port, request).startswith(b"HTTP/1.1 503"))
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual([response.count(b"200 OK") for response in responses], [1, 1])
+
+    def test_shutdown_with_a_full_queue(self):
+        server = WorkerPoolHttpServer(None, "localhost", 0, worker_threads=2, queue_size=1)
+        server._queue.put_nowait(("client", "request"))
+
+        server.shutdown()  # Does not block on the full queue
+
+        self.assertTrue(server._stopping)
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "Pre-fork mode requires os.fork")
+class PreforkServing(unittest.TestCase):
+    def test_spawn_restart_and_shutdown(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        port = _free_port()
+        app = Framework(folder.name, "/index.html", port=port)
+        app.get("/pid")(lambda: os.getpid())
+        observed = {}
+
+        def pid_of_a_worker():
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                try:
+                    return int(_exchange(port, b"GET /pid HTTP/1.1\r\nConnection: close\r\n\r\n").split(b"\r\n\r\n", 1)[1])
+                except (OSError, ValueError, IndexError):
+                    time.sleep(0.05)
+            raise AssertionError("The workers did not start")
+
+        def exercise():
+            try:
+                observed["served_by"] = pid_of_a_worker()
+                observed["spawned"] = app._supervisor.worker_pids()
+                os.kill(observed["spawned"][0], signal.SIGKILL)
+                deadline = time.monotonic() + 10
+                while observed["spawned"][0] in app._supervisor.worker_pids() or len(app._supervisor.worker_pids()) < 2:
+                    if time.monotonic() > deadline:
+                        break
+                    time.sleep(0.05)
+                observed["restarted"] = app._supervisor.worker_pids()
+            finally:
+                started = time.monotonic()
+                app.shutdown()
+                observed["shutdown_seconds"] = time.monotonic() - started
+
+        helper = threading.Thread(target=exercise)
+        helper.start()
+        app.start(workers=2)  # Supervises on this thread until the helper shuts it down
+        helper.join()
+
+        self.assertLess(observed["shutdown_seconds"], 10)  # Idle workers stop without waiting for the shutdown timeout
+        self.assertFalse(app.is_active())
+        self.assertEqual(len(observed["spawned"]), 2)
+        self.assertIn(observed["served_by"], observed["spawned"])
+        self.assertEqual(len(observed["restarted"]), 2)
+        self.assertNotIn(observed["spawned"][0], observed["restarted"])
+        self.assertIn(observed["spawned"][1], observed["restarted"])
+        self.assertEqual(app._supervisor.worker_pids(), [])
+        for pid in observed["spawned"] + observed["restarted"]:
+            with self.assertRaises(ChildProcessError):  # Every worker was reaped
+                os.waitpid(pid, os.WNOHANG)
+
+    def test_workers_are_forked_from_the_main_thread_only(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        app = Framework(folder.name, "/index.html", port=_free_port())
+        errors = []
+
+        def start():
+            try:
+                app.start(workers=1)
+            except AssertionError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=start)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(app._supervisor.worker_pids(), [])
+        self.assertFalse(app.is_active())
+
+
+class TimerWheelTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+
+    def test_expiry(self):
+        wheel = TimerWheel(tick=0.01, clock=lambda: self.now)
+        expired = []
+
+        wheel.schedule("connection", 0.05, lambda: expired.append("connection"))
+        self.assertEqual(len(wheel), 1)
+        self.now = 0.04
+        wheel.advance()
+        self.assertEqual(expired, [])
+        self.now = 0.051
+        wheel.advance()
+        self.assertEqual(expired, ["connection"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_reset_and_cancel(self):
+        wheel = TimerWheel(tick=0.01, slots=4, clock=lambda: self.now)
+        expired = []
+
+        wheel.schedule("reset", 0.1, lambda: expired.append("reset"))
+        wheel.schedule("cancelled", 0.1, lambda: expired.append("cancelled"))
+        wheel.reset("reset", 0.3, lambda: expired.append("reset"))
+        wheel.cancel("cancelled")
+
+        self.now = 0.15  # Several rounds of the 4 slots, the reset timeout waits for its deadline
+        wheel.advance()
+        self.assertEqual(expired, [])
+        self.assertIn("reset", wheel)
+        self.now = 0.31
+        wheel.advance()
+        self.assertEqual(expired, ["reset"])
+
+    def test_driven_by_a_thread(self):
+        wheel = TimerWheel(tick=0.01)
+        expired = threading.Event()
+
+        wheel.schedule("connection", 0.02, expired.set)
+        self.assertTrue(expired.wait(1))
+
+    def test_restartable_timer_is_deprecated(self):
+        with self.assertWarns(DeprecationWarning):
+            RestartableTimer(1, lambda: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    _shared = None
+
+    def __init__(self, tick: float = 0.25, slots: int = 512, clock=None):
+        """
+        A hashed timer wheel shared by many timeouts, driven by a single thread.
+        Scheduling, resetting and cancelling a timeout are O(1), expired timeouts are found by visiting one slot per tick.
+        :param tick: the resolution of the wheel in seconds
+        :param slots: the amount of slots in the wheel, timeouts longer than slots * tick wait for extra rounds
+        :param clock: a callable returning the current time in seconds. When given, the wheel starts no thread
+                      and whoever owns the clock drives it by calling advance
+        """
+        self._tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._timeouts = {}  # key: [deadline tick, slot, callback]
+        self._lock = threading.Lock()
+        self._clock = clock if clock is not None else time.monotonic
+        self._driven = clock is None
+        self._start_time = self._clock()
+        self._processed_tick = 0
+        self._thread = None
+
+    @staticmethod
+    def shared():
+        """
+        :return: a process wide wheel for clients created without one
+        """
+        if TimerWheel._shared is None:
+            TimerWheel._shared = TimerWheel()
+        return TimerWheel._shared
+
+    def schedule(self, key, timeout: float, callback):
+        """
+        Schedules callback to be called after timeout seconds, replacing the pending timeout of key if there is one.
+        """
+        deadline_tick = self._current_tick() + max(1, int(timeout / self._tick + 0.5))
+        slot = deadline_tick % len(self._slots)
+
+        with self._lock:
+            pending = self._timeouts.get(key, None)
+            if pending is not None:
+                self._slots[pending[1]].discard(key)
+            self._timeouts[key] = [deadline_tick, slot, callback]
+            self._slots[slot].add(key)
+
+            if self._driven and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="web_framework_v2-timer-wheel", daemon=True)
+                self._thread.start()
+
+    def reset(self, key, timeout: float, callback):
+        self.schedule(key, timeout, callback)
+
+    def cancel(self, key):
+        with self._lock:
+            pending = self._timeouts.pop(key, None)
+            if pending is not None:
+                self._slots[pending[1]].discard(key)
+
+    def __len__(self):
+        return len(self._timeouts)
+
+    def __contains__(self, key):
+        return key in self._timeouts
+
+    def _current_tick(self):
+        return int((self._clock() - self._start_time) / self._tick)
+
+    def _run(self):
+        while True:
+            time.sleep(self._tick)
+            self.advance()
+
+    def advance(self):
+        """
+        Calls the callbacks of the timeouts that expired up to the current time of the clock.
+        """
+        current_tick = self._current_tick()
+        while self._processed_tick < current_tick:
+            self._processed_tick += 1
+            for callback in self._expire(self._processed_tick):
+                try:
+                    callback()
+                except Exception as e:
+                    logger.exception(e)
+
+    def _expire(self, tick: int):
+        expired = []
+        with self._lock:
+            slot = self._slots[tick % len(self._slots)]
+            for key in list(slot):
+                deadline_tick, _, callback = self._timeouts[key]
+                if deadline_tick <= tick:
+                    slot.discard(key)
+                    del self._timeouts[key]
+                    expired.append(callback)
+
+        return expired
@@ -0,0 +1,78 @@
+import logging
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    """
+    The time a request spent in each phase of its handling, in seconds.
+    Phases are "read" (receiving the request from the socket, a connection served by its own thread or task
+    also counts the wait for the first bytes), "parse", "route" (the endpoint lookup),
+    "decorators", "handler", "encode" and "send", phases that did not happen are missing.
+    """
+    __slots__ = ("start", "phases")
+
+    def __init__(self, start: float = None):
+        """
+        :param start: the perf_counter time the server started reading the request (or parsing it when it was pipelined) at
+        """
+        self.start = start if start is not None else perf_counter()
+        self.phases = {}  # phase: seconds
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def since(self, phase: str, started: float) -> float:
+        """
+        Adds the time passed since the perf_counter time started to phase.
+        :return: the current perf_counter time, used to time the next phase
+        """
+        now = perf_counter()
+        self.add(phase, now - started)
+        return now
+
+    def total(self) -> float:
+        return perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """
+        :return: the value of a Server-Timing header holding the phases measured so far and the total, in milliseconds
+        """
+        metrics = [f"{phase};dur={seconds * 1000:.3f}" for phase, seconds in self.phases.items()]
+        metrics.append(f"total;dur={self.total() * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+class TimingHooks:
+    def __init__(self, server_timing: bool = False):
+        """
+        Decides whether requests are timed and hands the timings to the registered hooks once the response was sent.
+        Requests are only timed while server_timing is set or a hook is registered.
+        :param server_timing: send the timings of the phases before the response as a Server-Timing header
+        """
+        self.server_timing = server_timing
+        self._hooks = []
+
+    def enabled(self) -> bool:
+        return self.server_timing or len(self._hooks) > 0
+
+    def add(self, hook):
+        """
+        :param hook: callable(request, response, RequestTiming), called on the thread (or loop) that served the request
+        """
+        self._hooks = self._hooks + [hook]  # Replaced instead of mutated so reporting never sees a changing list
+
+    def remove(self, hook):
+        self._hooks = [registered for registered in self._hooks if registered is not hook]
+
+    def before_send(self, response, timing: RequestTiming):
+        if self.server_timing:
+            response.headers["Server-Timing"] = timing.server_timing()
+
+    def report(self, request, response, timing: RequestTiming):
+        for hook in self._hooks:
+            try:
+                hook(request, response, timing)
+            except Exception as e:
+                logger.exception(e)
@@ -0,0 +1,260 @@
+import logging
+import queue
+import selectors
+import socket
+import threading
+from time import perf_counter
+
+from web_framework_v2.http import ContentType, HttpError, HttpStatus
+from web_framework_v2.http_client import HttpClient
+from web_framework_v2.http_server import HttpServer
+from web_framework_v2.timing import RequestTiming
+
+logger = logging.getLogger(__name__)
+
+_PARK = "park"
+_EXPIRE = "expire"
+
+
+class WorkerPoolHttpServer(HttpServer):
+    def __init__(self, framework, host, port, backlog: int = 128, worker_threads: int = 16, queue_size: int = 64, retry_after: int = 1):
+        """
+        Serves requests using a fixed pool of worker threads fed from a bounded queue.
+        Idle connections are parked in a selector watched by a single poller thread, which reads and parses their requests
+        and only queues complete ones, so idle keep alive clients do not hold workers.
+        A worker serves the queued request and the requests pipelined behind it, then parks the connection again.
+        When the queue is full the request is answered with 503 Service Unavailable and its connection is closed.
+        :param worker_threads: the amount of threads serving requests
+        :param queue_size: the amount of parsed requests allowed to wait for a free worker
+        :param retry_after: the value of the Retry-After header sent with the 503 response, in seconds
+        """
+        super().__init__(framework, host, port, backlog)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"web_framework_v2-worker-{i}", daemon=True) for i in range(worker_threads)
+        ]
+        self._selector = None
+        self._commands = queue.SimpleQueue()  # (_PARK or _EXPIRE, client) executed by the poller, which owns the selector
+        self._wakeup_reader = self._wakeup_writer = None
+        self._poller = threading.Thread(target=self._poll, name="web_framework_v2-poller", daemon=True)
+        self._stopping = False
+        self._poll_interval = 0.5
+        self._overload_response = (
+            f"HTTP/1.1 {HttpStatus.SERVICE_UNAVAILABLE.value} {HttpStatus.SERVICE_UNAVAILABLE.name}\r\n"
+            f"{ContentType.text}\r\n"
+            f"Retry-After: {retry_after}\r\n"
+            f"Connection: close\r\n"
+            f"Content-Length: 0\r\n\r\n"
+        ).encode()
+        self.rejected_connections = 0
+
+    def start(self, listen_socket: socket.socket = None):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        self._poller.start()
+        for worker in self._workers:
+            worker.start()
+        super().start(listen_socket)
+
+    def _dispatch(self, client_socket, address):
+        self._park(self._create_client(client_socket, address))
+
+    def _park(self, client: HttpClient):
+        """
+        Hands an idle connection to the poller, its next request is queued once it was received.
+        """
+        if self._stopping:
+            return client.close()
+
+        client.timer_wheel.reset(client, client.current_timeout(), lambda: self._command(_EXPIRE, client))
+        self._command(_PARK, client)
+
+    def _command(self, command: str, client: HttpClient):
+        self._commands.put((command, client))
+        self._wake_poller()
+
+    def _wake_poller(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (OSError, AttributeError):
+            pass  # Shut down or never started
+
+    def _poll(self):
+        while not self._stopping:
+            for key, _ in self._selector.select(self._poll_interval):
+                if key.fileobj is self._wakeup_reader:
+                    self._run_commands()
+                else:
+                    self._selector.unregister(key.fileobj)
+                    self._receive(key.data)
+
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                key.data.close()
+        self._selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    def _run_commands(self):
+        try:
+            while len(self._wakeup_reader.recv(4096)) > 0:
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            try:
+                command, client = self._commands.get_nowait()
+            except queue.Empty:
+                return
+
+            if command == _PARK:
+                if not client.is_closed:
+                    self._selector.register(client.socket, selectors.EVENT_READ, client)
+            elif client.socket in self._selector.get_map():  # Expired while idle, in flight connections are left alone
+                self._selector.unregister(client.socket)
+                logger.debug("Connection with %s timed out", client.address)
+                client.close()
+
+    def _receive(self, client: HttpClient):
+        """
+        Reads from a connection the selector reported as readable and queues its request once it is complete.
+        """
+        client.timer_wheel.cancel(client)
+        timing_hooks = client.timing_hooks
+        if client.timing is None and timing_hooks is not None and timing_hooks.enabled():
+            client.timing = RequestTiming()
+        try:
+            started = perf_counter() if client.timing is not None else 0
+            received = client.request_reader.recv_into(client.socket)
+            if received == 0:  # received FIN
+                return client.close()
+            if client.metrics is not None:
+                client.metrics.received_bytes.inc(amount=received)
+            if client.timing is not None:
+                started = client.timing.since("read", started)
+
+            request = client.request_reader.next_request()
+            if client.timing is not None:
+                client.timing.since("parse", started)
+        except OSError:
+            return client.close()
+        except (HttpError, ValueError) as e:
+            return self._reject_request(client, e)
+
+        if request is None and not client.request_reader.is_reading_body():
+            return self._park(client)  # Wait for the rest of the request head
+
+        try:  # Bodies still being received are read by the worker, the poller only reads request heads
+            self._queue.put_nowait((client, request))
+        except queue.Full:
+            self.rejected_connections += 1
+            if client.metrics is not None:
+                client.metrics.rejected_connections.inc()
+            logger.debug("Worker queue is full, shedding connection from %s", client.address)
+            self._reject(client)
+
+    def _reject(self, client: HttpClient):
+        try:
+            client.send(self._overload_response)
+        except OSError:
+            pass
+        client.close()
+
+    @staticmethod
+    def _reject_request(client: HttpClient, error: Exception):
+        if isinstance(error, HttpError):
+            logger.debug("Rejecting request from %s: %s", client.address, error)
+            try:
+                client.send(HttpClient.error_response(error.status))
+            except OSError:
+                pass
+        else:
+            logger.debug("Received a malformed request from %s: %s", client.address, error)
+        client.close()
+
+    def _worker(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._poll_interval)
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+            if item is None:
+                return
+
+            client, request = item
+            try:
+                self._serve_requests(client, request)
+            except Exception as e:
+                logger.exception(e)
+                client.close()
+
+    def _serve_requests(self, client: HttpClient, request):
+        """
+        Serves a queued request and the complete requests pipelined behind it, then parks the connection.
+        :param request: None when the head of the request was parsed but its body still has to be received
+        """
+        if request is None:
+            request = self._receive_body(client)
+            if request is None:
+                return client.close()
+
+        while request is not None:
+            timing, client.timing = client.timing, None
+            if not client.serve(request, timing):
+                return
+
+            if client.timing_hooks is not None and client.timing_hooks.enabled() and client.request_reader.has_buffered_data():
+                client.timing = RequestTiming()  # Every pipelined request gets its own timing
+            started = perf_counter() if client.timing is not None else 0
+            try:
+                request = client.request_reader.next_request()
+            except (HttpError, ValueError) as e:
+                return self._reject_request(client, e)
+            if client.timing is not None:
+                client.timing.since("parse", started)
+
+        self._park(client)
+
+    @staticmethod
+    def _receive_body(client: HttpClient):
+        """
+        :return: the request once its body was received, None when the connection failed or timed out
+        """
+        request = None
+        try:
+            while request is None:
+                started = perf_counter() if client.timing is not None else 0
+                client.timer_wheel.reset(client, client.body_read_timeout, client.on_timeout)
+                try:
+                    received = client.request_reader.recv_into(client.socket)
+                finally:
+                    client.timer_wheel.cancel(client)
+                if received == 0:
+                    return None
+                if client.metrics is not None:
+                    client.metrics.received_bytes.inc(amount=received)
+                if client.timing is not None:
+                    started = client.timing.since("read", started)
+
+                request = client.request_reader.next_request()
+                if client.timing is not None:
+                    client.timing.since("parse", started)
+        except (OSError, HttpError, ValueError) as e:
+            logger.debug("Failed to receive the body from %s: %s", client.address, e)
+            return None
+        return request
+
+    def shutdown(self):
+        self._stopping = True
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break  # Workers notice _stopping once the queued requests were served
+        self._wake_poller()
+        super().shutdown()